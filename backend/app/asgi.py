@@ -5,12 +5,16 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
+
+默认使用 app.settings_asgi，读接口由 app.urls_asgi 中的异步视图处理，例如：
+    gunicorn app.asgi:application -k uvicorn.workers.UvicornWorker
+其他 settings 模块需要同样设置 ROOT_URLCONF = "app.urls_asgi"。
 """
 
 import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings_asgi")
 
 application = get_asgi_application()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+批量接口：在一次 HTTP 请求中执行多个子请求
+
+子请求按路径路由到现有的视图，沿用批量请求已验证的用户，不再重复校验 jwt 与查询用户。
+相邻的 GET 子请求在线程池中并发执行；atomic 模式下全部子请求在同一事务中顺序执行，
+任一子请求失败则整体回滚。
+"""
+
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections, transaction
+from django.urls import Resolver404, resolve
+
+from utils.response_cache import get_response_cache
+from utils.sse import EventStreamResponse
+
+BATCH_PATH = "/api/v1/batch"
+METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+# atomic 模式下前面的子请求失败后，后续子请求不再执行
+STATUS_SKIPPED = 424
+# 子请求在线程中同步执行，ASGI 部署的 app.urls_asgi 中读接口是异步视图，因此总是使用同步视图的路由
+URLCONF = "app.urls"
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_batch_settings():
+    options = {"MAX_REQUESTS": 20, "WORKERS": 4}
+    options.update(getattr(settings, "BATCH", {}))
+    return options
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_batch_settings()["WORKERS"], thread_name_prefix="batch"
+                )
+    return _executor
+
+
+def check_items(items):
+    """
+    检查子请求格式：{"method": "GET", "path": "/api/v1/...", "body": {}, "headers": {}}
+    """
+    if not isinstance(items, list) or not items:
+        return False
+    for item in items:
+        if not isinstance(item, dict):
+            return False
+        if item.get("method", "GET") not in METHODS or not isinstance(item.get("path"), str):
+            return False
+        if not isinstance(item.get("headers", {}), dict):
+            return False
+    return True
+
+
+def build_request(request, item):
+    """
+    由批量请求的 WSGI 环境构造子请求
+    """
+    url = urlsplit(item["path"])
+    body = json.dumps(item["body"]).encode() if "body" in item else b""
+    environ = {
+        key: value
+        for key, value in request.META.items()
+        if not key.startswith("HTTP_IF_") and key not in ("CONTENT_TYPE", "CONTENT_LENGTH")
+    }
+    environ.update(
+        {
+            "REQUEST_METHOD": item.get("method", "GET"),
+            "PATH_INFO": url.path,
+            "QUERY_STRING": url.query,
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.input": io.BytesIO(body),
+        }
+    )
+    for name, value in item.get("headers", {}).items():
+        environ["HTTP_" + name.upper().replace("-", "_")] = str(value)
+
+    sub_request = WSGIRequest(environ)
+    # jwt_authentication 直接使用已验证的用户
+    sub_request.authenticated_user = request.user
+    sub_request.jwt_payload = getattr(request, "jwt_payload", None)
+    return sub_request
+
+
+def response_body(response):
+    data = getattr(response, "data", None)
+    if data is not None:
+        return data
+    content = response.content
+    if not content:
+        return None
+    try:
+        return json.loads(content)
+    except ValueError:
+        return content.decode()
+
+
+def execute(request, item):
+    """
+    执行单个子请求
+    :return: (状态码, 响应数据, 响应头)
+    """
+    path = urlsplit(item["path"]).path
+    if not path.startswith("/api/v1/") or path.rstrip("/") == BATCH_PATH:
+        return 404, {"message": "not found"}, {}
+    try:
+        match = resolve(path, URLCONF)
+    except Resolver404:
+        return 404, {"message": "not found"}, {}
+
+    try:
+        response = match.func(build_request(request, item), *match.args, **match.kwargs)
+    except Exception as e:
+        print(e)
+        return 500, {"message": "internal error"}, {}
+    if response.streaming:
+        # 事件流在 EVENTS["MAX_DURATION"] 秒后才结束，流式响应不能合并到批量响应中
+        # 不调用 response.close()，它发送 request_finished，会关闭批量请求仍在使用的数据库连接
+        if isinstance(response, EventStreamResponse):
+            response.release()
+        return 400, {"message": "streaming responses are not supported in batch"}, {}
+    headers = {"ETag": response["ETag"]} if response.has_header("ETag") else {}
+    return response.status_code, response_body(response), headers
+
+
+def _execute_in_thread(request, item):
+    close_old_connections()
+    try:
+        return execute(request, item)
+    finally:
+        close_old_connections()
+
+
+def run_batch(request, items, atomic=False):
+    """
+    执行全部子请求，结果顺序与子请求顺序一致
+    写请求按顺序执行；写请求之间相邻的 GET 请求并发执行
+    """
+    if atomic:
+        return _run_atomic(request, items)
+
+    results = []
+    reads = []
+
+    def flush():
+        if len(reads) > 1 and get_batch_settings()["WORKERS"] > 1:
+            futures = [get_executor().submit(_execute_in_thread, request, i) for i in reads]
+            results.extend(future.result() for future in futures)
+        else:
+            results.extend(execute(request, i) for i in reads)
+        reads.clear()
+
+    for item in items:
+        if item.get("method", "GET") == "GET":
+            reads.append(item)
+        else:
+            flush()
+            results.append(execute(request, item))
+    flush()
+    return results
+
+
+def _run_atomic(request, items):
+    """
+    写子请求已经递增了响应缓存的版本号，其后的读子请求在事务中读到未提交的数据并缓存到新版本下；
+    回滚时提交后的递增不会执行，因此再递增一次，使这些条目失效
+    """
+    results = []
+    try:
+        with transaction.atomic():
+            for item in items:
+                if results and results[-1][0] >= 400:
+                    results.append((STATUS_SKIPPED, {"message": "skipped"}, {}))
+                    continue
+                results.append(execute(request, item))
+            if results[-1][0] >= 400:
+                transaction.set_rollback(True)
+    except Exception:
+        get_response_cache().bump_version()
+        raise
+    if results[-1][0] >= 400:
+        get_response_cache().bump_version()
+    return results
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from post.controllers import reply_path
+from post.models import Post, Reply
+
+
+class Command(BaseCommand):
+    help = "Compute the materialized path and depth of every reply"
+
+    def handle(self, *args, **options):
+        total = 0
+        for post_id in Post.objects.values_list("id", flat=True).iterator():
+            # 被回复的回帖 id 总是小于回复它的回帖，按 id 顺序处理即可先得到父节点的路径
+            nodes = {}
+            replies = list(
+                Reply.objects.filter(post_id=post_id).only("id", "reply_id").order_by("id")
+            )
+            for reply in replies:
+                reply.path, reply.depth = reply_path(reply.id, nodes.get(reply.reply_id))
+                nodes[reply.id] = (reply.path, reply.depth)
+            with transaction.atomic():
+                Reply.objects.bulk_update(replies, ["path", "depth"], batch_size=500)
+            total += len(replies)
+        self.stdout.write(f"Backfilled paths of {total} replies")
@@ -0,0 +1,165 @@
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from post import controllers
+from post.models import Post
+from user.models import User
+from utils.jwt import generate_jwt
+
+# (settings 模块, gunicorn 参数)
+SERVERS = {
+    "wsgi": ("app.settings", ["app.wsgi:application"]),
+    "asgi": ("app.settings_asgi", ["app.asgi:application", "-k", "uvicorn.workers.UvicornWorker"]),
+}
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = "Compare read endpoint throughput and tail latency of the WSGI and ASGI deployments"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="gunicorn workers per server")
+        parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+        parser.add_argument("--duration", type=float, default=10, help="Seconds per server")
+        parser.add_argument("--posts", type=int, default=200, help="Posts seeded for the run")
+        parser.add_argument(
+            "--servers", nargs="+", choices=sorted(SERVERS), default=["wsgi", "asgi"]
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.create(
+            username="benchasgi",
+            password="x",
+            nickname="benchasgi",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        try:
+            post_ids = [
+                controllers.create_post(f"title {i}", "content " * 20, user.id)[0]
+                for i in range(options["posts"])
+            ]
+            for post_id in post_ids[:20]:
+                for i in range(10):
+                    controllers.create_reply(f"reply {i}", user.id, post_id)
+            token = generate_jwt({"user_id": user.id, "nickname": user.nickname})
+            paths = self.request_paths(user.id, post_ids)
+            for name in options["servers"]:
+                self.run_server(name, paths, token, options)
+        finally:
+            Post.objects.filter(user_id=user.id).delete()
+            user.delete()
+            # 批量删除不维护帖子计数器
+            call_command("recount_posts", stdout=self.stdout)
+
+    @staticmethod
+    def request_paths(user_id, post_ids):
+        """
+        帖子列表、帖子详情与用户信息的混合请求
+        """
+        paths = [f"/api/v1/post?page={page}&size=10" for page in range(1, 11)]
+        paths += [f"/api/v1/post?cursor=&size=20&userId={user_id}"]
+        paths += [f"/api/v1/post/{post_id}" for post_id in post_ids[:50]]
+        paths += ["/api/v1/user", f"/api/v1/user/{user_id}"]
+        return paths
+
+    def run_server(self, name, paths, token, options):
+        port = free_port()
+        settings_module, server_args = SERVERS[name]
+        command = [sys.executable, "-m", "gunicorn", *server_args]
+        command += [
+            "-b",
+            f"127.0.0.1:{port}",
+            "-w",
+            str(options["workers"]),
+            "--log-level",
+            "error",
+        ]
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+        server = subprocess.Popen(command, env=env)
+        try:
+            base = f"http://127.0.0.1:{port}"
+            self.wait_ready(base, server)
+            latencies, statuses = self.load(base, paths, token, options)
+        finally:
+            server.terminate()
+            server.wait()
+
+        elapsed = options["duration"]
+        self.stdout.write(
+            f"{name}: {len(latencies) / elapsed:.0f} req/s, "
+            f"p50 {percentile(latencies, 0.5):.1f}ms, p99 {percentile(latencies, 0.99):.1f}ms, "
+            f"mean {statistics.mean(latencies):.1f}ms, statuses {dict(statuses)}"
+        )
+
+    @staticmethod
+    def wait_ready(base, server, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError("server exited during startup")
+            try:
+                urllib.request.urlopen(base + "/api/v1/post", timeout=1)
+            except urllib.error.HTTPError:
+                return
+            except OSError:
+                time.sleep(0.2)
+                continue
+            return
+        raise CommandError("server did not start in time")
+
+    @staticmethod
+    def load(base, paths, token, options):
+        latencies = []
+        statuses = Counter()
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["duration"]
+
+        def client(seed):
+            rand = random.Random(seed)
+            samples = []
+            codes = Counter()
+            while time.monotonic() < deadline:
+                request = urllib.request.Request(
+                    base + rand.choice(paths), headers={"Authorization": token}
+                )
+                start = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request, timeout=30) as response:
+                        json.loads(response.read())
+                        codes[response.status] += 1
+                except urllib.error.HTTPError as e:
+                    codes[e.code] += 1
+                samples.append((time.perf_counter() - start) * 1000)
+            with lock:
+                latencies.extend(samples)
+                statuses.update(codes)
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            list(executor.map(client, range(options["concurrency"])))
+        return latencies, statuses
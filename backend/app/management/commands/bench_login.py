@@ -0,0 +1,113 @@
+import logging
+import statistics
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from user.models import User
+from utils.jwt import encrypt_password
+
+PASSWORD = "Benchmark1*"
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark legitimate login latency under a credential-stuffing mix"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20, help="Legitimate logins")
+        parser.add_argument("--attackers", type=int, default=16, help="Attacking threads")
+        parser.add_argument("--attack-ips", type=int, default=2, help="Addresses used by attackers")
+        parser.add_argument(
+            "--attack-interval",
+            type=float,
+            default=0.01,
+            help="Seconds each attacking thread waits between requests",
+        )
+        parser.add_argument(
+            "--warmup", type=float, default=10, help="Seconds of attack before measuring"
+        )
+
+    def handle(self, *args, **options):
+        # 每个失败的登录都会记录一条 401 警告
+        logging.getLogger("django.request").setLevel(logging.ERROR)
+        usernames = [f"bench{i}" for i in range(options["users"])]
+        User.objects.filter(username__in=usernames).delete()
+        User.objects.bulk_create(
+            [
+                User(
+                    username=username,
+                    password=encrypt_password(PASSWORD),
+                    nickname=username,
+                    mobile="+86.123456789012",
+                    magic_number=0,
+                    url="https://baidu.com",
+                )
+                for username in usernames
+            ]
+        )
+        try:
+            for enabled in (False, True):
+                with override_settings(LOGIN_THROTTLE={"ENABLED": enabled}):
+                    self.run_phase("throttle on" if enabled else "throttle off", usernames, options)
+        finally:
+            User.objects.filter(username__in=usernames).delete()
+
+    def run_phase(self, name, usernames, options):
+        stop = threading.Event()
+        attack_statuses = Counter()
+        lock = threading.Lock()
+
+        def attack(index):
+            client = Client(REMOTE_ADDR=f"10.66.0.{index % options['attack_ips']}")
+            attempt = 0
+            while not stop.is_set():
+                response = client.patch(
+                    reverse("login"),
+                    {"username": f"victim{index}x{attempt}", "password": "guess"},
+                    "application/json",
+                )
+                attempt += 1
+                with lock:
+                    attack_statuses[response.status_code] += 1
+                stop.wait(options["attack_interval"])
+            connections.close_all()
+
+        threads = [threading.Thread(target=attack, args=(i,)) for i in range(options["attackers"])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options["warmup"])
+
+        latencies = []
+        statuses = Counter()
+        try:
+            for i, username in enumerate(usernames):
+                client = Client(REMOTE_ADDR=f"10.77.{i // 250}.{i % 250}")
+                start = time.perf_counter()
+                response = client.patch(
+                    reverse("login"),
+                    {"username": username, "password": PASSWORD},
+                    "application/json",
+                )
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[response.status_code] += 1
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(
+            f"{name}: legitimate logins {dict(statuses)}, "
+            f"p50 {percentile(latencies, 0.5):.0f}ms, p99 {percentile(latencies, 0.99):.0f}ms, "
+            f"mean {statistics.mean(latencies):.0f}ms; attack responses {dict(attack_statuses)}"
+        )
@@ -0,0 +1,108 @@
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+
+from post.models import Counter, Post
+from utils.db import add_database, remove_database
+from utils.pool import connections_opened, pool_wait_seconds
+
+OPTIONS = settings.DATABASES[DEFAULT_DB_ALIAS]["OPTIONS"]
+
+# (OPTIONS, 其他连接配置)
+PROFILES = {
+    # 每个请求建立并关闭连接
+    "per-request": (
+        {k: v for k, v in OPTIONS.items() if k != "pool"},
+        {"CONN_MAX_AGE": 0},
+    ),
+    # 每个线程一个持久连接，请求开始时检查连接是否可用
+    "persistent": (
+        {k: v for k, v in OPTIONS.items() if k != "pool"},
+        {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": True},
+    ),
+    # settings.DATABASES 中的配置：请求结束时归还连接池
+    "pooled": (OPTIONS, {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": True}),
+}
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Compare connection-per-request, persistent and pooled database connections"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4, help="Request threads")
+        parser.add_argument("--duration", type=float, default=5, help="Seconds per profile")
+        parser.add_argument("--profiles", nargs="+", choices=list(PROFILES), default=list(PROFILES))
+
+    def handle(self, *args, **options):
+        for name in options["profiles"]:
+            self.run_profile(name, options)
+
+    def run_profile(self, name, options):
+        alias = "bench_" + name.replace("-", "_")
+        database_options, extra = PROFILES[name]
+        add_database(
+            alias,
+            settings.DATABASES[DEFAULT_DB_ALIAS]["ENGINE"],
+            settings.DATABASES[DEFAULT_DB_ALIAS]["NAME"],
+            database_options,
+            **extra,
+        )
+        opened = connections_opened.get(alias=alias)
+        try:
+            latencies = self.load(alias, options)
+        finally:
+            remove_database(alias)
+
+        wait_count, wait_total, wait_max = pool_wait_seconds.get(alias=alias)
+        pool = ""
+        if wait_count:
+            pool = (
+                f", pool wait mean {wait_total / wait_count * 1e6:.0f}us max {wait_max * 1e3:.1f}ms"
+            )
+        self.stdout.write(
+            f"{name}: {len(latencies) / options['duration']:.0f} req/s, "
+            f"p50 {percentile(latencies, 0.5):.3f}ms, p99 {percentile(latencies, 0.99):.3f}ms, "
+            f"mean {statistics.mean(latencies):.3f}ms, "
+            f"connections opened {connections_opened.get(alias=alias) - opened}{pool}"
+        )
+
+    @staticmethod
+    def load(alias, options):
+        """
+        每个请求执行帖子列表的两次查询，请求结束时与 Django 一样调用 close_old_connections
+        """
+        latencies = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["duration"]
+
+        def client():
+            samples = []
+            try:
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    close_old_connections()
+                    list(Post.objects.using(alias).values_list("id", flat=True)[:10])
+                    Counter.objects.using(alias).filter(key="post").first()
+                    close_old_connections()
+                    samples.append((time.perf_counter() - start) * 1000)
+            finally:
+                # 持久连接在线程结束前关闭
+                connections[alias].close()
+            with lock:
+                latencies.extend(samples)
+
+        threads = [threading.Thread(target=client) for _ in range(options["threads"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies
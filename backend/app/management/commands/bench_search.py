@@ -0,0 +1,123 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from search.backends import BLOCK_SIZE, Fts5Backend, TableBackend, fts5_available
+from search.postings import encode_postings
+from search.tokenizer import tokenize, tokenize_query
+
+WORDS = (
+    "软件 工程 课程 作业 论坛 帖子 回复 清华 大学 学生 老师 助教 问题 答案 代码 测试 部署 "
+    "数据库 索引 查询 缓存 性能 前端 后端 接口 服务器 用户 登录 注册 密码 搜索 排序 分页 "
+    "今天 明天 截止 提交 评分 报告 实验 环境 配置 错误 修复 文档 讨论 建议 谢谢"
+).split()
+LATIN_WORDS = "django python sqlite react api json http bug commit merge".split()
+
+
+def make_corpus(count, seed):
+    """
+    生成中文为主、夹杂英文单词的帖子，结果只取决于 seed
+    """
+    rng = random.Random(seed)
+
+    def sentence(length):
+        return "".join(
+            rng.choice(LATIN_WORDS) if rng.random() < 0.1 else rng.choice(WORDS)
+            for _ in range(length)
+        )
+
+    return [(sentence(rng.randint(2, 6)), sentence(rng.randint(20, 120))) for _ in range(count)]
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark search index build throughput and query latency on a seeded corpus"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--documents", type=int, default=2000, help="Corpus size")
+        parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+        parser.add_argument("--seed", type=int, default=2023, help="Random seed of the corpus")
+        parser.add_argument(
+            "--backend",
+            choices=["fts5", "table", "all"],
+            default="all",
+            help="Index backend to benchmark",
+        )
+
+    def handle(self, *args, **options):
+        corpus = make_corpus(options["documents"], options["seed"])
+        rng = random.Random(options["seed"] + 1)
+        queries = [
+            " ".join(rng.sample(WORDS + LATIN_WORDS, rng.randint(1, 2)))
+            for _ in range(options["queries"])
+        ]
+
+        start = time.perf_counter()
+        tokenized = [(tokenize(title), tokenize(body)) for title, body in corpus]
+        elapsed = time.perf_counter() - start
+        tokens = sum(len(title) + len(body) for title, body in tokenized)
+        self.stdout.write(
+            f"tokenize: {len(corpus)} documents, {tokens} tokens in {elapsed:.3f}s "
+            f"({tokens / elapsed:,.0f} tokens/s)"
+        )
+        self.report_postings(tokenized)
+
+        backends = []
+        if options["backend"] in ("fts5", "all") and fts5_available():
+            backends.append(Fts5Backend())
+        if options["backend"] in ("table", "all"):
+            backends.append(TableBackend())
+        for backend in backends:
+            # 在事务中写入并在结束时回滚，不影响现有的索引
+            with transaction.atomic():
+                backend.clear()
+                self.bench_backend(backend, tokenized, queries)
+                transaction.set_rollback(True)
+
+    def report_postings(self, tokenized):
+        """
+        对比文档 id 倒排表以 8 字节整数存储
+        与 table 后端 SearchTermBlock 的分块差分 varint 编码的大小
+        """
+        postings = {}
+        for document_id, (title, body) in enumerate(tokenized, 1):
+            for term in set(title) | set(body):
+                postings.setdefault((term, document_id // BLOCK_SIZE), []).append(document_id)
+        raw = sum(len(ids) * 8 for ids in postings.values())
+        encoded = sum(
+            len(encode_postings(d - block * BLOCK_SIZE for d in ids))
+            for (_, block), ids in postings.items()
+        )
+        self.stdout.write(
+            f"postings: {len({term for term, _ in postings})} terms, {raw:,} bytes raw, "
+            f"{encoded:,} bytes encoded ({encoded / raw:.1%})"
+        )
+
+    def bench_backend(self, backend, tokenized, queries):
+        start = time.perf_counter()
+        for key, (title, body) in enumerate(tokenized, 1):
+            backend.index(key * 2, title, body)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{backend.name} build: {len(tokenized)} documents in {elapsed:.3f}s "
+            f"({len(tokenized) / elapsed:,.0f} documents/s)"
+        )
+
+        latencies = []
+        hits = 0
+        for query in queries:
+            start = time.perf_counter()
+            hits += len(backend.search(tokenize_query(query), 10))
+            latencies.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f"{backend.name} query: {len(queries)} queries, {hits} hits, "
+            f"mean {statistics.mean(latencies):.2f}ms, p50 {percentile(latencies, 0.5):.2f}ms, "
+            f"p95 {percentile(latencies, 0.95):.2f}ms, p99 {percentile(latencies, 0.99):.2f}ms"
+        )
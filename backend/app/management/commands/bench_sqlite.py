@@ -0,0 +1,185 @@
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from post.models import Post, Reply
+from user.models import User
+from utils.db import add_database, remove_database
+
+# (数据库后端, 写连接 OPTIONS, 读连接 OPTIONS)
+PROFILES = {
+    # Django 自带的后端：回滚日志，DEFERRED 事务，读写使用同样的连接
+    "stock": ("django.db.backends.sqlite3", {}, {}),
+    # settings.DATABASES 中的配置：WAL，BEGIN IMMEDIATE，读请求使用只读连接
+    "tuned": (
+        "utils.sqlite",
+        settings.DATABASES[DEFAULT_DB_ALIAS]["OPTIONS"],
+        settings.DATABASES["read"]["OPTIONS"],
+    ),
+}
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Compare concurrent SQLite reads and writes with the stock and tuned connection setup"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=4, help="Threads creating replies")
+        parser.add_argument("--readers", type=int, default=8, help="Threads reading posts")
+        parser.add_argument("--duration", type=float, default=5, help="Seconds per profile")
+        parser.add_argument("--posts", type=int, default=200, help="Posts seeded for the run")
+        parser.add_argument("--replies", type=int, default=20, help="Replies seeded per post")
+        parser.add_argument(
+            "--profiles", nargs="+", choices=sorted(PROFILES), default=["stock", "tuned"]
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            for name in options["profiles"]:
+                self.run_profile(name, os.path.join(directory, f"{name}.sqlite3"), options)
+
+    def run_profile(self, name, path, options):
+        engine, write_options, read_options = PROFILES[name]
+        alias, read_alias = f"bench_{name}", f"bench_{name}_read"
+        add_database(alias, engine, path, write_options)
+        add_database(read_alias, engine, path, read_options)
+        try:
+            call_command("migrate", database=alias, verbosity=0)
+            post_ids = self.seed(alias, options)
+            connections[alias].close()
+            results = self.load(alias, read_alias, post_ids, options)
+        finally:
+            remove_database(alias)
+            remove_database(read_alias)
+
+        elapsed = options["duration"]
+        for kind in ("write", "read"):
+            latencies, errors = results[kind]
+            self.stdout.write(
+                f"{name} {kind}: {len(latencies) / elapsed:.0f} op/s, "
+                f"p50 {percentile(latencies, 0.5):.1f}ms, "
+                f"p99 {percentile(latencies, 0.99):.1f}ms, "
+                f"max {max(latencies, default=0):.1f}ms, "
+                f"mean {statistics.mean(latencies) if latencies else 0:.1f}ms, "
+                f"errors {errors}"
+            )
+
+    @staticmethod
+    def seed(alias, options):
+        user = User.objects.using(alias).create(
+            username="benchsqlite",
+            password="x",
+            nickname="benchsqlite",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        now = timezone.now()
+        posts = Post.objects.using(alias).bulk_create(
+            Post(
+                user=user,
+                nickname=user.nickname,
+                title=f"title {i}",
+                content="content " * 20,
+                last_replied_user=user,
+                last_replied_time=now,
+            )
+            for i in range(options["posts"])
+        )
+        Reply.objects.using(alias).bulk_create(
+            Reply(user=user, nickname=user.nickname, post=post, content=f"reply {i}")
+            for post in posts
+            for i in range(options["replies"])
+        )
+        return [post.id for post in posts]
+
+    @staticmethod
+    def load(alias, read_alias, post_ids, options):
+        results = {"write": ([], 0), "read": ([], 0)}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["duration"]
+        user_id = User.objects.using(alias).values_list("id", flat=True).get()
+        connections[alias].close()
+
+        def write(rand):
+            """
+            与 create_reply 相同的先读后写的事务
+            """
+            post_id = rand.choice(post_ids)
+            now = timezone.now()
+            with transaction.atomic(using=alias):
+                replies = Reply.objects.using(alias).filter(post_id=post_id)
+                replies.values_list("path", "depth").order_by("-id").first()
+                Reply.objects.using(alias).create(
+                    user_id=user_id,
+                    nickname="benchsqlite",
+                    post_id=post_id,
+                    content="reply",
+                    created=now,
+                    updated=now,
+                )
+                Post.objects.using(alias).filter(id=post_id).update(
+                    last_replied_time=now, reply_count=F("reply_count") + 1
+                )
+
+        def read(rand):
+            """
+            帖子列表与帖子详情
+            """
+            posts = Post.objects.using(read_alias).order_by("-last_replied_time", "-id")
+            list(posts.values("id", "title", "nickname", "reply_count")[:20])
+            post_id = rand.choice(post_ids)
+            list(Post.objects.using(read_alias).filter(id=post_id).values())
+            replies = Reply.objects.using(read_alias).filter(post_id=post_id)
+            list(replies.order_by("created", "id").values()[:50])
+
+        def client(kind, operation, seed):
+            rand = random.Random(seed)
+            samples = []
+            errors = 0
+            try:
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        operation(rand)
+                    except OperationalError:
+                        # database is locked
+                        errors += 1
+                        continue
+                    samples.append((time.perf_counter() - start) * 1000)
+            finally:
+                connections.close_all()
+            with lock:
+                latencies, total = results[kind]
+                latencies.extend(samples)
+                results[kind] = (latencies, total + errors)
+
+        threads = [
+            threading.Thread(target=client, args=("write", write, i))
+            for i in range(options["writers"])
+        ]
+        threads += [
+            threading.Thread(target=client, args=("read", read, i))
+            for i in range(options["readers"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
@@ -0,0 +1,55 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from utils.password import get_scrypt_params, scrypt_hash
+
+
+class Command(BaseCommand):
+    help = "Benchmark scrypt on this host and suggest PASSWORD_SCRYPT for a target latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target-ms", type=float, default=100, help="Target hashing time in milliseconds"
+        )
+        parser.add_argument(
+            "--max-memory-mb", type=int, default=64, help="Upper bound of memory per hash (MiB)"
+        )
+        parser.add_argument("-r", type=int, default=8, help="scrypt block size")
+        parser.add_argument("-p", type=int, default=1, help="scrypt parallelization")
+        parser.add_argument("--rounds", type=int, default=3, help="Hashes timed per cost")
+
+    def measure(self, n, r, p, rounds):
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            scrypt_hash("calibration", "calibration-salt", n, r, p)
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
+
+    def handle(self, *args, **options):
+        r, p = options["r"], options["p"]
+        target = options["target_ms"]
+        self.stdout.write("Current parameters: N={}, r={}, p={}".format(*get_scrypt_params()))
+
+        best = None
+        n = 2**10
+        # scrypt 的内存占用为 128 * r * N 字节，耗时与 N 近似线性
+        while 128 * r * n <= options["max_memory_mb"] * 1024 * 1024:
+            elapsed = self.measure(n, r, p, options["rounds"])
+            memory = 128 * r * n / 1024 / 1024
+            self.stdout.write(f"N=2^{n.bit_length() - 1:<2} {elapsed:8.1f}ms {memory:6.1f}MiB")
+            if elapsed > target:
+                break
+            best = n
+            n *= 2
+
+        if best is None:
+            self.stdout.write(self.style.WARNING("Even the smallest cost exceeds the target"))
+            best = 2**10
+        self.stdout.write(
+            "Suggested settings:\n"
+            f'PASSWORD_SCRYPT = {{"N": {best}, "R": {r}, "P": {p}}}\n'
+            "Existing hashes are upgraded on the next successful login."
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from utils.revocation import prune_revoked_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete revoked token records whose tokens have expired"
+
+    def handle(self, *args, **options):
+        count = prune_revoked_tokens()
+        self.stdout.write(f"Pruned {count} revoked tokens")
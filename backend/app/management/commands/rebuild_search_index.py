@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from search.controllers import get_backend, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of posts and replies"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_index()
+        self.stdout.write(f"Indexed {count} documents with the {get_backend().name} backend")
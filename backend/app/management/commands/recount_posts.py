@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from post.controllers import POST_COUNTER, user_post_counter
+from post.models import Counter, Post, Reply
+
+
+class Command(BaseCommand):
+    help = "Rebuild post counters (total posts, posts per user, replies per post)"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = Post.objects.count()
+            Counter.objects.update_or_create(key=POST_COUNTER, defaults={"value": total})
+
+            Counter.objects.filter(key__startswith=user_post_counter("")).delete()
+            Counter.objects.bulk_create(
+                [
+                    Counter(key=user_post_counter(row["user_id"]), value=row["count"])
+                    for row in Post.objects.values("user_id").annotate(count=Count("id"))
+                ]
+            )
+
+            reply_count = (
+                Reply.objects.filter(post_id=OuterRef("pk"))
+                .values("post_id")
+                .annotate(count=Count("id"))
+                .values("count")
+            )
+            Post.objects.update(reply_count=Coalesce(Subquery(reply_count), 0))
+
+        self.stdout.write(f"Recounted {total} posts")
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+
+from post.models import Post, Reply
+from user.models import User
+
+
+def nickname_of(column):
+    return Subquery(User.objects.filter(id=OuterRef(column)).values("nickname")[:1])
+
+
+class Command(BaseCommand):
+    help = "Backfill or check the nicknames denormalized into posts and replies"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report rows whose nickname differs from the user's, do not modify",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            self.check_nicknames()
+        else:
+            self.backfill()
+
+    def backfill(self):
+        with transaction.atomic():
+            posts = Post.objects.update(nickname=nickname_of("user_id"))
+            Post.objects.filter(last_replied_user__isnull=False).update(
+                last_replied_nickname=nickname_of("last_replied_user_id")
+            )
+            replies = Reply.objects.update(nickname=nickname_of("user_id"))
+        self.stdout.write(f"Backfilled nicknames of {posts} posts and {replies} replies")
+
+    def check_nicknames(self):
+        mismatches = {
+            "post.nickname": Post.objects.exclude(nickname=F("user__nickname")).count(),
+            "post.last_replied_nickname": Post.objects.filter(last_replied_user__isnull=False)
+            .exclude(last_replied_nickname=F("last_replied_user__nickname"))
+            .count(),
+            "reply.nickname": Reply.objects.exclude(nickname=F("user__nickname")).count(),
+        }
+        for column, count in mismatches.items():
+            self.stdout.write(f"{column}: {count} inconsistent rows")
+        if any(mismatches.values()):
+            raise CommandError("Denormalized nicknames are inconsistent, run sync_nicknames")
@@ -5,7 +5,7 @@ from django.core.management.base import BaseCommand
 
 from app.settings import BASE_DIR
 
-COV = coverage.coverage(branch=True, include=["utils/*", "user/*", "post/*"])
+COV = coverage.coverage(branch=True, include=["utils/*", "user/*", "post/*", "search/*"])
 COV.start()
 
 
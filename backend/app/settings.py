@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,6 +48,7 @@ INSTALLED_APPS = [
     "corsheaders",
     "post",
     "user",
+    "search",
     "rest_framework",
     "drf_spectacular",
     "drf_spectacular_sidecar",
@@ -74,6 +76,8 @@ SPECTACULAR_SETTINGS = {
 }
 
 MIDDLEWARE = [
+    # 统计每个请求的查询数与耗时，放在第一位，见 utils/query_count.py
+    "utils.query_count.QueryCountMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -107,11 +111,73 @@ WSGI_APPLICATION = "app.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# SQLite tuning, applied by utils/sqlite/base.py on every new connection
+# journal_mode: WAL 下读写互不阻塞，设置保存在数据库文件中
+# synchronous: WAL 下 NORMAL 只在检查点时 fsync，断电可能丢失最近提交的事务，但不会损坏数据库
+# mmap_size: 读取通过内存映射而不是 read 系统调用（字节）
+# cache_size: 每个连接的页缓存，负数的单位为 KiB
+# busy_timeout: 等待其他连接释放锁的毫秒数
+SQLITE_PRAGMAS = {
+    "busy_timeout": 5000,
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -16 * 1024,
+}
+
+# Per-worker database connection pool, see utils/pool.py
+# 请求结束时连接归还连接池而不是关闭（CONN_MAX_AGE = 0），CONN_HEALTH_CHECKS 在复用前检查连接
+# MAX_SIZE: 每个 worker 每个数据库别名的连接上限，不小于 gunicorn 的线程数
+# TIMEOUT: 连接全部在用时等待的秒数
+# IDLE_TIMEOUT: 空闲超过该秒数的连接被关闭
+DATABASE_POOL = {
+    "MAX_SIZE": 8,
+    "TIMEOUT": 10,
+    "IDLE_TIMEOUT": 300,
+}
+
+# default 上的事务以 BEGIN IMMEDIATE 开始，见 utils/sqlite/base.py
+# read 是同一个数据库文件上的只读连接，作为 DATABASE_REPLICAS 中的副本
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        "ENGINE": "utils.sqlite",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "pragmas": SQLITE_PRAGMAS,
+            "transaction_mode": "IMMEDIATE",
+            "pool": DATABASE_POOL,
+        },
+    },
+    "read": {
+        "ENGINE": "utils.sqlite",
+        "NAME": BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "pool": DATABASE_POOL,
+            # journal_mode 由 default 设置，只读连接不能修改
+            "pragmas": {
+                **{k: v for k, v in SQLITE_PRAGMAS.items() if k != "journal_mode"},
+                "query_only": "ON",
+            },
+        },
+        "TEST": {"MIRROR": "default"},
+    },
+}
+
+DATABASE_ROUTERS = ["utils.db.ReplicaRouter"]
+
+# Read replicas for read_connection queries in post and user controllers, see utils/db.py
+# ALIASES: 只读副本的数据库别名，每次调用随机选择一个
+# STICKY_SECONDS: 用户写入后这段时间内其读查询仍使用 default，应大于副本的复制延迟
+# CACHE_ALIAS: 记录用户最近写入的缓存。未配置 CACHES 时 default 是进程内的 LocMemCache，
+#              粘滞只在本 worker 生效，多 worker 部署需要指向共享缓存
+DATABASE_REPLICAS = {
+    "ALIASES": ["read"],
+    "STICKY_SECONDS": 5,
+    "CACHE_ALIAS": "default",
 }
 
 # Password validation
@@ -159,3 +225,119 @@ SALT = "bar"
 
 # Login URL for admin panel
 LOGIN_URL = "/admin/login/"
+
+# Response cache for post list and post detail
+# BACKEND: "local" 进程内 LRU，"django" 使用 CACHES 中 ALIAS 对应的缓存（多 worker 共享）
+RESPONSE_CACHE = {
+    "BACKEND": "local",
+    "ALIAS": "default",
+    "MAX_ENTRIES": 1024,
+    "TTL": 30,
+}
+
+# Full-text search backend
+# "auto": SQLite 支持 FTS5 时使用 "fts5"，否则使用纯 Python 的 "table" 倒排表
+SEARCH_BACKEND = "auto"
+
+# Batch API
+# MAX_REQUESTS: 单次批量请求的子请求上限，WORKERS: 并发执行读请求的线程数，1 表示顺序执行
+BATCH = {
+    "MAX_REQUESTS": 20,
+    "WORKERS": 4,
+}
+
+# Authenticated user cache used by jwt_authentication
+# BACKEND: "local" 进程内 LRU，其他 worker 的缓存依靠 TTL 过期
+#          "django" 使用 CACHES 中 ALIAS 对应的缓存，多 worker 共享，失效立即可见
+AUTH_USER_CACHE = {
+    "BACKEND": "local",
+    "ALIAS": "default",
+    "MAX_ENTRIES": 4096,
+    "TTL": 60,
+}
+
+# Verified JWT payload cache
+# 条目的有效期取 TTL 与 jwt 剩余有效期中较小者
+JWT_CACHE = {
+    "MAX_ENTRIES": 10000,
+    "TTL": 300,
+}
+
+# Password hashing pool
+# WORKERS: 每个 worker 进程中计算 scrypt 的进程数，0 表示在请求线程中计算，
+#          gunicorn.conf.py 按核数与 worker 数设置 PASSWORD_HASH_WORKERS
+# QUEUE_SIZE: 进程全忙时最多排队的请求数，超出后返回 503
+# TIMEOUT: 等待单次哈希的秒数
+PASSWORD_HASHING = {
+    "WORKERS": int(os.environ.get("PASSWORD_HASH_WORKERS", 2)),
+    "QUEUE_SIZE": 16,
+    "TIMEOUT": 10,
+    "START_METHOD": "forkserver",
+}
+
+# scrypt cost parameters for new password hashes
+# 使用 python manage.py calibrate_password_hash 按本机性能测算
+PASSWORD_SCRYPT = {
+    "N": 32768,
+    "R": 8,
+    "P": 1,
+}
+
+# Login and registration throttle, checked before any password hashing
+# BACKEND: "local" 进程内令牌桶
+#          "django" 使用 CACHES 中 ALIAS 对应的缓存（滑动窗口，多 worker 共享）
+# RATES: 各维度的速率，"次数/周期"，周期为 s、m、h、d
+LOGIN_THROTTLE = {
+    "ENABLED": True,
+    "BACKEND": "local",
+    "ALIAS": "default",
+    "RATES": {
+        "login_ip": "30/m",
+        "login_username": "10/m",
+        "register_ip": "10/h",
+    },
+}
+
+# 反向代理的层数，大于 0 时从 X-Forwarded-For 中取客户端 IP
+NUM_PROXIES = 0
+
+# Token revocation (logout)
+# BLOOM_CAPACITY / ERROR_RATE: 布隆过滤器的容量与误判率，注销记录超过容量后重建时自动扩容
+# SYNC_INTERVAL: 增量同步其他 worker 注销记录的间隔（秒）
+# REBUILD_INTERVAL: 删除过期记录并重建过滤器的间隔（秒）
+TOKEN_REVOCATION = {
+    "BLOOM_CAPACITY": 100000,
+    "ERROR_RATE": 0.001,
+    "SYNC_INTERVAL": 5,
+    "REBUILD_INTERVAL": 3600,
+}
+
+# Server-sent events for new replies and posts
+# BACKEND: "local" 只通知本进程的订阅者，适用于单 worker
+#          "cache" 通过 CACHES 中 ALIAS 对应的共享缓存通知其他 worker，轮询间隔为 POLL_INTERVAL 秒
+# HEARTBEAT: 空闲时发送心跳注释的间隔（秒）
+# MAX_DURATION: 单个流的最长时间（秒），之后客户端按 RETRY_MS 毫秒后带 Last-Event-ID 重连
+# BACKFILL_MAX: 重连时最多补发的事件数，超过时发送 reset 事件
+# MAX_PENDING: 每个订阅者积压的事件上限，超过时丢弃积压并发送 reset 事件
+# MAX_SYNC_STREAMS: 同步（WSGI）worker 同时打开的事件流上限，每个流占用一个请求线程，
+#                   应小于每个 worker 的线程数，超过时返回 503；gunicorn.conf.py 设为线程数的一半
+EVENTS = {
+    "BACKEND": "local",
+    "ALIAS": "default",
+    "POLL_INTERVAL": 1,
+    "HEARTBEAT": 15,
+    "MAX_DURATION": 300,
+    "BACKFILL_MAX": 500,
+    "MAX_PENDING": 1000,
+    "RETRY_MS": 3000,
+    "MAX_SYNC_STREAMS": int(os.environ.get("EVENTS_MAX_SYNC_STREAMS", 2)),
+}
+
+# Prometheus metrics endpoint /api/v1/metrics
+# 指标包含接口、连接池、缓存等内部信息，默认关闭，关闭时返回 404
+# ENABLED: 环境变量 METRICS_ENABLED=1 时开启
+# TOKEN: 非空时抓取端需要带 Authorization: Bearer <TOKEN>，否则返回 401
+METRICS = {
+    "ENABLED": os.environ.get("METRICS_ENABLED") == "1",
+    "TOKEN": os.environ.get("METRICS_TOKEN", ""),
+}
@@ -0,0 +1,16 @@
+from app.settings import *
+
+# ASGI 部署使用异步的读接口，见 app/urls_asgi.py
+ROOT_URLCONF = "app.urls_asgi"
+
+# 与 MIDDLEWARE 相同，但不再为每个请求切换线程，见 utils/middleware.py
+MIDDLEWARE = [
+    "utils.query_count.QueryCountMiddleware",
+    "utils.middleware.SecurityMiddleware",
+    "utils.middleware.SessionMiddleware",
+    "utils.middleware.CorsMiddleware",
+    "utils.middleware.CommonMiddleware",
+    "utils.middleware.AuthenticationMiddleware",
+    "utils.middleware.MessageMiddleware",
+    "utils.middleware.XFrameOptionsMiddleware",
+]
@@ -1,14 +1,39 @@
+import os
+
 from app.settings import *
 
 DEBUG = False
 
+# MySQL 的连接握手与认证是请求耗时的主要部分之一，连接由连接池复用，见 utils/pool.py
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.mysql",
+        "ENGINE": "utils.mysql",
         "NAME": "thss",
         "USER": "root",
         "PASSWORD": "thss",
         "HOST": "db",
         "PORT": "3306",
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "pool": {"MAX_SIZE": 8, "TIMEOUT": 10, "IDLE_TIMEOUT": 300},
+        },
+    }
+}
+
+# 只读副本的主机，逗号分隔，例如 MYSQL_REPLICA_HOSTS=db-replica-1,db-replica-2
+# 未设置时全部查询使用主库
+REPLICA_HOSTS = [host for host in os.environ.get("MYSQL_REPLICA_HOSTS", "").split(",") if host]
+for i, host in enumerate(REPLICA_HOSTS):
+    DATABASES[f"replica{i}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "TEST": {"MIRROR": "default"},
     }
+# 写入后的粘滞标记保存在 CACHE_ALIAS 对应的缓存中。未配置 CACHES 时为进程内的 LocMemCache，
+# 粘滞只在写入的 worker 内生效；多 worker 部署需要在 CACHES 中配置共享缓存（如 Redis）并指向它
+DATABASE_REPLICAS = {
+    "ALIASES": [f"replica{i}" for i in range(len(REPLICA_HOSTS))],
+    "STICKY_SECONDS": 5,
+    "CACHE_ALIAS": "default",
 }
@@ -19,10 +19,15 @@ from django.contrib.auth.decorators import login_required
 from django.urls import include, path
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
+from app import views
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path(r"", include("post.urls")),
     path(r"", include("user.urls")),
+    path(r"", include("search.urls")),
+    path("api/v1/metrics", views.get_metrics, name="metrics"),
+    path("api/v1/batch", views.batch, name="batch"),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path(
         "api/schema/swagger-ui/",
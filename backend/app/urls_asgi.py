@@ -0,0 +1,22 @@
+"""
+ASGI 部署的 URL 配置
+
+读接口（帖子列表、帖子详情、用户信息）与 SSE 事件流使用原生异步视图，
+其他方法与接口沿用 app.urls 中的同步视图。
+异步路由需要排在 app.urls 之前，路由名称相同，reverse 得到的路径不变。
+"""
+
+from django.urls import include, path
+
+from post import async_views as post_views
+from user import async_views as user_views
+
+urlpatterns = [
+    path("api/v1/post", post_views.post_list, name="post_list"),
+    path("api/v1/post/events", post_views.feed_events, name="feed_events"),
+    path("api/v1/post/<int:postId>", post_views.post_detail, name="post_detail"),
+    path("api/v1/post/<int:postId>/events", post_views.post_events, name="post_events"),
+    path("api/v1/user", user_views.get_user_info, name="get_user_info"),
+    path("api/v1/user/<int:userId>", user_views.get_user_info_by_id, name="get_user_info_by_id"),
+    path(r"", include("app.urls")),
+]
@@ -0,0 +1,109 @@
+import hmac
+
+from django.http import Http404, HttpResponse
+from drf_spectacular.utils import OpenApiResponse, extend_schema
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from utils import metrics
+from utils.jwt import login_required
+
+from .batch import check_items, get_batch_settings, run_batch
+
+
+def get_metrics(request):
+    """
+    以 Prometheus 文本格式输出本进程的指标
+    METRICS["ENABLED"] 为 False 时返回 404，配置了 TOKEN 时校验 Authorization: Bearer <TOKEN>
+    """
+    options = metrics.get_metrics_settings()
+    if not options["ENABLED"]:
+        raise Http404
+    if options["TOKEN"]:
+        expected = ("Bearer " + options["TOKEN"]).encode()
+        if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), expected):
+            return HttpResponse(status=401, headers={"WWW-Authenticate": "Bearer"})
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4")
+
+
+@extend_schema(
+    request={
+        "application/json": {
+            "type": "object",
+            "properties": {
+                "requests": {
+                    "type": "array",
+                    "description": "子请求列表",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "string", "description": "子请求标识，原样返回"},
+                            "method": {"type": "string", "description": "请求方法，默认 GET"},
+                            "path": {"type": "string", "description": "请求路径，可带查询参数"},
+                            "body": {"type": "object", "description": "请求体"},
+                            "headers": {"type": "object", "description": "额外的请求头"},
+                        },
+                        "required": ["path"],
+                    },
+                },
+                "atomic": {
+                    "type": "boolean",
+                    "description": "是否在同一事务中执行，任一子请求失败则全部回滚",
+                },
+            },
+            "required": ["requests"],
+        }
+    },
+    responses={
+        200: OpenApiResponse(
+            description="批量请求执行完成，各子请求的状态码见 responses",
+            response={
+                "type": "object",
+                "properties": {
+                    "responses": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "id": {"type": "string", "description": "子请求标识"},
+                                "status": {"type": "integer", "description": "状态码"},
+                                "headers": {"type": "object", "description": "响应头"},
+                                "body": {"type": "object", "description": "响应数据"},
+                            },
+                        },
+                    }
+                },
+            },
+        ),
+        400: OpenApiResponse(description="无效的参数"),
+        401: OpenApiResponse(description="未登录"),
+    },
+    description="批量执行帖子、用户相关接口的请求，只验证一次身份，相邻的读请求并发执行",
+    summary="批量请求",
+)
+@api_view(["POST"])
+@login_required
+def batch(request):
+    """
+    批量请求
+    """
+    data = request.data if isinstance(request.data, dict) else {}
+    items = data.get("requests")
+    if not check_items(items):
+        return Response(
+            {"message": "invalid arguments: requests"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(items) > get_batch_settings()["MAX_REQUESTS"]:
+        return Response({"message": "too many requests"}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = run_batch(request, items, atomic=bool(data.get("atomic", False)))
+    return Response(
+        {
+            "responses": [
+                {"id": item.get("id", index), "status": code, "headers": headers, "body": body}
+                for index, (item, (code, body, headers)) in enumerate(zip(items, results))
+            ]
+        },
+        status=status.HTTP_200_OK,
+    )
@@ -0,0 +1,173 @@
+"""
+gunicorn 配置，在 backend 目录下运行 gunicorn 时自动加载：
+    gunicorn                                  # WSGI，gthread worker
+    GUNICORN_PROFILE=asgi gunicorn            # ASGI，uvicorn worker，见 app/asgi.py
+
+环境变量：
+    GUNICORN_PROFILE   wsgi（默认）或 asgi
+    GUNICORN_WORKLOAD  mixed（默认）、read 或 cpu，决定每个 worker 的线程数与哈希进程数
+    GUNICORN_BIND      监听地址，默认 0.0.0.0:8000
+    WEB_CONCURRENCY    覆盖 worker 数量
+    GUNICORN_THREADS   覆盖每个 worker 的线程数
+    EVENTS_MAX_SYNC_STREAMS  gthread worker 同时打开的 SSE 流上限，默认为线程数的一半
+
+worker 数量等于可用核数：scrypt 在每个 worker 自己的哈希进程池中计算（utils/password.py），
+请求线程只是等待结果；读接口的时间主要花在数据库上，用线程而不是进程提高并发，节省内存。
+应用在 master 中预加载并导入全部视图，fork 后以写时复制共享；每个 worker 启动后预热缓存，
+并在日志中记录启动耗时与内存占用。
+"""
+
+import gc
+import os
+import time
+
+STARTED = time.monotonic()
+
+# 每个 worker 的线程数
+WORKLOADS = {
+    # 以读为主：线程多数时间在等待数据库
+    "read": 8,
+    "mixed": 4,
+    # 登录、注册占比高：请求线程只是等待哈希进程，多开线程只会让请求在哈希队列中排队
+    "cpu": 2,
+}
+
+
+def available_cores():
+    """
+    容器中按 CPU 亲和性计算，而不是宿主机的核数
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def size_workers(cores, workload="mixed", workers=None):
+    """
+    :param workers: 指定的 worker 数，None 时等于核数
+    :return: (worker 数, 每个 worker 的线程数, 每个 worker 的哈希进程数)
+    哈希进程合计约等于核数，进程池按需创建进程，空闲时不占用内存
+    """
+    workers = workers or max(1, cores)
+    return workers, WORKLOADS[workload], max(1, cores // workers)
+
+
+def memory_usage():
+    """
+    :return: (RSS, 私有内存) 单位 MiB，私有内存不含与 master 共享的写时复制页；非 Linux 返回 None
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line and "kB" in line)
+    except OSError:
+        return None
+    kb = {name: int(value.split()[0]) for name, value in fields.items()}
+    private = kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)
+    return kb.get("Rss", 0) / 1024, private / 1024
+
+
+def format_memory():
+    usage = memory_usage()
+    if usage is None:
+        return "RSS unavailable"
+    return "RSS %.1f MiB, private %.1f MiB" % usage
+
+
+profile = os.environ.get("GUNICORN_PROFILE", "wsgi")
+workload = os.environ.get("GUNICORN_WORKLOAD", "mixed")
+workers, _threads, _hash_workers = size_workers(
+    available_cores(), workload, int(os.environ.get("WEB_CONCURRENCY", 0))
+)
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+if profile == "asgi":
+    wsgi_app = "app.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "app.wsgi:application"
+    # gthread 的心跳与请求无关，SSE 长连接不会触发 timeout
+    worker_class = "gthread"
+    threads = int(os.environ.get("GUNICORN_THREADS", _threads))
+    # 每个 SSE 流在整个持续时间内占用一个线程，至少留一半线程给普通请求
+    os.environ.setdefault("EVENTS_MAX_SYNC_STREAMS", str(max(1, threads // 2)))
+os.environ.setdefault("PASSWORD_HASH_WORKERS", str(_hash_workers))
+
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+# 定期重启 worker，限制内存碎片与泄漏的累积，抖动避免所有 worker 同时重启
+max_requests = 5000
+max_requests_jitter = 500
+# 心跳文件放在内存文件系统，避免磁盘 IO 阻塞导致 worker 被误杀
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+accesslog = "-"
+
+
+def when_ready(server):
+    """
+    master 在 fork 之前导入全部视图，worker 共享这些模块的内存
+    """
+    from django.db import connections
+    from django.urls import get_resolver
+
+    from utils.pool import close_pools
+
+    get_resolver().url_patterns
+    # 预加载时打开的数据库连接不能被 worker 共享，归还连接池的连接也要关闭
+    connections.close_all()
+    close_pools()
+    # 之后新建的对象才会被垃圾回收扫描，避免 worker 中的 GC 写入共享页
+    gc.freeze()
+    server.log.info(
+        "Master ready in %.2fs (%s, %s workload, %d workers): %s",
+        time.monotonic() - STARTED,
+        profile,
+        workload,
+        server.num_workers,
+        format_memory(),
+    )
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+
+def post_worker_init(worker):
+    """
+    worker 启动后预热：重建注销列表的布隆过滤器，创建各个进程内缓存，读取帖子计数
+    预热使用的数据库连接归还本 worker 的连接池（DatabaseWrapper 在 fork 后重新取得连接池），
+    第一个请求不需要建立连接
+    """
+    from django.db import connections
+
+    try:
+        from post.controllers import get_post_count
+        from utils import response_cache, throttle, user_cache
+        from utils.jwt import get_token_cache
+        from utils.password import get_pool
+        from utils.revocation import revocation_list
+
+        revocation_list.rebuild(prune=False)
+        get_token_cache()
+        user_cache.get_backend()
+        response_cache.get_response_cache()
+        throttle.get_backend()
+        get_pool()
+        get_post_count()
+    except Exception as e:
+        worker.log.warning("Warm-up failed: %s", e)
+    finally:
+        connections.close_all()
+    worker.log.info(
+        "Worker %s ready in %.0fms: %s",
+        worker.pid,
+        (time.monotonic() - worker.forked_at) * 1000,
+        format_memory(),
+    )
+
+
+def worker_exit(server, worker):
+    worker.log.info("Worker %s exiting: %s", worker.pid, format_memory())
@@ -1,7 +1,8 @@
 from django.contrib import admin
 
-from .models import Post, Reply
+from .models import Counter, Post, Reply
 
 # Register your models here.
 admin.site.register(Post)
 admin.site.register(Reply)
+admin.site.register(Counter)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+帖子列表与帖子详情的异步视图，在 ASGI 部署（app.urls_asgi）中替代同步视图的 GET 方法
+
+参数、缓存与 ETag 的处理与 post.views 中的同步视图一致，响应内容相同。
+流式输出帖子详情（stream=true）仍由同步视图处理。
+
+SSE 流在异步视图中只占用一个协程，同步部署中每个连接占用一个 worker 线程。
+Django 4.2 在 ASGI 下不会因客户端断开而停止流，流最迟在 EVENTS["MAX_DURATION"] 秒后结束。
+"""
+
+from asgiref.sync import sync_to_async
+from rest_framework import status
+
+from post import controllers, views
+from post.events import PostSource, ReplySource
+from utils.async_views import json_response, sync_fallback
+from utils.etag import etag_matches
+from utils.jwt import async_login_required
+from utils.response_cache import get_response_cache
+from utils.sse import aevent_stream, last_event_id, open_subscription, sse_response
+
+
+def etag_response(request, entry):
+    """
+    根据缓存条目返回响应，If-None-Match 匹配时返回 304
+    """
+    headers = {"ETag": entry["etag"]} if entry["etag"] else None
+    if etag_matches(request, entry["etag"]):
+        return json_response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return json_response(entry["data"], status=status.HTTP_200_OK, headers=headers)
+
+
+async def get_post_list_data(user_id, page, size, order_by_reply, include_total, cursor):
+    """
+    查询帖子列表的响应数据，cursor 不为 None 时使用游标分页，失败时返回 None
+    """
+    if cursor is not None:
+        post_list, next_cursor, result = await controllers.aget_post_list_by_cursor(
+            user_id, cursor, size, order_by_reply
+        )
+        if not result:
+            return None
+        data = {"posts": post_list, "size": size, "nextCursor": next_cursor}
+        if include_total:
+            data["total"] = await controllers.aget_post_count(user_id)
+        return data
+
+    post_list, count, result = await controllers.aget_post_list(
+        user_id, page, size, order_by_reply, include_total
+    )
+    if not result:
+        return None
+    data = {"posts": post_list, "page": page, "size": size}
+    if include_total:
+        data["total"] = count
+    return data
+
+
+@sync_fallback(views.PostListView.as_view())
+@async_login_required(trust_claims=True)
+async def post_list(request):
+    """
+    获取帖子列表
+    """
+    page = int(request.GET.get("page", 1))
+    size = int(request.GET.get("size", 10))
+    user_id = request.GET.get("userId", 0)
+    order_by_reply = bool(request.GET.get("orderByReply", False))
+    include_total = request.GET.get("includeTotal", "true").lower() not in ("false", "0")
+    cursor = request.GET.get("cursor")
+    if cursor and not controllers.check_post_cursor(cursor):
+        return json_response({"message": "invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+    params = (user_id, page, size, order_by_reply, include_total, cursor)
+    response_cache = get_response_cache()
+    cache_key = await response_cache.akey("post_list", *params)
+    entry = await response_cache.aget(cache_key)
+    if entry is None:
+        etag = await controllers.aget_post_list_etag(*params)
+        if etag_matches(request, etag):
+            return json_response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        data = await get_post_list_data(*params)
+        if data is None:
+            return json_response({"message": "error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        entry = {"etag": etag, "data": data}
+        await response_cache.aset(cache_key, entry)
+    return etag_response(request, entry)
+
+
+_post_detail_view = views.PostDetailView.as_view()
+
+
+@sync_fallback(_post_detail_view)
+async def post_detail(request, postId):
+    """
+    获取帖子详情
+    """
+    if request.GET.get("stream", "false").lower() in ("true", "1"):
+        return await sync_to_async(_post_detail_view)(request, postId)
+    return await get_post_detail(request, postId)
+
+
+@async_login_required(trust_claims=True)
+async def get_post_detail(request, postId):
+    """
+    非流式的帖子详情，回帖可分页
+    """
+    reply_cursor = request.GET.get("replyCursor")
+    reply_size = request.GET.get("replySize")
+    if reply_cursor and not controllers.check_reply_cursor(reply_cursor):
+        return json_response({"message": "invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+    if reply_cursor is not None or reply_size is not None:
+        reply_size = min(
+            max(int(reply_size or views.REPLY_PAGE_SIZE), 1), views.REPLY_PAGE_SIZE_MAX
+        )
+
+    response_cache = get_response_cache()
+    cache_key = await response_cache.akey("post_detail", postId, reply_cursor, reply_size)
+    entry = await response_cache.aget(cache_key)
+    if entry is None:
+        etag = await controllers.aget_post_detail_etag(postId)
+        if etag_matches(request, etag):
+            return json_response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        detail, result = await controllers.aget_post_detail(postId, reply_cursor, reply_size)
+        if not result:
+            return json_response({"message": "error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        entry = {"etag": etag, "data": detail}
+        await response_cache.aset(cache_key, entry)
+    return etag_response(request, entry)
+
+
+async def events_response(name, source, request):
+    try:
+        cursor = last_event_id(request)
+    except ValueError:
+        return json_response(
+            {"message": "invalid Last-Event-ID"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    subscription, initial = await sync_to_async(open_subscription)(name, source, cursor)
+    return sse_response(aevent_stream(subscription, initial), subscription)
+
+
+@sync_fallback(views.post_events)
+@async_login_required(trust_claims=True)
+async def post_events(request, postId):
+    """
+    订阅帖子的新回帖
+    """
+    if not await controllers.acheck_post_exists(postId):
+        return json_response({"message": "not found"}, status=status.HTTP_404_NOT_FOUND)
+    return await events_response(controllers.post_channel(postId), ReplySource(postId), request)
+
+
+@sync_fallback(views.feed_events)
+@async_login_required(trust_claims=True)
+async def feed_events(request):
+    """
+    订阅全站的新帖子
+    """
+    return await events_response(controllers.FEED_CHANNEL, PostSource(), request)
@@ -1,104 +1,348 @@
 import datetime
 
-from django.db.models import F
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.db.models.functions import Coalesce
 
-from .models import Post, Reply
+from search.controllers import index_post, index_reply
+from user.models import User
+from utils.cursor import decode_cursor, encode_cursor
+from utils.db import derived_writes, read_connection
+from utils.etag import make_etag
+from utils.pubsub import publish
+from utils.response_cache import bump_content_version
 
+from .models import REPLY_MAX_DEPTH, REPLY_PATH_STEP, Counter, Post, Reply
 
-def get_post_list(user_id=0, page=1, size=10, order_by_reply=False):
+POST_COUNTER = "post"
+
+
+def user_post_counter(user_id):
+    return f"post:user:{user_id}"
+
+
+# 事件频道，见 post/events.py
+FEED_CHANNEL = "feed"
+
+
+def post_channel(post_id):
+    return f"post:{post_id}"
+
+
+def _publish_on_commit(name):
+    """
+    事务提交后通知订阅者，未提交的行对其他连接不可见
+    """
+    transaction.on_commit(lambda: publish(name))
+
+
+def _incr_counter(key, queryset):
+    """
+    计数器加一，计数器不存在时用 queryset 的实际数量加上即将写入的一行初始化
+    需要在事务中、写入新行之前调用：计数器行的锁持有到事务提交，并发事务依次写入
+    """
+    if Counter.objects.filter(key=key).update(value=F("value") + 1):
+        return
+    _, created = Counter.objects.get_or_create(key=key, defaults={"value": queryset.count() + 1})
+    if not created:
+        Counter.objects.filter(key=key).update(value=F("value") + 1)
+
+
+def _get_counter(key, queryset):
+    """
+    读取计数器，计数器不存在时用 queryset 的实际数量初始化
+    初始化不是用户的写入，读取的用户不会因此在粘滞窗口内读主库
+    """
+    value = Counter.objects.filter(key=key).values_list("value", flat=True).first()
+    if value is None:
+        value = queryset.count()
+        with derived_writes():
+            Counter.objects.get_or_create(key=key, defaults={"value": value})
+    return value
+
+
+def _post_list_queryset(user_id, order_by_reply):
+    """
+    构造帖子列表的查询集与排序列，排序键为 (order_col, id)，与 Post 上的联合索引一致
+    """
+    if order_by_reply:
+        order_col = "last_replied_time"
+    else:
+        order_col = "updated"
+
+    if user_id == 0:
+        posts = Post.objects.all()
+    else:
+        posts = Post.objects.filter(user_id=user_id)
+
+    return posts, order_col
+
+
+def post_list_values(posts):
+    """
+    帖子列表中帖子的字段，事件流中的新帖子使用相同的格式
+    """
+    return posts.values(
+        "id",
+        "nickname",
+        "title",
+        "content",
+        "created",
+        "updated",
+        userId=F("user_id"),
+        lastRepliedNickname=F("last_replied_nickname"),
+        lastRepliedUserId=F("last_replied_user_id"),
+        lastRepliedTime=F("last_replied_time"),
+        replyCount=F("reply_count"),
+    )
+
+
+def _post_counter(user_id):
+    """
+    :return: (计数器键, 计数器不存在时用于初始化的查询集)
+    """
+    user_id = int(user_id)
+    if user_id == 0:
+        return POST_COUNTER, Post.objects.all()
+    else:
+        return user_post_counter(user_id), Post.objects.filter(user_id=user_id)
+
+
+@read_connection
+def get_post_count(user_id=0):
+    """
+    获取帖子总数（全部帖子或某个用户的帖子），读取维护好的计数器，O(1)
+    """
+    return _get_counter(*_post_counter(user_id))
+
+
+@read_connection
+async def aget_post_count(user_id=0):
+    key, queryset = _post_counter(user_id)
+    value = await Counter.objects.filter(key=key).values_list("value", flat=True).afirst()
+    if value is None:
+        # 计数器只在首次读取时初始化，包含写操作，放到线程中执行
+        value = await sync_to_async(_get_counter)(key, queryset)
+    return value
+
+
+def _post_page_values(user_id, page, size, order_by_reply):
+    posts, order_col = _post_list_queryset(int(user_id), order_by_reply)
+    return post_list_values(posts.order_by("-" + order_col, "-id")[(page - 1) * size : page * size])
+
+
+@read_connection
+def get_post_list(user_id=0, page=1, size=10, order_by_reply=False, include_total=True):
     try:
-        if order_by_reply:
-            order_col = "last_replied_time"
-        else:
-            order_col = "updated"
+        post_list = list(_post_page_values(user_id, page, size, order_by_reply))
+        count = get_post_count(user_id) if include_total else None
 
-        if user_id == 0:
-            posts = Post.objects.all()
-        else:
-            posts = Post.objects.filter(user_id=user_id)
+        return post_list, count, True
+    except Exception as e:
+        print(e)
+        return [], 0, False
 
-        post_list = (
-            posts.annotate(
-                nickname=F("user__nickname"),
-                lastRepliedNickname=F("last_replied_user__nickname"),
-            )
-            .order_by("-" + order_col)[(page - 1) * size : page * size]
-            .values(
-                "id",
-                "nickname",
-                "title",
-                "content",
-                "lastRepliedNickname",
-                "created",
-                "updated",
-                userId=F("user_id"),
-                lastRepliedUserId=F("last_replied_user_id"),
-                lastRepliedTime=F("last_replied_time"),
-            )
-        )
-        count = posts.count()
 
-        return list(post_list), count, True
+@read_connection
+async def aget_post_list(user_id=0, page=1, size=10, order_by_reply=False, include_total=True):
+    try:
+        post_list = [p async for p in _post_page_values(user_id, page, size, order_by_reply)]
+        count = await aget_post_count(user_id) if include_total else None
+
+        return post_list, count, True
     except Exception as e:
         print(e)
         return [], 0, False
 
 
-def check_post(post_id, user_id):
+def _post_cursor_values(user_id, cursor, size, order_by_reply):
+    """
+    游标分页多取一条，用于判断是否有下一页
+    """
+    posts, order_col = _post_list_queryset(int(user_id), order_by_reply)
+    if cursor:
+        value, last_id = decode_cursor(cursor, datetime.datetime, int)
+        posts = posts.filter(
+            Q(**{order_col + "__lt": value}) | Q(**{order_col: value, "id__lt": last_id})
+        )
+    return post_list_values(posts.order_by("-" + order_col, "-id")[: size + 1])
+
+
+def _post_cursor_page(post_list, size, order_by_reply):
+    next_cursor = None
+    if len(post_list) > size:
+        post_list = post_list[:size]
+        last = post_list[-1]
+        order_key = "lastRepliedTime" if order_by_reply else "updated"
+        next_cursor = encode_cursor(last[order_key], last["id"])
+    return post_list, next_cursor
+
+
+@read_connection
+def get_post_list_by_cursor(user_id=0, cursor="", size=10, order_by_reply=False):
+    """
+    基于游标（keyset）的帖子列表分页，每一页的代价与页码无关
+    :param cursor: str 上一页返回的 nextCursor，为空表示第一页
+    :return: (帖子列表, 下一页游标, 是否成功)，没有下一页时游标为 None
+    """
     try:
-        p = Post.objects.filter(id=post_id).first()
-        if p.user_id == int(user_id):
-            return True
-        else:
-            return False
+        post_list = list(_post_cursor_values(user_id, cursor, size, order_by_reply))
+        return *_post_cursor_page(post_list, size, order_by_reply), True
     except Exception as e:
         print(e)
-        return False
+        return [], None, False
 
 
-def check_reply(post_id, reply_id):
+@read_connection
+async def aget_post_list_by_cursor(user_id=0, cursor="", size=10, order_by_reply=False):
     try:
-        if reply_id == 0:
-            p = Post.objects.filter(id=post_id).first()
-            if p is None:
-                return False
-            else:
-                return True
-        else:
-            r = Reply.objects.filter(id=reply_id).first()
-            if r.post_id == int(post_id):
-                return True
-            else:
-                return False
+        post_list = [p async for p in _post_cursor_values(user_id, cursor, size, order_by_reply)]
+        return *_post_cursor_page(post_list, size, order_by_reply), True
     except Exception as e:
         print(e)
-        return False
+        return [], None, False
+
 
+def _users_version():
+    """
+    用户表的最新修改时间，昵称修改后冗余的昵称随之变化
+    """
+    return User.objects.aggregate(v=Max("updated"))["v"]
 
-def check_self_reply(reply_id, user_id):
+
+@read_connection
+def get_post_list_etag(user_id, order_by_reply, *params):
+    """
+    帖子列表的 ETag，只使用计数器与索引上的 MAX 查询，不读取帖子行
+    :param params: 其余影响响应内容的查询参数
+    """
     try:
-        r = Reply.objects.filter(id=reply_id).first()
-        if r.user_id == int(user_id):
-            return True
-        else:
-            return False
+        posts, _ = _post_list_queryset(int(user_id), order_by_reply)
+        return make_etag(
+            "post_list",
+            user_id,
+            order_by_reply,
+            *params,
+            get_post_count(user_id),
+            posts.aggregate(v=Max("updated"))["v"],
+            posts.aggregate(v=Max("last_replied_time"))["v"],
+            _users_version(),
+        )
     except Exception as e:
         print(e)
-        return False
+        return None
 
 
-def create_post(title, content, user_id):
+@read_connection
+async def aget_post_list_etag(user_id, order_by_reply, *params):
+    """
+    与 get_post_list_etag 的结果相同
+    """
     try:
-        now = datetime.datetime.now()
-        p = Post.objects.create(
-            user_id=user_id,
-            title=title,
-            content=content,
-            last_replied_user_id=user_id,
-            last_replied_time=now,
-            created=now,
-            updated=now,
+        posts, _ = _post_list_queryset(int(user_id), order_by_reply)
+        updated = await posts.aaggregate(v=Max("updated"))
+        replied = await posts.aaggregate(v=Max("last_replied_time"))
+        users = await User.objects.aaggregate(v=Max("updated"))
+        return make_etag(
+            "post_list",
+            user_id,
+            order_by_reply,
+            *params,
+            await aget_post_count(user_id),
+            updated["v"],
+            replied["v"],
+            users["v"],
         )
+    except Exception as e:
+        print(e)
+        return None
+
+
+def _post_version(post_id):
+    return Post.objects.filter(id=post_id).values_list(
+        "updated", "last_replied_time", "reply_count"
+    )
+
+
+@read_connection
+def get_post_detail_etag(post_id):
+    """
+    帖子详情的 ETag，回复的新增与修改都会更新帖子的 last_replied_time 与 reply_count
+    """
+    try:
+        version = _post_version(post_id).first()
+        if version is None:
+            return None
+        return make_etag("post_detail", post_id, *version, _users_version())
+    except Exception as e:
+        print(e)
+        return None
+
+
+@read_connection
+async def aget_post_detail_etag(post_id):
+    try:
+        version = await _post_version(post_id).afirst()
+        if version is None:
+            return None
+        users = await User.objects.aaggregate(v=Max("updated"))
+        return make_etag("post_detail", post_id, *version, users["v"])
+    except Exception as e:
+        print(e)
+        return None
+
+
+def check_post_cursor(cursor):
+    """
+    检查帖子列表游标是否合法
+    """
+    return decode_cursor(cursor, datetime.datetime, int) is not None
+
+
+def check_reply_cursor(cursor):
+    """
+    检查回帖游标是否合法
+    """
+    return decode_cursor(cursor, datetime.datetime, int) is not None
+
+
+def check_post_exists(post_id):
+    return Post.objects.filter(id=post_id).exists()
+
+
+async def acheck_post_exists(post_id):
+    return await Post.objects.filter(id=post_id).aexists()
+
+
+def _get_nickname(user_id):
+    return User.objects.filter(id=user_id).values_list("nickname", flat=True).first() or ""
+
+
+def create_post(title, content, user_id, nickname=None):
+    try:
+        now = datetime.datetime.now()
+        if nickname is None:
+            nickname = _get_nickname(user_id)
+        with transaction.atomic():
+            # 在写入帖子之前执行，锁定计数器行，帖子 id 的顺序与提交顺序一致，
+            # 新帖子事件流按 id 补发不会遗漏（见 utils/pubsub.py）
+            _incr_counter(POST_COUNTER, Post.objects.all())
+            _incr_counter(user_post_counter(user_id), Post.objects.filter(user_id=user_id))
+            p = Post.objects.create(
+                user_id=user_id,
+                nickname=nickname,
+                title=title,
+                content=content,
+                last_replied_user_id=user_id,
+                last_replied_nickname=nickname,
+                last_replied_time=now,
+                created=now,
+                updated=now,
+            )
+            index_post(p.id, title, content)
+        bump_content_version()
+        _publish_on_commit(FEED_CHANNEL)
         return p.id, True
     except Exception as e:
         print(e)
@@ -106,86 +350,272 @@ def create_post(title, content, user_id):
 
 
 def update_post(title, content, post_id, user_id):
+    """
+    修改用户自己的帖子，UPDATE 的条件同时检查帖子存在与作者
+    :return: (是否找到帖子, ok)
+    """
     try:
         now = datetime.datetime.now()
-        Post.objects.filter(id=post_id, user_id=user_id).update(
-            title=title, content=content, updated=now
-        )
-        return True
+        with transaction.atomic():
+            if not Post.objects.filter(id=post_id, user_id=user_id).update(
+                title=title, content=content, updated=now
+            ):
+                return False, True
+            index_post(post_id, title, content)
+            bump_content_version()
+        return True, True
     except Exception as e:
         print(e)
-        return False
+        return False, False
 
 
-def get_post_detail(post_id):
+def reply_values(replies, *fields):
+    """
+    帖子详情中回帖的字段，事件流中的新回帖使用相同的格式
+    :param fields: 额外的字段
+    """
+    return replies.values(
+        "id",
+        "content",
+        "created",
+        "updated",
+        "nickname",
+        *fields,
+        userId=F("user_id"),
+        postId=F("post_id"),
+        replyId=Coalesce("reply_id", 0),
+    ).order_by("created", "id")
+
+
+def _path_segment(reply_id):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    segment = ""
+    while reply_id:
+        reply_id, r = divmod(reply_id, 36)
+        segment = digits[r] + segment
+    return segment.rjust(REPLY_PATH_STEP - 1, "0") + "/"
+
+
+def reply_path(reply_id, parent=None):
+    """
+    计算回帖的物化路径与深度
+    :param parent: (path, depth) 被回复的回帖，None 表示回复主楼
+    :return: (path, depth)
+    """
+    if parent is None:
+        return _path_segment(reply_id), 0
+    path, depth = parent
+    if depth >= REPLY_MAX_DEPTH:
+        # 超过最大深度时挂到被回复回帖的父节点下，与被回复的回帖同级
+        return path[:-REPLY_PATH_STEP] + _path_segment(reply_id), depth
+    return path + _path_segment(reply_id), depth + 1
+
+
+@read_connection
+def get_reply_tree(post_id, reply_id=0):
+    """
+    获取回帖树，按先序排列并带有深度，只需一次索引范围查询
+    :param reply_id: 为 0 时返回整个帖子的回帖树，否则返回该回帖及其所有后代
+    :return: 回帖不存在时返回 None
+    """
     try:
-        post = (
-            Post.objects.filter(id=post_id)
-            .values(
-                "id",
-                "title",
-                "content",
-                "created",
-                "updated",
-                userId=F("user_id"),
-                nickname=F("user__nickname"),
-                lastRepliedTime=F("last_replied_time"),
-            )
-            .first()
-        )
+        replies = Reply.objects.filter(post_id=post_id)
+        if reply_id:
+            path = replies.filter(id=reply_id).values_list("path", flat=True).first()
+            if path is None:
+                return None, True
+            # 后代的路径都以 path 开头，下一个字符是 36 进制数字，均小于 path[:-1] + "0"
+            replies = replies.filter(path__gte=path, path__lt=path[:-1] + "0")
+        return list(reply_values(replies, "depth").order_by("path")), True
+    except Exception as e:
+        print(e)
+        return None, False
+
+
+def _post_values(post_id):
+    return Post.objects.filter(id=post_id).values(
+        "id",
+        "title",
+        "content",
+        "created",
+        "updated",
+        "nickname",
+        userId=F("user_id"),
+        lastRepliedTime=F("last_replied_time"),
+        replyCount=F("reply_count"),
+    )
 
-        reply_list = (
-            Reply.objects.filter(post_id=post_id)
-            .values(
-                "id",
-                "content",
-                "created",
-                "updated",
-                nickname=F("user__nickname"),
-                userId=F("user_id"),
-                postId=F("post_id"),
-                replyId=F("reply_id"),
-            )
-            .order_by("created")
-        )
 
-        reply_list = list(reply_list)
+@read_connection
+def get_post(post_id):
+    """
+    获取帖子本身（不含回帖），帖子不存在时返回 None
+    """
+    try:
+        return _post_values(post_id).first(), True
+    except Exception as e:
+        print(e)
+        return None, False
 
-        for reply in reply_list:
-            reply["replyId"] = reply["replyId"] if reply["replyId"] else 0
 
+def _post_detail_replies(post_id, reply_cursor, reply_size):
+    """
+    :return: 回帖的查询集，分页时多取一条用于判断是否有下一页
+    """
+    replies = Reply.objects.filter(post_id=post_id)
+    if reply_cursor:
+        created, last_id = decode_cursor(reply_cursor, datetime.datetime, int)
+        replies = replies.filter(Q(created__gt=created) | Q(created=created, id__gt=last_id))
+    if reply_size is None:
+        return reply_values(replies)
+    return reply_values(replies)[: reply_size + 1]
+
+
+def _post_detail(post, reply_list, reply_size):
+    if reply_size is None:
         post["reply"] = reply_list
-        return post, True
+        return post
+
+    next_cursor = None
+    if len(reply_list) > reply_size:
+        reply_list = reply_list[:reply_size]
+        next_cursor = encode_cursor(reply_list[-1]["created"], reply_list[-1]["id"])
+    post["reply"] = reply_list
+    post["nextReplyCursor"] = next_cursor
+    return post
+
+
+@read_connection
+def get_post_detail(post_id, reply_cursor=None, reply_size=None):
+    """
+    获取帖子详情与回帖列表
+    :param reply_cursor: str 回帖游标，按 (created, id) 分页，为空表示第一页
+    :param reply_size: int 每页回帖数量，为 None 时返回全部回帖
+    :return: 分页时帖子中包含 nextReplyCursor，没有下一页时为 None
+    """
+    try:
+        post, result = get_post(post_id)
+        if not result:
+            return None, False
+        reply_list = list(_post_detail_replies(post_id, reply_cursor, reply_size))
+        return _post_detail(post, reply_list, reply_size), True
+    except Exception as e:
+        print(e)
+        return None, False
+
+
+@read_connection
+async def aget_post_detail(post_id, reply_cursor=None, reply_size=None):
+    try:
+        post = await _post_values(post_id).afirst()
+        if post is None:
+            return None, False
+        replies = _post_detail_replies(post_id, reply_cursor, reply_size)
+        reply_list = [reply async for reply in replies]
+        return _post_detail(post, reply_list, reply_size), True
     except Exception as e:
         print(e)
         return None, False
 
 
-def create_reply(content, user_id, post_id, reply_id=0):
+def iter_replies(post_id, chunk_size=500):
+    """
+    逐批读取帖子的全部回帖，内存占用与回帖总数无关
+    """
+    return reply_values(Reply.objects.filter(post_id=post_id)).iterator(chunk_size=chunk_size)
+
+
+def create_reply(content, user_id, post_id, reply_id=0, nickname=None):
+    """
+    回复帖子或帖子中的回帖
+    被回复的回帖需要属于同一帖子；更新帖子最新回复的影响行数为 0 表示帖子不存在
+    :return: (回帖 id，帖子或被回复的回帖不存在时为 0, ok)
+    """
     try:
         now = datetime.datetime.now()
-        reply = Reply.objects.create(
-            user_id=user_id,
-            post_id=post_id,
-            content=content,
-            created=now,
-            updated=now,
-        )
-        if reply_id:
-            reply.reply_id = reply_id
-            reply.save()
-        Post.objects.filter(id=post_id).update(last_replied_time=now, last_replied_user_id=user_id)
-        return True
+        if nickname is None:
+            nickname = _get_nickname(user_id)
+        with transaction.atomic():
+            parent = None
+            if reply_id:
+                parent = (
+                    Reply.objects.filter(id=reply_id, post_id=post_id)
+                    .values_list("path", "depth")
+                    .first()
+                )
+                if parent is None:
+                    return 0, True
+            # 在写入回帖之前执行，同时锁定帖子行，同一帖子的回帖依次写入，
+            # 回帖 id 的顺序与提交顺序一致
+            if not Post.objects.filter(id=post_id).update(
+                last_replied_time=now,
+                last_replied_user_id=user_id,
+                last_replied_nickname=nickname,
+                reply_count=F("reply_count") + 1,
+            ):
+                return 0, True
+            reply = Reply.objects.create(
+                user_id=user_id,
+                nickname=nickname,
+                post_id=post_id,
+                reply_id=reply_id or None,
+                content=content,
+                created=now,
+                updated=now,
+            )
+            # 路径包含回帖自身的 id，只能在 INSERT 之后写入
+            path, depth = reply_path(reply.id, parent)
+            Reply.objects.filter(id=reply.id).update(path=path, depth=depth)
+            index_reply(reply.id, content)
+            bump_content_version()
+            _publish_on_commit(post_channel(post_id))
+        return reply.id, True
     except Exception as e:
         print(e)
-        return False
+        return 0, False
 
 
-def update_reply(content, user_id, post_id, reply_id):
+def update_reply(content, user_id, post_id, reply_id, nickname=None):
+    """
+    修改用户自己在该帖子中的回帖
+    :return: (是否找到回帖, ok)
+    """
     try:
         now = datetime.datetime.now()
-        Reply.objects.filter(id=reply_id, user_id=user_id).update(content=content, updated=now)
-        Post.objects.filter(id=post_id).update(last_replied_time=now, last_replied_user_id=user_id)
+        if nickname is None:
+            nickname = _get_nickname(user_id)
+        with transaction.atomic():
+            if not Reply.objects.filter(id=reply_id, post_id=post_id, user_id=user_id).update(
+                content=content, updated=now
+            ):
+                return False, True
+            index_reply(reply_id, content)
+            Post.objects.filter(id=post_id).update(
+                last_replied_time=now, last_replied_user_id=user_id, last_replied_nickname=nickname
+            )
+            bump_content_version()
+        return True, True
+    except Exception as e:
+        print(e)
+        return False, False
+
+
+def sync_user_nickname(user_id, nickname):
+    """
+    用户昵称修改后，同步帖子与回复中冗余存储的昵称
+    """
+    try:
+        with transaction.atomic():
+            Post.objects.filter(user_id=user_id).exclude(nickname=nickname).update(
+                nickname=nickname
+            )
+            Post.objects.filter(last_replied_user_id=user_id).exclude(
+                last_replied_nickname=nickname
+            ).update(last_replied_nickname=nickname)
+            Reply.objects.filter(user_id=user_id).exclude(nickname=nickname).update(
+                nickname=nickname
+            )
+        bump_content_version()
         return True
     except Exception as e:
         print(e)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+帖子的事件源
+
+post:<帖子id>：帖子的新回帖，事件数据与帖子详情中的回帖相同
+feed：全站的新帖子，事件数据与帖子列表中的帖子相同
+事件 id 为回帖或帖子的 id，通过 (post_id, id) 与主键上的范围查询补发。
+create_reply 与 create_post 在 INSERT 之前锁定帖子行与帖子计数器，id 按提交顺序递增。
+"""
+
+from django.db.models import Max
+
+from .controllers import post_list_values, reply_values
+from .models import Post, Reply
+
+
+class ReplySource:
+    def __init__(self, post_id):
+        self.replies = Reply.objects.filter(post_id=post_id)
+
+    def load(self, after_id, limit):
+        replies = reply_values(self.replies.filter(id__gt=after_id)).order_by("id")[:limit]
+        return [(reply["id"], "reply", reply) for reply in replies]
+
+    def latest(self):
+        return self.replies.aggregate(v=Max("id"))["v"] or 0
+
+
+class PostSource:
+    def load(self, after_id, limit):
+        posts = post_list_values(Post.objects.filter(id__gt=after_id)).order_by("id")[:limit]
+        return [(post["id"], "post", post) for post in posts]
+
+    def latest(self):
+        return Post.objects.aggregate(v=Max("id"))["v"] or 0
@@ -1,5 +1,10 @@
 from django.db import models
 
+# 回帖物化路径：每一层是 8 位 36 进制的回帖 id 加上 "/"，路径包含回帖自身
+REPLY_PATH_STEP = 9
+REPLY_PATH_MAX_LENGTH = 765
+REPLY_MAX_DEPTH = REPLY_PATH_MAX_LENGTH // REPLY_PATH_STEP - 1
+
 
 # Create your models here.
 class Post(models.Model):
@@ -8,6 +13,8 @@ class Post(models.Model):
     """
 
     user = models.ForeignKey("user.User", on_delete=models.CASCADE, verbose_name="发帖用户")
+    # 冗余存储的昵称，列表与详情查询无需连接 User 表，昵称修改时由 sync_user_nickname 同步
+    nickname = models.CharField(max_length=255, default="", verbose_name="发帖用户昵称")
 
     title = models.CharField(max_length=255, verbose_name="帖子标题")
     content = models.CharField(max_length=255, verbose_name="帖子内容")
@@ -19,11 +26,24 @@ class Post(models.Model):
         related_name="last_replied_posts",
         verbose_name="最新回复的用户",
     )
+    last_replied_nickname = models.CharField(
+        max_length=255, default="", verbose_name="最新回复的用户昵称"
+    )
     last_replied_time = models.DateTimeField(null=True, verbose_name="最新回复时间")
+    reply_count = models.IntegerField(default=0, verbose_name="回复数")
 
     created = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     updated = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
+    class Meta:
+        # 与帖子列表的排序键 (order_col, id) 一致，支持游标分页的索引范围扫描
+        indexes = [
+            models.Index(fields=["updated", "id"], name="post_updated_id_idx"),
+            models.Index(fields=["last_replied_time", "id"], name="post_replied_id_idx"),
+            models.Index(fields=["user", "updated", "id"], name="post_user_updated_id_idx"),
+            models.Index(fields=["user", "last_replied_time", "id"], name="post_user_replied_idx"),
+        ]
+
 
 class Reply(models.Model):
     """
@@ -31,6 +51,7 @@ class Reply(models.Model):
     """
 
     user = models.ForeignKey("user.User", on_delete=models.CASCADE, verbose_name="回复用户")
+    nickname = models.CharField(max_length=255, default="", verbose_name="回复用户昵称")
     post = models.ForeignKey(Post, on_delete=models.CASCADE, verbose_name="回复帖子")
     reply = models.ForeignKey(
         "post.Reply",
@@ -42,7 +63,27 @@ class Reply(models.Model):
         default=None,
     )
 
+    # 从楼层根回帖到自身的物化路径，按 path 排序即为回帖树的先序遍历
+    path = models.CharField(max_length=REPLY_PATH_MAX_LENGTH, default="", verbose_name="回帖路径")
+    depth = models.IntegerField(default=0, verbose_name="回帖深度")
+
     content = models.CharField(max_length=255, verbose_name="帖子内容")
 
     created = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     updated = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        # 帖子详情中回帖按 (created, id) 排序与分页；回帖树按 path 做范围查询
+        indexes = [
+            models.Index(fields=["post", "created", "id"], name="reply_post_created_id_idx"),
+            models.Index(fields=["post", "path"], name="reply_post_path_idx"),
+        ]
+
+
+class Counter(models.Model):
+    """
+    计数器，用于维护帖子总数等统计值，避免每次请求都执行 COUNT(*)
+    """
+
+    key = models.CharField(max_length=64, unique=True, verbose_name="计数器名称")
+    value = models.BigIntegerField(default=0, verbose_name="计数值")
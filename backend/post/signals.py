@@ -0,0 +1,32 @@
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+
+from user.models import User
+
+from . import controllers
+
+# 加载时昵称被延迟（only/defer）或尚未保存，无法判断是否修改
+_UNKNOWN = object()
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    """
+    记录加载时的昵称，保存时据此判断昵称是否修改；读取 __dict__ 不会触发延迟字段的查询
+    """
+    instance._saved_nickname = instance.__dict__.get("nickname", _UNKNOWN)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    用户昵称修改后同步冗余的昵称，新建用户还没有帖子，无需同步；
+    登录时间、密码等其他字段的保存不会执行同步
+    """
+    if update_fields is not None and "nickname" not in update_fields:
+        return
+    saved = getattr(instance, "_saved_nickname", _UNKNOWN)
+    instance._saved_nickname = instance.nickname
+    if created or saved == instance.nickname:
+        return
+    controllers.sync_user_nickname(instance.id, instance.nickname)
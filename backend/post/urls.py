@@ -4,7 +4,15 @@ from . import views
 
 urlpatterns = [
     path("api/v1/post", views.PostListView.as_view(), name="post_list"),
+    path("api/v1/post/events", views.feed_events, name="feed_events"),
     path("api/v1/post/<int:postId>", views.PostDetailView.as_view(), name="post_detail"),
     path("api/v1/post/<int:postId>/reply", views.reply_post, name="reply_post"),
     path("api/v1/post/<int:postId>/reply/<int:replyId>", views.modify_reply, name="modify_reply"),
+    path("api/v1/post/<int:postId>/tree", views.get_reply_tree, name="reply_tree"),
+    path("api/v1/post/<int:postId>/events", views.post_events, name="post_events"),
+    path(
+        "api/v1/post/<int:postId>/reply/<int:replyId>/tree",
+        views.get_reply_subtree,
+        name="reply_subtree",
+    ),
 ]
@@ -1,13 +1,44 @@
+import json
+
+from django.http import StreamingHttpResponse
 from drf_spectacular.utils import OpenApiParameter, OpenApiResponse, extend_schema
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
 
 from post import controllers
+from post.events import PostSource, ReplySource
+from utils.etag import etag_matches
 from utils.jwt import login_required
 from utils.post_params_check import post_params_check
+from utils.pubsub import get_events_settings
 from utils.reply_post_params_check import reply_post_params_check
+from utils.response_cache import get_response_cache
+from utils.sse import (
+    EventStreamRenderer,
+    TooManyStreams,
+    event_stream,
+    last_event_id,
+    open_subscription,
+    sse_response,
+)
+
+REPLY_PAGE_SIZE = 50
+REPLY_PAGE_SIZE_MAX = 200
+REPLY_STREAM_CHUNK_SIZE = 500
+
+
+def etag_response(request, entry):
+    """
+    根据缓存条目返回响应，If-None-Match 匹配时返回 304
+    """
+    headers = {"ETag": entry["etag"]} if entry["etag"] else None
+    if etag_matches(request, entry["etag"]):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(entry["data"], status=status.HTTP_200_OK, headers=headers)
 
 
 class PostListView(APIView):
@@ -27,6 +58,15 @@ class PostListView(APIView):
                         "type": "boolean",
                         "description": "是否按回复数排序",
                     },
+                    "cursor": {
+                        "type": "string",
+                        "description": "游标分页，传空字符串获取第一页，之后传上一页的nextCursor；"
+                        "提供时忽略page",
+                    },
+                    "includeTotal": {
+                        "type": "boolean",
+                        "description": "是否返回帖子总数，默认为true",
+                    },
                 },
                 "required": [],
             }
@@ -39,7 +79,15 @@ class PostListView(APIView):
                     "properties": {
                         "page": {"type": "integer", "description": "页码"},
                         "size": {"type": "integer", "description": "每页数量"},
-                        "total": {"type": "integer", "description": "总数"},
+                        "total": {
+                            "type": "integer",
+                            "description": "总数，includeTotal为false时不返回",
+                        },
+                        "nextCursor": {
+                            "type": "string",
+                            "nullable": True,
+                            "description": "下一页游标，仅游标分页返回，没有下一页时为null",
+                        },
                         "posts": {
                             "type": "array",
                             "items": {
@@ -75,6 +123,10 @@ class PostListView(APIView):
                                         "format": "date-time",
                                         "description": "最新回复时间",
                                     },
+                                    "replyCount": {
+                                        "type": "integer",
+                                        "description": "回复数",
+                                    },
                                     "created": {
                                         "type": "string",
                                         "format": "date-time",
@@ -91,32 +143,65 @@ class PostListView(APIView):
                     },
                 },
             ),
+            304: OpenApiResponse(description="If-None-Match 与 ETag 匹配，内容未修改"),
+            400: OpenApiResponse(description="游标不合法"),
             500: OpenApiResponse(description="服务器内部错误"),
         },
         description="获取帖子列表",
         summary="获取帖子列表",
         operation_id="get_post_list",
     )
-    @login_required
+    @login_required(trust_claims=True)
     def get(self, request, *args, **kwargs):
         page = int(request.GET.get("page", 1))
         size = int(request.GET.get("size", 10))
         user_id = request.GET.get("userId", 0)
         order_by_reply = bool(request.GET.get("orderByReply", False))
+        include_total = request.GET.get("includeTotal", "true").lower() not in ("false", "0")
+        cursor = request.GET.get("cursor")
+        if cursor and not controllers.check_post_cursor(cursor):
+            return Response({"message": "invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
 
-        post_list, count, result = controllers.get_post_list(user_id, page, size, order_by_reply)
-        if result:
-            return Response(
-                {
-                    "posts": post_list,
-                    "page": page,
-                    "size": size,
-                    "total": count,
-                },
-                status=status.HTTP_200_OK,
+        params = (user_id, page, size, order_by_reply, include_total, cursor)
+        response_cache = get_response_cache()
+        cache_key = response_cache.key("post_list", *params)
+        entry = response_cache.get(cache_key)
+        if entry is None:
+            etag = controllers.get_post_list_etag(*params)
+            if etag_matches(request, etag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+            data = self.get_post_list_data(*params)
+            if data is None:
+                return Response({"message": "error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            entry = {"etag": etag, "data": data}
+            response_cache.set(cache_key, entry)
+        return etag_response(request, entry)
+
+    @staticmethod
+    def get_post_list_data(user_id, page, size, order_by_reply, include_total, cursor):
+        """
+        查询帖子列表的响应数据，cursor 不为 None 时使用游标分页，失败时返回 None
+        """
+        if cursor is not None:
+            post_list, next_cursor, result = controllers.get_post_list_by_cursor(
+                user_id, cursor, size, order_by_reply
             )
-        else:
-            return Response({"message": "error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            if not result:
+                return None
+            data = {"posts": post_list, "size": size, "nextCursor": next_cursor}
+            if include_total:
+                data["total"] = controllers.get_post_count(user_id)
+            return data
+
+        post_list, count, result = controllers.get_post_list(
+            user_id, page, size, order_by_reply, include_total
+        )
+        if not result:
+            return None
+        data = {"posts": post_list, "page": page, "size": size}
+        if include_total:
+            data["total"] = count
+        return data
 
     @extend_schema(
         request={
@@ -161,7 +246,7 @@ class PostListView(APIView):
                 )
 
             post_id, result = controllers.create_post(
-                content["title"], content["content"], request.user.id
+                content["title"], content["content"], request.user.id, request.user.nickname
             )
 
             if result:
@@ -185,6 +270,28 @@ class PostDetailView(APIView):
                 location=OpenApiParameter.PATH,
                 description="帖子的id",
             ),
+            OpenApiParameter(
+                name="replyCursor",
+                type=str,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="回帖游标，传空字符串获取第一页，之后传上一页的nextReplyCursor",
+            ),
+            OpenApiParameter(
+                name="replySize",
+                type=int,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description=f"每页回帖数量，提供replyCursor或replySize时分页返回回帖，"
+                f"默认为{REPLY_PAGE_SIZE}，最大为{REPLY_PAGE_SIZE_MAX}",
+            ),
+            OpenApiParameter(
+                name="stream",
+                type=bool,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="为true时以流式JSON逐批输出全部回帖，忽略分页参数",
+            ),
         ],
         request=None,
         responses={
@@ -198,6 +305,7 @@ class PostDetailView(APIView):
                         "nickname": {"type": "string", "description": "用户昵称"},
                         "title": {"type": "string", "description": "帖子标题"},
                         "content": {"type": "string", "description": "帖子内容"},
+                        "replyCount": {"type": "integer", "description": "回复数"},
                         "created": {
                             "type": "string",
                             "format": "date-time",
@@ -248,9 +356,15 @@ class PostDetailView(APIView):
                             },
                             "description": "回帖列表，创建时间升序",
                         },
+                        "nextReplyCursor": {
+                            "type": "string",
+                            "nullable": True,
+                            "description": "下一页回帖游标，仅分页时返回，没有下一页时为null",
+                        },
                     },
                 },
             ),
+            304: OpenApiResponse(description="If-None-Match 与 ETag 匹配，内容未修改"),
             404: OpenApiResponse(description="未找到帖子"),
             500: OpenApiResponse(description="服务器内部错误"),
         },
@@ -258,13 +372,59 @@ class PostDetailView(APIView):
         summary="获取帖子详情",
         operation_id="get_post_detail",
     )
-    @login_required
+    @login_required(trust_claims=True)
     def get(self, request, postId, *args, **kwargs):
-        detail, result = controllers.get_post_detail(postId)
-        if result:
-            return Response(detail, status=status.HTTP_200_OK)
-        else:
+        if request.GET.get("stream", "false").lower() in ("true", "1"):
+            return self.stream_post_detail(request, postId)
+
+        reply_cursor = request.GET.get("replyCursor")
+        reply_size = request.GET.get("replySize")
+        if reply_cursor and not controllers.check_reply_cursor(reply_cursor):
+            return Response({"message": "invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        if reply_cursor is not None or reply_size is not None:
+            reply_size = min(max(int(reply_size or REPLY_PAGE_SIZE), 1), REPLY_PAGE_SIZE_MAX)
+
+        response_cache = get_response_cache()
+        cache_key = response_cache.key("post_detail", postId, reply_cursor, reply_size)
+        entry = response_cache.get(cache_key)
+        if entry is None:
+            etag = controllers.get_post_detail_etag(postId)
+            if etag_matches(request, etag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+            detail, result = controllers.get_post_detail(postId, reply_cursor, reply_size)
+            if not result:
+                return Response({"message": "error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            entry = {"etag": etag, "data": detail}
+            response_cache.set(cache_key, entry)
+        return etag_response(request, entry)
+
+    @staticmethod
+    def stream_post_detail(request, post_id):
+        """
+        以流式 JSON 输出帖子详情，回帖通过 iterator 逐批读取，内存占用与回帖数量无关
+        """
+        etag = controllers.get_post_detail_etag(post_id)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        post, result = controllers.get_post(post_id)
+        if not result:
             return Response({"message": "error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if post is None:
+            return Response({"message": "not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        def dumps(obj):
+            return json.dumps(obj, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":"))
+
+        def generate():
+            yield dumps(post)[:-1] + ',"reply":['
+            for i, reply in enumerate(controllers.iter_replies(post_id, REPLY_STREAM_CHUNK_SIZE)):
+                yield ("," if i else "") + dumps(reply)
+            yield "]}"
+
+        response = StreamingHttpResponse(generate(), content_type="application/json")
+        if etag:
+            response["ETag"] = etag
+        return response
 
     @extend_schema(
         parameters=[
@@ -315,18 +475,15 @@ class PostDetailView(APIView):
                     {"message": "invalid arguments: " + key},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            check = controllers.check_post(postId, request.user.id)
-            if not check:
-                return Response({"message": "not found"}, status=status.HTTP_404_NOT_FOUND)
-
-            result = controllers.update_post(
+            found, result = controllers.update_post(
                 content["title"], content["content"], postId, request.user.id
             )
 
-            if result:
-                return Response({"message": "ok"}, status=status.HTTP_200_OK)
-            else:
+            if not result:
                 return Response({"message": "error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            if not found:
+                return Response({"message": "not found"}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"message": "ok"}, status=status.HTTP_200_OK)
         except KeyError:
             return Response({"message": "bad arguments"}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -377,20 +534,19 @@ def reply_post(request, postId):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        if "replyId" in content:
-            reply_id = content["replyId"]
-            check = controllers.check_reply(postId, reply_id)
-            if not check:
-                return Response({"message": "not found"}, status=status.HTTP_404_NOT_FOUND)
-        else:
-            reply_id = 0
-
-        result = controllers.create_reply(content["content"], request.user.id, postId, reply_id)
+        reply_id, result = controllers.create_reply(
+            content["content"],
+            request.user.id,
+            postId,
+            int(content.get("replyId", 0)),
+            request.user.nickname,
+        )
 
-        if result:
-            return Response({"message": "ok"}, status=status.HTTP_200_OK)
-        else:
+        if not result:
             return Response({"message": "error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if not reply_id:
+            return Response({"message": "not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"message": "ok"}, status=status.HTTP_200_OK)
     except KeyError:
         return Response({"message": "bad arguments"}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -443,15 +599,214 @@ def modify_reply(request, postId, replyId):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        check = controllers.check_self_reply(replyId, request.user.id)
-        if not check:
-            return Response({"message": "not found"}, status=status.HTTP_404_NOT_FOUND)
-
-        result = controllers.update_reply(content["content"], request.user.id, postId, replyId)
+        found, result = controllers.update_reply(
+            content["content"], request.user.id, postId, replyId, request.user.nickname
+        )
 
-        if result:
-            return Response({"message": "ok"}, status=status.HTTP_200_OK)
-        else:
+        if not result:
             return Response({"message": "error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if not found:
+            return Response({"message": "not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"message": "ok"}, status=status.HTTP_200_OK)
     except KeyError:
         return Response({"message": "bad arguments"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+REPLY_TREE_SCHEMA = OpenApiResponse(
+    description="获取回帖树成功",
+    response={
+        "type": "object",
+        "properties": {
+            "replies": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "integer", "description": "回帖ID"},
+                        "userId": {"type": "integer", "description": "用户ID"},
+                        "nickname": {"type": "string", "description": "用户昵称"},
+                        "postId": {"type": "integer", "description": "帖子ID"},
+                        "replyId": {
+                            "type": "integer",
+                            "description": "回复目标回复Id，0表示回复主楼",
+                        },
+                        "depth": {
+                            "type": "integer",
+                            "description": "回帖深度，0表示回复主楼",
+                        },
+                        "content": {"type": "string", "description": "回帖内容"},
+                        "created": {
+                            "type": "string",
+                            "format": "date-time",
+                            "description": "回帖创建时间",
+                        },
+                        "updated": {
+                            "type": "string",
+                            "format": "date-time",
+                            "description": "回帖更新时间",
+                        },
+                    },
+                },
+                "description": "回帖树的先序遍历，同一层按创建顺序排列",
+            },
+        },
+    },
+)
+
+
+def reply_tree_response(post_id, reply_id):
+    response_cache = get_response_cache()
+    cache_key = response_cache.key("reply_tree", post_id, reply_id)
+    replies = response_cache.get(cache_key)
+    if replies is None:
+        replies, result = controllers.get_reply_tree(post_id, reply_id)
+        if not result:
+            return Response({"message": "error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if replies is None:
+            return Response({"message": "not found"}, status=status.HTTP_404_NOT_FOUND)
+        response_cache.set(cache_key, replies)
+    return Response({"replies": replies}, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            name="postId",
+            type=int,
+            location=OpenApiParameter.PATH,
+            description="帖子的id",
+        ),
+    ],
+    request=None,
+    responses={
+        200: REPLY_TREE_SCHEMA,
+        500: OpenApiResponse(description="服务器内部错误"),
+    },
+    description="获取帖子的完整回帖树",
+    summary="获取回帖树",
+)
+@api_view(["GET"])
+@login_required(trust_claims=True)
+def get_reply_tree(request, postId):
+    return reply_tree_response(postId, 0)
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            name="postId",
+            type=int,
+            location=OpenApiParameter.PATH,
+            description="帖子的id",
+        ),
+        OpenApiParameter(
+            name="replyId",
+            type=int,
+            location=OpenApiParameter.PATH,
+            description="子树根回帖的id",
+        ),
+    ],
+    request=None,
+    responses={
+        200: REPLY_TREE_SCHEMA,
+        404: OpenApiResponse(description="未找到回复"),
+        500: OpenApiResponse(description="服务器内部错误"),
+    },
+    description="获取某条回帖及其所有后代回帖",
+    summary="获取回帖子树",
+)
+@api_view(["GET"])
+@login_required(trust_claims=True)
+def get_reply_subtree(request, postId, replyId):
+    return reply_tree_response(postId, replyId)
+
+
+EVENTS_PARAMETERS = [
+    OpenApiParameter(
+        name="Last-Event-ID",
+        type=int,
+        location=OpenApiParameter.HEADER,
+        description="已收到的最后一个事件id，断线重连时补发之后的事件；EventSource 会自动发送",
+        required=False,
+    ),
+    OpenApiParameter(
+        name="lastEventId",
+        type=int,
+        location=OpenApiParameter.QUERY,
+        description="同 Last-Event-ID，用于无法设置请求头的客户端",
+        required=False,
+    ),
+]
+
+
+def events_response(name, source, request):
+    """
+    打开 SSE 流，流会在 EVENTS["MAX_DURATION"] 秒后结束，客户端应带着 Last-Event-ID 重连
+    """
+    try:
+        cursor = last_event_id(request)
+    except ValueError:
+        return Response({"message": "invalid Last-Event-ID"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        subscription, initial = open_subscription(name, source, cursor, sync=True)
+    except TooManyStreams:
+        # 每个流占用一个请求线程，名额已满时拒绝，避免 worker 不再处理普通请求
+        return Response(
+            {"message": "too many event streams"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(max(1, get_events_settings()["RETRY_MS"] // 1000))},
+        )
+    return sse_response(event_stream(subscription, initial), subscription)
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            name="postId",
+            type=int,
+            location=OpenApiParameter.PATH,
+            description="帖子的id",
+        ),
+        *EVENTS_PARAMETERS,
+    ],
+    request=None,
+    responses={
+        (200, "text/event-stream"): OpenApiResponse(
+            description="SSE 流，每个新回帖是一个 reply 事件，id 为回帖id，"
+            "data 与帖子详情中的回帖相同；reset 事件表示错过的事件过多，应重新获取帖子详情"
+        ),
+        400: OpenApiResponse(description="Last-Event-ID 不合法"),
+        503: OpenApiResponse(description="本 worker 的事件流已满，稍后重试"),
+        404: OpenApiResponse(description="未找到帖子"),
+    },
+    description="订阅帖子的新回帖",
+    summary="订阅帖子的新回帖",
+)
+@api_view(["GET"])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+@login_required(trust_claims=True)
+def post_events(request, postId):
+    if not controllers.check_post_exists(postId):
+        return Response({"message": "not found"}, status=status.HTTP_404_NOT_FOUND)
+    return events_response(controllers.post_channel(postId), ReplySource(postId), request)
+
+
+@extend_schema(
+    parameters=EVENTS_PARAMETERS,
+    request=None,
+    responses={
+        (200, "text/event-stream"): OpenApiResponse(
+            description="SSE 流，每个新帖子是一个 post 事件，id 为帖子id，"
+            "data 与帖子列表中的帖子相同；reset 事件表示错过的事件过多，应重新获取帖子列表"
+        ),
+        400: OpenApiResponse(description="Last-Event-ID 不合法"),
+        503: OpenApiResponse(description="本 worker 的事件流已满，稍后重试"),
+    },
+    description="订阅全站的新帖子",
+    summary="订阅新帖子",
+)
+@api_view(["GET"])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+@login_required(trust_claims=True)
+def feed_events(request):
+    return events_response(controllers.FEED_CHANNEL, PostSource(), request)
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class SearchConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "search"
+
+    def ready(self):
+        from .backends import create_fts_table
+
+        # FTS5 虚拟表无法由模型描述，在 migrate 之后创建
+        post_migrate.connect(create_fts_table, sender=self)
@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+"""
+倒排索引后端
+
+fts5：SQLite FTS5 虚拟表，写入的是切分好的词元（以空格分隔），排序使用内置的 bm25()
+table：普通表，用于其他数据库。SearchTermBlock 按文档 id 分块保存倒排表，每个词元每块一行，
+       文档 id 与词频以差分 varint 编码存储；SearchPosting 保存词元在文档中的位置，
+       只在短语查询时读取；BM25 在 Python 中计算
+
+查询是短语列表，文档需要包含全部短语，短语内的词元位置必须相邻；
+以 PREFIX 结尾的词元是前缀查询，匹配以它开头的全部词元
+
+两个后端的文档键相同：帖子为 id * 2，回帖为 id * 2 + 1
+"""
+
+import heapq
+import math
+import time
+from collections import Counter
+
+from django.db import connection, connections, transaction
+from django.db.models import Avg, Count, Sum
+
+from .models import SearchDocument, SearchPosting, SearchTermBlock
+from .postings import decode_postings, decode_varints, encode_postings, encode_varints
+from .tokenizer import PREFIX, is_prefix
+
+FTS_TABLE = "search_fts"
+
+# 标题的权重
+TITLE_WEIGHT = 2
+# table 后端倒排表每块包含的连续文档 id 数量
+BLOCK_SIZE = 128
+# IN 查询每批的参数个数
+QUERY_CHUNK = 500
+# 求交集后候选文档的上限，超过时只对词频之和最大的文档计算得分
+MAX_CANDIDATES = 10000
+# BM25 使用的文档总数与平均长度的缓存时间（秒）
+STATS_TTL = 60
+# BM25 参数
+K1 = 1.2
+B = 0.75
+
+
+def document_key(kind, ref):
+    return ref * 2 + (1 if kind == "reply" else 0)
+
+
+def parse_document_key(key):
+    return ("reply" if key % 2 else "post"), key // 2
+
+
+def fts5_available(using="default"):
+    conn = connections[using]
+    if conn.vendor != "sqlite":
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any("FTS5" in row[0] for row in cursor.fetchall())
+
+
+def create_fts_table(using="default", **kwargs):
+    """
+    post_migrate 信号处理函数，在支持 FTS5 的 SQLite 数据库上创建虚拟表
+    """
+    if not fts5_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(title, body)")
+
+
+class Fts5Backend:
+    name = "fts5"
+
+    def index(self, key, title_tokens, body_tokens):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [key])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (%s, %s, %s)",
+                [key, " ".join(title_tokens), " ".join(body_tokens)],
+            )
+
+    def build(self, documents):
+        """
+        向空索引批量写入文档
+        :param documents: 可迭代的 (文档键, 标题词元, 正文词元)
+        """
+        for key, title_tokens, body_tokens in documents:
+            self.index(key, title_tokens, body_tokens)
+
+    def remove(self, key):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [key])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+    def search(self, phrases, size, after=None):
+        """
+        :param phrases: 查询短语，每个短语是位置相邻的词元列表
+        :param after: (score, key) 上一页最后一条结果
+        :return: [(key, score)]，按得分降序、文档键升序
+        """
+        match = " AND ".join(self._match_phrase(phrase) for phrase in phrases)
+        sql = (
+            f"SELECT key, score FROM (SELECT rowid AS key, -bm25({FTS_TABLE}, "
+            f"{float(TITLE_WEIGHT)}, 1.0) AS score FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)"
+        )
+        params = [match]
+        if after is not None:
+            sql += " WHERE score < %s OR (score = %s AND key > %s)"
+            params += [after[0], after[0], after[1]]
+        sql += " ORDER BY score DESC, key LIMIT %s"
+        params.append(size)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    @staticmethod
+    def _match_phrase(phrase):
+        if len(phrase) == 1 and is_prefix(phrase[0]):
+            return '"' + phrase[0][: -len(PREFIX)].replace('"', '""') + '"*'
+        return '"' + " ".join(phrase).replace('"', '""') + '"'
+
+
+def _chunks(values):
+    for i in range(0, len(values), QUERY_CHUNK):
+        yield values[i : i + QUERY_CHUNK]
+
+
+def _decode_block(block, documents, frequencies):
+    """
+    :return: {文档 id: 词频}
+    """
+    base = block * BLOCK_SIZE
+    return {
+        base + offset: frequency
+        for offset, frequency in zip(decode_postings(documents), decode_varints(frequencies))
+    }
+
+
+def _encode_block(block, postings):
+    """
+    :param postings: {文档 id: 词频}
+    :return: (编码的文档 id, 编码的词频)
+    """
+    base = block * BLOCK_SIZE
+    document_ids = sorted(postings)
+    return (
+        encode_postings(d - base for d in document_ids),
+        encode_varints(postings[d] for d in document_ids),
+    )
+
+
+def _lock_blocks(keys):
+    """
+    按 (词元, 块号) 顺序锁定并读取已存在的块，词元较多（批量重建）时分批查询
+    :return: {(词元, 块号): (id, 编码的文档 id, 编码的词频)}
+    """
+    keys = set(keys)
+    blocks = {block for _, block in keys}
+    result = {}
+    for terms in _chunks(sorted({term for term, _ in keys})):
+        rows = (
+            SearchTermBlock.objects.select_for_update()
+            .filter(term__in=terms, block__in=blocks)
+            .order_by("term", "block")
+            .values_list("term", "block", "id", "documents", "frequencies")
+        )
+        result.update(((term, block), rest) for term, block, *rest in rows if (term, block) in keys)
+    return result
+
+
+class TableBackend:
+    name = "table"
+
+    def __init__(self):
+        # (过期时间, 文档总数, 平均文档长度)
+        self._cached_stats = None
+
+    def index(self, key, title_tokens, body_tokens):
+        document, frequencies, positions = self._document(key, title_tokens, body_tokens)
+        old_terms = set(
+            SearchPosting.objects.filter(document=document).values_list("term", flat=True)
+        )
+        SearchPosting.objects.filter(document=document).delete()
+        SearchPosting.objects.bulk_create(
+            [
+                SearchPosting(
+                    term=term, document=document, positions=encode_postings(positions[term])
+                )
+                for term in frequencies
+            ]
+        )
+        self._update_terms({document.id: frequencies}, {document.id: old_terms - set(frequencies)})
+        self._cached_stats = None
+
+    def build(self, documents, batch_size=1000):
+        """
+        向空索引批量写入文档，每批合并一次词元的倒排表
+        :param documents: 可迭代的 (文档键, 标题词元, 正文词元)
+        """
+        batch = []
+        for key, title_tokens, body_tokens in documents:
+            batch.append(self._document(key, title_tokens, body_tokens))
+            if len(batch) >= batch_size:
+                self._build_batch(batch)
+                batch = []
+        if batch:
+            self._build_batch(batch)
+
+    def _build_batch(self, batch):
+        SearchPosting.objects.bulk_create(
+            [
+                SearchPosting(
+                    term=term, document=document, positions=encode_postings(positions[term])
+                )
+                for document, frequencies, positions in batch
+                for term in frequencies
+            ]
+        )
+        self._update_terms({document.id: frequencies for document, frequencies, _ in batch}, {})
+        self._cached_stats = None
+
+    @staticmethod
+    def _document(key, title_tokens, body_tokens):
+        """
+        写入文档行
+        :return: (文档, {词元: 词频}, {词元: [位置]})
+        """
+        # 与 FTS5 的 bm25() 一致：词频按列加权，文档长度为各列词元数之和
+        frequencies = Counter(list(title_tokens) * TITLE_WEIGHT + list(body_tokens))
+        # 正文的位置从标题之后空出一位开始，短语不会跨越标题与正文
+        positions = {}
+        for position, token in enumerate(title_tokens):
+            positions.setdefault(token, []).append(position)
+        for position, token in enumerate(body_tokens, len(title_tokens) + 1):
+            positions.setdefault(token, []).append(position)
+
+        document, _ = SearchDocument.objects.update_or_create(
+            key=key, defaults={"length": len(title_tokens) + len(body_tokens)}
+        )
+        return document, frequencies, positions
+
+    def remove(self, key):
+        document = SearchDocument.objects.filter(key=key).first()
+        if document is None:
+            return
+        terms = set(SearchPosting.objects.filter(document=document).values_list("term", flat=True))
+        self._update_terms({}, {document.id: terms})
+        document.delete()
+        self._cached_stats = None
+
+    def clear(self):
+        SearchTermBlock.objects.all().delete()
+        SearchDocument.objects.all().delete()
+        self._cached_stats = None
+
+    @staticmethod
+    def _update_terms(added, removed):
+        """
+        修改文档所在块的倒排表：读出整块、合并后重新编码写回
+        缺少的块先以 INSERT 忽略冲突的方式创建，再按 (词元, 块号) 顺序加锁，并发写入同一块时依次执行
+        :param added: {文档 id: {词元: 词频}}
+        :param removed: {文档 id: 需要删除的词元}
+        """
+        changes = {}
+        for document_id, frequencies in added.items():
+            for term, frequency in frequencies.items():
+                key = (term, document_id // BLOCK_SIZE)
+                changes.setdefault(key, {})[document_id] = frequency
+        for document_id, terms in removed.items():
+            for term in terms:
+                changes.setdefault((term, document_id // BLOCK_SIZE), {})[document_id] = None
+        if not changes:
+            return
+
+        with transaction.atomic():
+            rows = _lock_blocks(changes)
+            missing = [
+                key for key, change in changes.items() if key not in rows and any(change.values())
+            ]
+            if missing:
+                SearchTermBlock.objects.bulk_create(
+                    [SearchTermBlock(term=term, block=block) for term, block in missing],
+                    ignore_conflicts=True,
+                )
+                rows.update(_lock_blocks(missing))
+
+            updated, emptied = [], []
+            for (term, block), (row_id, documents, frequencies) in rows.items():
+                postings = _decode_block(block, documents, frequencies)
+                for document_id, frequency in changes[term, block].items():
+                    if frequency is None:
+                        postings.pop(document_id, None)
+                    else:
+                        postings[document_id] = frequency
+                if postings:
+                    updated.append((len(postings), *_encode_block(block, postings), row_id))
+                else:
+                    emptied.append(row_id)
+            # bulk_update 生成的 CASE WHEN 语句在一行有上百个词元时编译很慢，直接批量执行 UPDATE
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"UPDATE {SearchTermBlock._meta.db_table} SET count = %s, documents = %s, "
+                    "frequencies = %s WHERE id = %s",
+                    updated,
+                )
+            SearchTermBlock.objects.filter(id__in=emptied).delete()
+
+    def search(self, phrases, size, after=None):
+        """
+        从包含文档最少的词元开始求交集：先解码它的全部块，其余词元只读取候选文档所在的块；
+        短语位置与文档长度按候选文档分批查询
+        """
+        total, average_length = self._stats()
+        if not total:
+            return []
+
+        terms = {term for phrase in phrases for term in phrase}
+        frequencies = self._document_frequencies(terms)
+        if not all(frequencies.values()):
+            return []
+        ordered = sorted(terms, key=lambda term: (frequencies[term], term))
+
+        postings = {ordered[0]: self._postings(ordered[0])}
+        candidates = set(postings[ordered[0]])
+        for term in ordered[1:]:
+            if not candidates:
+                return []
+            postings[term] = self._postings(term, {d // BLOCK_SIZE for d in candidates})
+            candidates &= set(postings[term])
+        if len(candidates) > MAX_CANDIDATES:
+            # 极常见的词元：只对词频之和最大的候选文档计算得分
+            candidates = set(
+                heapq.nlargest(
+                    MAX_CANDIDATES,
+                    candidates,
+                    key=lambda d: (sum(p[d] for p in postings.values()), -d),
+                )
+            )
+        multi_term = [phrase for phrase in phrases if len(phrase) > 1]
+        if candidates and multi_term:
+            candidates = self._phrase_matches(candidates, multi_term)
+
+        hits = []
+        for chunk in _chunks(sorted(candidates)):
+            documents = SearchDocument.objects.filter(id__in=chunk)
+            for document_id, key, length in documents.values_list("id", "key", "length"):
+                score = 0.0
+                for term, term_postings in postings.items():
+                    df = frequencies[term]
+                    tf = term_postings[document_id]
+                    idf = math.log((total - df + 0.5) / (df + 0.5) + 1)
+                    score += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average_length))
+                if after is None or score < after[0] or (score == after[0] and key > after[1]):
+                    hits.append((key, score))
+
+        return heapq.nsmallest(size, hits, key=lambda hit: (-hit[1], hit[0]))
+
+    def _stats(self):
+        """
+        :return: (文档总数, 平均文档长度)，缓存 STATS_TTL 秒，本进程写入索引后重新统计
+        """
+        stats = self._cached_stats
+        if stats is None or stats[0] < time.monotonic():
+            aggregate = SearchDocument.objects.aggregate(total=Count("id"), average=Avg("length"))
+            stats = (
+                time.monotonic() + STATS_TTL,
+                aggregate["total"],
+                aggregate["average"] or 1,
+            )
+            self._cached_stats = stats
+        return stats[1], stats[2]
+
+    @staticmethod
+    def _document_frequencies(terms):
+        """
+        各块的文档数之和，不解码倒排表；前缀查询取匹配词元的文档数之和（上界）
+        :return: {词元: 包含词元的文档数}
+        """
+        frequencies = dict.fromkeys(terms, 0)
+        exact = [term for term in terms if not is_prefix(term)]
+        rows = (
+            SearchTermBlock.objects.filter(term__in=exact).values("term").annotate(df=Sum("count"))
+        )
+        for row in rows:
+            frequencies[row["term"]] = row["df"]
+        for term in terms:
+            if is_prefix(term):
+                rows = SearchTermBlock.objects.filter(term__startswith=term[: -len(PREFIX)])
+                frequencies[term] = rows.aggregate(df=Sum("count"))["df"] or 0
+        return frequencies
+
+    @staticmethod
+    def _postings(term, blocks=None):
+        """
+        解码词元的倒排表，前缀查询合并全部匹配词元的词频
+        :param blocks: 只读取这些块，None 表示全部
+        :return: {文档 id: 词频}
+        """
+        if is_prefix(term):
+            rows = SearchTermBlock.objects.filter(term__startswith=term[: -len(PREFIX)])
+        else:
+            rows = SearchTermBlock.objects.filter(term=term)
+        querysets = (
+            [rows]
+            if blocks is None
+            else [rows.filter(block__in=c) for c in _chunks(sorted(blocks))]
+        )
+        postings = {}
+        for queryset in querysets:
+            for block, documents, frequencies in queryset.values_list(
+                "block", "documents", "frequencies"
+            ):
+                for document_id, frequency in _decode_block(block, documents, frequencies).items():
+                    postings[document_id] = postings.get(document_id, 0) + frequency
+        return postings
+
+    @classmethod
+    def _phrase_matches(cls, candidates, phrases):
+        """
+        :return: 全部短语的词元位置都相邻的候选文档
+        """
+        terms = {term for phrase in phrases for term in phrase}
+        positions = {}
+        for chunk in _chunks(sorted(candidates)):
+            rows = SearchPosting.objects.filter(document_id__in=chunk, term__in=terms)
+            for term, document_id, data in rows.values_list("term", "document_id", "positions"):
+                positions[term, document_id] = data
+        return {
+            document_id
+            for document_id in candidates
+            if all(cls._adjacent(positions, phrase, document_id) for phrase in phrases)
+        }
+
+    @staticmethod
+    def _adjacent(positions, phrase, document_id):
+        """
+        短语中第 i 个词元出现在位置 p + i
+        """
+        starts = set(decode_postings(positions[phrase[0], document_id]))
+        for offset, term in enumerate(phrase[1:], 1):
+            starts &= {p - offset for p in decode_postings(positions[term, document_id])}
+            if not starts:
+                return False
+        return True
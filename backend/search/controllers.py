@@ -0,0 +1,144 @@
+import threading
+
+from django.conf import settings
+from django.db.models import F
+
+from post.models import Post, Reply
+from utils.cursor import decode_cursor, encode_cursor
+
+from .backends import Fts5Backend, TableBackend, document_key, fts5_available, parse_document_key
+from .highlight import highlight
+from .tokenizer import tokenize, tokenize_query
+
+_backend = None
+_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    根据 SEARCH_BACKEND 选择索引后端，auto 表示 SQLite 支持 FTS5 时使用 fts5，否则使用 table
+    """
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                name = getattr(settings, "SEARCH_BACKEND", "auto")
+                if name == "auto":
+                    name = "fts5" if fts5_available() else "table"
+                _backend = Fts5Backend() if name == "fts5" else TableBackend()
+    return _backend
+
+
+def index_post(post_id, title, content):
+    """
+    写入或更新帖子的索引，需要与帖子的写入在同一事务中调用
+    """
+    get_backend().index(document_key("post", post_id), tokenize(title), tokenize(content))
+
+
+def index_reply(reply_id, content):
+    get_backend().index(document_key("reply", reply_id), [], tokenize(content))
+
+
+def rebuild_index():
+    """
+    清空并重建全部索引
+    :return: 写入索引的文档数量
+    """
+    count = 0
+
+    def documents():
+        nonlocal count
+        posts = Post.objects.values_list("id", "title", "content")
+        for post_id, title, content in posts.iterator():
+            count += 1
+            yield document_key("post", post_id), tokenize(title), tokenize(content)
+        for reply_id, content in Reply.objects.values_list("id", "content").iterator():
+            count += 1
+            yield document_key("reply", reply_id), [], tokenize(content)
+
+    backend = get_backend()
+    backend.clear()
+    backend.build(documents())
+    return count
+
+
+def check_search_cursor(cursor):
+    return decode_cursor(cursor, float, int) is not None
+
+
+def search(query, size=10, cursor=""):
+    """
+    全文搜索帖子与回帖，按 BM25 得分降序
+    :param cursor: str 上一页返回的 nextCursor，为空表示第一页
+    :return: (结果列表, 下一页游标, 是否成功)
+    """
+    try:
+        phrases = tokenize_query(query)
+        if not phrases:
+            return [], None, True
+        terms = {term for phrase in phrases for term in phrase}
+        after = decode_cursor(cursor, float, int) if cursor else None
+
+        hits = get_backend().search(phrases, size + 1, after)
+        next_cursor = None
+        if len(hits) > size:
+            hits = hits[:size]
+            next_cursor = encode_cursor(hits[-1][1], hits[-1][0])
+
+        return _hydrate(hits, terms), next_cursor, True
+    except Exception as e:
+        print(e)
+        return [], None, False
+
+
+def _hydrate(hits, terms):
+    """
+    读取命中文档的内容并生成高亮片段，索引中已不存在于数据库的文档会被跳过
+    """
+    refs = {"post": [], "reply": []}
+    for key, _ in hits:
+        kind, ref = parse_document_key(key)
+        refs[kind].append(ref)
+
+    replies = {
+        r["id"]: r
+        for r in Reply.objects.filter(id__in=refs["reply"]).values(
+            "id", "content", "nickname", "post_id", userId=F("user_id")
+        )
+    }
+    post_ids = set(refs["post"]) | {r["post_id"] for r in replies.values()}
+    posts = Post.objects.only("id", "title", "content", "nickname", "user_id").in_bulk(post_ids)
+
+    results = []
+    for key, score in hits:
+        kind, ref = parse_document_key(key)
+        if kind == "post" and ref in posts:
+            post = posts[ref]
+            results.append(
+                {
+                    "type": "post",
+                    "id": post.id,
+                    "postId": post.id,
+                    "userId": post.user_id,
+                    "nickname": post.nickname,
+                    "title": highlight(post.title, terms),
+                    "content": highlight(post.content, terms),
+                    "score": score,
+                }
+            )
+        elif kind == "reply" and ref in replies and replies[ref]["post_id"] in posts:
+            reply = replies[ref]
+            results.append(
+                {
+                    "type": "reply",
+                    "id": reply["id"],
+                    "postId": reply["post_id"],
+                    "userId": reply["userId"],
+                    "nickname": reply["nickname"],
+                    "title": highlight(posts[reply["post_id"]].title, terms),
+                    "content": highlight(reply["content"], terms),
+                    "score": score,
+                }
+            )
+    return results
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from django.utils.html import escape
+
+from .tokenizer import PREFIX, is_prefix, tokenize_spans
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+
+
+def highlight(text, terms, width=120):
+    """
+    截取包含命中词元的片段，并用 <mark> 标记命中位置，其余内容经过 HTML 转义
+    :param terms: set 查询的词元
+    :param width: 片段的最大长度
+    """
+    text = text or ""
+    prefixes = tuple(term[: -len(PREFIX)] for term in terms if is_prefix(term))
+    spans = []
+    for token, start, end in tokenize_spans(text):
+        if token not in terms:
+            # 前缀查询只标记前缀部分
+            prefix = next((p for p in prefixes if token.startswith(p)), None)
+            if prefix is None:
+                continue
+            end = start + len(prefix)
+        if spans and start <= spans[-1][1]:
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([start, end])
+
+    begin = max(0, spans[0][0] - width // 4) if spans else 0
+    finish = min(len(text), begin + width)
+
+    pieces = ["…"] if begin > 0 else []
+    position = begin
+    for start, end in spans:
+        if start >= finish:
+            break
+        pieces.append(escape(text[position:start]))
+        pieces.append(HIGHLIGHT_START + escape(text[start : min(end, finish)]) + HIGHLIGHT_END)
+        position = min(end, finish)
+    pieces.append(escape(text[position:finish]))
+    if finish < len(text):
+        pieces.append("…")
+    return "".join(pieces)
@@ -0,0 +1,45 @@
+from django.db import models
+
+
+# Create your models here.
+class SearchDocument(models.Model):
+    """
+    倒排索引中的文档（帖子或回帖），用于非 SQLite 数据库的纯 Python 索引
+    """
+
+    key = models.BigIntegerField(unique=True, verbose_name="文档键")
+    length = models.IntegerField(default=0, verbose_name="词元数量")
+
+
+class SearchTermBlock(models.Model):
+    """
+    倒排表：文档 id 按 BLOCK_SIZE（见 search/backends.py）个连续的值分块，每个词元每块一行。
+    块内包含该词元的文档 id（升序，相对块起点差分 varint 编码）与对应的词频（varint 编码），
+    写入一个文档只需要读写它所在的块
+    """
+
+    term = models.CharField(max_length=64, verbose_name="词元")
+    block = models.BigIntegerField(verbose_name="块号（文档 id 整除块大小）")
+    count = models.IntegerField(default=0, verbose_name="块内包含词元的文档数")
+    documents = models.BinaryField(default=b"", verbose_name="文档 id（差分 varint 编码）")
+    frequencies = models.BinaryField(default=b"", verbose_name="词频（标题按权重计，varint 编码）")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["term", "block"], name="search_term_block_unique"),
+        ]
+
+
+class SearchPosting(models.Model):
+    """
+    词元在文档中的出现位置，只在短语查询时读取候选文档的位置；也用于删除文档时找到它的词元
+    """
+
+    term = models.CharField(max_length=64, verbose_name="词元")
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE, verbose_name="文档")
+    positions = models.BinaryField(default=b"", verbose_name="出现位置（差分 varint 编码）")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["term", "document"], name="search_term_document_idx"),
+        ]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+倒排表的紧凑编码：整数以 varint（每字节 7 位，最高位表示后面还有字节）存储，
+递增序列（文档 id、词元位置）先做差分，词频等无序序列直接存储
+"""
+
+
+def encode_varints(values):
+    """
+    :param values: 非负整数序列
+    :return: bytes
+    """
+    out = bytearray()
+    for value in values:
+        if value < 0:
+            raise ValueError("varints must be non-negative")
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varints(data):
+    values = []
+    value = 0
+    shift = 0
+    for byte in bytes(data):
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = 0
+            shift = 0
+    return values
+
+
+def encode_postings(values):
+    """
+    :param values: 递增的非负整数序列，例如文档 id 或词元位置
+    :return: bytes
+    """
+    deltas = []
+    previous = 0
+    for value in values:
+        if value < previous:
+            raise ValueError("postings must be sorted")
+        deltas.append(value - previous)
+        previous = value
+    return encode_varints(deltas)
+
+
+def decode_postings(data):
+    values = []
+    value = 0
+    for delta in decode_varints(data):
+        value += delta
+        values.append(value)
+    return values
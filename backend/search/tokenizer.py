@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+分词器
+
+中日韩文字没有空格分隔，连续的 CJK 字符切分为字符 n-gram（默认二元），
+片段末尾再补上长度不足 n 的后缀，使每个字符都是某个词元的开头，
+例如 “软件工程” 切分为 “软件”、“件工”、“工程”、“程”。
+拉丁字母、数字等切分为小写的单词。查询时每个片段的 n-gram 组成一个短语，要求位置相邻；
+长度不足 n 的 CJK 片段（例如单字 “猫”）作为前缀查询，以 PREFIX 结尾，匹配以它开头的词元。
+"""
+
+import re
+
+CJK = "぀-ヿ㐀-䶿一-鿿가-힯豈-﫿"
+TOKEN_RE = re.compile(rf"([{CJK}]+)|([^\W{CJK}]+)")
+MAX_TOKEN_LENGTH = 64
+NGRAM = 2
+# 前缀查询的词元以此结尾
+PREFIX = "*"
+
+
+def _runs(text):
+    for match in TOKEN_RE.finditer(text or ""):
+        cjk, word = match.groups()
+        if cjk:
+            yield True, cjk, match.start()
+        elif len(word) <= MAX_TOKEN_LENGTH:
+            yield False, word.lower(), match.start()
+
+
+def _run_spans(is_cjk, run, start, ngram):
+    if not is_cjk:
+        return [(run, start, start + len(run))]
+    # n-gram 的位置相邻，末尾的后缀排在全部 n-gram 之后
+    return [
+        (run[i : i + ngram], start + i, start + min(i + ngram, len(run))) for i in range(len(run))
+    ]
+
+
+def is_prefix(term):
+    return term.endswith(PREFIX)
+
+
+def _query_run(is_cjk, run, ngram):
+    if not is_cjk:
+        return [run]
+    if len(run) < ngram:
+        return [run + PREFIX]
+    return [run[i : i + ngram] for i in range(len(run) - ngram + 1)]
+
+
+def tokenize_spans(text, ngram=NGRAM):
+    """
+    切分词元
+    :return: 生成 (词元, 起始位置, 结束位置)
+    """
+    for is_cjk, run, start in _runs(text):
+        yield from _run_spans(is_cjk, run, start, ngram)
+
+
+def tokenize(text, ngram=NGRAM):
+    return [token for token, _, _ in tokenize_spans(text, ngram)]
+
+
+def tokenize_query(text, ngram=NGRAM):
+    """
+    切分查询
+    :return: 短语列表，每个短语是位置相邻的词元列表，前缀查询的短语只有一个词元
+    """
+    return [_query_run(is_cjk, run, ngram) for is_cjk, run, _ in _runs(text)]
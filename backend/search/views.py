@@ -0,0 +1,95 @@
+from drf_spectacular.utils import OpenApiParameter, OpenApiResponse, extend_schema
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from search import controllers
+from utils.jwt import login_required
+
+SEARCH_PAGE_SIZE_MAX = 50
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            name="q", type=str, location=OpenApiParameter.QUERY, description="搜索关键词"
+        ),
+        OpenApiParameter(
+            name="size",
+            type=int,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description=f"每页数量，默认为10，最大为{SEARCH_PAGE_SIZE_MAX}",
+        ),
+        OpenApiParameter(
+            name="cursor",
+            type=str,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="上一页返回的nextCursor，不提供表示第一页",
+        ),
+    ],
+    request=None,
+    responses={
+        200: OpenApiResponse(
+            description="搜索成功",
+            response={
+                "type": "object",
+                "properties": {
+                    "results": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "type": {
+                                    "type": "string",
+                                    "enum": ["post", "reply"],
+                                    "description": "命中的是帖子还是回帖",
+                                },
+                                "id": {"type": "integer", "description": "帖子或回帖ID"},
+                                "postId": {"type": "integer", "description": "所属帖子ID"},
+                                "userId": {"type": "integer", "description": "用户ID"},
+                                "nickname": {"type": "string", "description": "用户昵称"},
+                                "title": {
+                                    "type": "string",
+                                    "description": "帖子标题，命中部分以<mark>标记",
+                                },
+                                "content": {
+                                    "type": "string",
+                                    "description": "内容片段，命中部分以<mark>标记，其余已HTML转义",
+                                },
+                                "score": {"type": "number", "description": "BM25得分"},
+                            },
+                        },
+                        "description": "搜索结果，按得分降序",
+                    },
+                    "nextCursor": {
+                        "type": "string",
+                        "nullable": True,
+                        "description": "下一页游标，没有下一页时为null",
+                    },
+                },
+            },
+        ),
+        400: OpenApiResponse(description="请求参数错误"),
+        500: OpenApiResponse(description="服务器内部错误"),
+    },
+    description="全文搜索帖子与回帖",
+    summary="搜索",
+)
+@api_view(["GET"])
+@login_required(trust_claims=True)
+def search(request):
+    query = request.GET.get("q", "").strip()
+    size = min(max(int(request.GET.get("size", 10)), 1), SEARCH_PAGE_SIZE_MAX)
+    cursor = request.GET.get("cursor", "")
+    if not query:
+        return Response({"message": "invalid arguments: q"}, status=status.HTTP_400_BAD_REQUEST)
+    if cursor and not controllers.check_search_cursor(cursor):
+        return Response({"message": "invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+    results, next_cursor, result = controllers.search(query, size, cursor)
+    if result:
+        return Response({"results": results, "nextCursor": next_cursor}, status=status.HTTP_200_OK)
+    else:
+        return Response({"message": "error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
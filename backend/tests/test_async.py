@@ -0,0 +1,91 @@
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, Client, TestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from app import settings, settings_asgi
+from post import controllers
+from user.models import User
+from utils.jwt import generate_jwt
+from utils.response_cache import get_response_cache
+
+
+@override_settings(ROOT_URLCONF=settings_asgi.ROOT_URLCONF, MIDDLEWARE=settings_asgi.MIDDLEWARE)
+class AsyncViewTestCase(TestCase):
+    """
+    异步视图与同步视图的响应一致
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username="asyncer",
+            password="x",
+            nickname="异步用户",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        self.post_id, _ = controllers.create_post("标题", "content", self.user.id)
+        controllers.create_reply("reply", self.user.id, self.post_id)
+        self.token = generate_jwt({"user_id": self.user.id, "nickname": self.user.nickname})
+
+    def sync_get(self, url, **params):
+        # 同步视图在 app.urls 中，路径相同
+        with override_settings(ROOT_URLCONF="app.urls", MIDDLEWARE=settings.MIDDLEWARE):
+            return Client().get(url, params, HTTP_AUTHORIZATION=self.token)
+
+    async def async_get(self, url, headers=None, **params):
+        headers = {"Authorization": self.token, **(headers or {})}
+        return await AsyncClient().get(url, params, headers=headers)
+
+    async def assert_same(self, url, **params):
+        get_response_cache().bump_version()
+        expected = await sync_to_async(self.sync_get)(url, **params)
+        get_response_cache().bump_version()
+        response = await self.async_get(url, **params)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response.get("ETag"), expected.get("ETag"))
+        return response
+
+    async def test_post_list(self):
+        url = reverse("post_list")
+        await self.assert_same(url)
+        await self.assert_same(url, userId=self.user.id, orderByReply=1, includeTotal="false")
+        response = await self.assert_same(url, cursor="", size=1)
+        self.assertEqual(response.json()["posts"][0]["title"], "标题")
+
+    async def test_post_detail(self):
+        url = reverse("post_detail", args=[self.post_id])
+        response = await self.assert_same(url)
+        self.assertEqual(response.json()["reply"][0]["content"], "reply")
+        await self.assert_same(url, replySize=1)
+
+        response = await self.async_get(url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_user_info(self):
+        await self.assert_same(reverse("get_user_info"))
+        await self.assert_same(reverse("get_user_info_by_id", args=[self.user.id]))
+
+    async def test_unauthorized(self):
+        response = await AsyncClient().get(reverse("post_list"))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_write_falls_back_to_sync_view(self):
+        response = await AsyncClient().post(
+            reverse("post_list"),
+            {"title": "async", "content": "content"},
+            content_type="application/json",
+            headers={"Authorization": self.token},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["message"], "ok")
+
+    async def test_admin_with_inline_middleware(self):
+        """
+        同步的 admin 视图在线程中访问会话与用户
+        """
+        response = await AsyncClient().get("/admin/login/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Frame-Options"], "DENY")
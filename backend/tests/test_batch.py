@@ -0,0 +1,183 @@
+import unittest
+
+from django.db import connection
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from app import settings_asgi
+from post import controllers
+from post.models import Post
+from user.models import User
+from utils.jwt import generate_jwt
+from utils.pubsub import subscribers
+
+
+# 测试数据在未提交的事务中，其他线程的数据库连接读不到，因此顺序执行
+@override_settings(BATCH={"MAX_REQUESTS": 5, "WORKERS": 1})
+class BatchTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="batcher",
+            password="x",
+            nickname="batcher",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        self.post_id, _ = controllers.create_post("title", "content", self.user.id)
+        self.client = Client()
+        self.token = generate_jwt({"user_id": self.user.id, "nickname": self.user.nickname})
+
+    def batch(self, requests, **kwargs):
+        return self.client.post(
+            reverse("batch"),
+            {"requests": requests, **kwargs},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=self.token,
+        )
+
+    def test_reads(self):
+        """
+        只验证一次身份，各子请求返回各自的状态码
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.batch(
+                [
+                    {"id": "me", "path": "/api/v1/user"},
+                    {"id": "list", "path": "/api/v1/post?size=1"},
+                    {"id": "detail", "path": f"/api/v1/post/{self.post_id}"},
+                    {"id": "missing", "path": "/api/v1/nothing"},
+                    {"id": "self", "method": "POST", "path": "/api/v1/batch"},
+                ]
+            )
+        self.assertEqual(response.status_code, 200)
+        items = {item["id"]: item for item in response.json()["responses"]}
+        self.assertEqual(items["me"]["body"]["nickname"], "batcher")
+        self.assertEqual(items["list"]["body"]["posts"][0]["id"], self.post_id)
+        self.assertEqual(items["detail"]["status"], 200)
+        self.assertTrue(items["detail"]["headers"]["ETag"])
+        self.assertEqual(items["missing"]["status"], 404)
+        self.assertEqual(items["self"]["status"], 404)
+        lookups = [q for q in queries if 'WHERE "user_user"."id"' in q["sql"]]
+        self.assertEqual(len(lookups), 1)
+
+    def test_writes(self):
+        response = self.batch(
+            [
+                {"method": "POST", "path": "/api/v1/post", "body": {"title": "t", "content": "c"}},
+                {
+                    "method": "POST",
+                    "path": f"/api/v1/post/{self.post_id}/reply",
+                    "body": {"content": "c", "replyId": 12345678},
+                },
+                {"path": "/api/v1/post?size=10"},
+            ]
+        )
+        statuses = [item["status"] for item in response.json()["responses"]]
+        self.assertEqual(statuses[0], 200)
+        self.assertEqual(statuses[1], 404)
+        self.assertEqual(len(response.json()["responses"][2]["body"]["posts"]), 2)
+
+    def test_atomic(self):
+        """
+        atomic 模式下任一子请求失败，全部回滚，后续子请求不执行
+        """
+        count = Post.objects.count()
+        response = self.batch(
+            [
+                {"method": "POST", "path": "/api/v1/post", "body": {"title": "t", "content": "c"}},
+                {
+                    "method": "POST",
+                    "path": f"/api/v1/post/{self.post_id}/reply",
+                    "body": {"content": "c", "replyId": 12345678},
+                },
+                {"method": "POST", "path": "/api/v1/post", "body": {"title": "t", "content": "c"}},
+            ],
+            atomic=True,
+        )
+        statuses = [item["status"] for item in response.json()["responses"]]
+        self.assertEqual(statuses, [200, 404, 424])
+        self.assertEqual(Post.objects.count(), count)
+
+    def test_atomic_rollback_cache(self):
+        """
+        回滚的事务中读子请求缓存的列表不会被其他请求读到
+        """
+        response = self.batch(
+            [
+                {
+                    "method": "POST",
+                    "path": "/api/v1/post",
+                    "body": {"title": "rolled back", "content": "c"},
+                },
+                {"path": "/api/v1/post?size=10"},
+                {
+                    "method": "POST",
+                    "path": f"/api/v1/post/{self.post_id + 1000}/reply",
+                    "body": {"content": "c"},
+                },
+            ],
+            atomic=True,
+        )
+        responses = response.json()["responses"]
+        self.assertEqual([item["status"] for item in responses], [200, 200, 404])
+        self.assertIn("rolled back", [p["title"] for p in responses[1]["body"]["posts"]])
+
+        response = self.client.get(
+            reverse("post_list"), {"size": 10}, HTTP_AUTHORIZATION=self.token
+        )
+        self.assertNotIn("rolled back", [p["title"] for p in response.json()["posts"]])
+
+    @override_settings(ROOT_URLCONF=settings_asgi.ROOT_URLCONF, MIDDLEWARE=settings_asgi.MIDDLEWARE)
+    async def test_asgi(self):
+        """
+        ASGI 部署中读接口的路由是异步视图，子请求仍由同步视图执行
+        """
+        response = await AsyncClient().post(
+            reverse("batch"),
+            {
+                "requests": [
+                    {"id": "me", "path": "/api/v1/user"},
+                    {"id": "list", "path": "/api/v1/post?size=1"},
+                    {"id": "detail", "path": f"/api/v1/post/{self.post_id}"},
+                ]
+            },
+            content_type="application/json",
+            headers={"Authorization": self.token},
+        )
+        self.assertEqual(response.status_code, 200)
+        items = {item["id"]: item for item in response.json()["responses"]}
+        self.assertEqual(items["me"]["body"]["nickname"], "batcher")
+        self.assertEqual(items["list"]["body"]["posts"][0]["id"], self.post_id)
+        self.assertEqual(items["detail"]["status"], 200)
+
+    def test_streaming_rejected(self):
+        """
+        事件流与流式的帖子详情不能合并到批量响应中，订阅随即取消
+        """
+        count = subscribers.get()
+        response = self.batch(
+            [
+                {"path": "/api/v1/post/events"},
+                {"path": f"/api/v1/post/{self.post_id}/events"},
+                {"path": f"/api/v1/post/{self.post_id}?stream=true"},
+                {"path": f"/api/v1/post/{self.post_id}"},
+            ]
+        )
+        statuses = [item["status"] for item in response.json()["responses"]]
+        self.assertEqual(statuses, [400, 400, 400, 200])
+        self.assertEqual(subscribers.get(), count)
+
+    def test_invalid(self):
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.batch([{"method": "HEAD", "path": "/"}]).status_code, 400)
+        self.assertEqual(self.batch([{"path": "/api/v1/user"}] * 6).status_code, 400)
+        response = self.client.post(
+            reverse("batch"), {"requests": [{"path": "/api/v1/user"}]}, "application/json"
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+if __name__ == "__main__":
+    unittest.main()
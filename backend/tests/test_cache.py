@@ -0,0 +1,123 @@
+import time
+import unittest
+
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from post import controllers
+from user.models import User
+from utils.cache import LRUCache
+from utils.jwt import generate_jwt
+from utils.response_cache import cache_hits, get_response_cache
+
+
+class LRUCacheTestCase(TestCase):
+    def test_eviction(self):
+        cache = LRUCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_ttl(self):
+        cache = LRUCache(max_entries=2, ttl=60)
+        cache.set("a", 1, ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="cacher",
+            password="x",
+            nickname="cacher",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        get_response_cache().bump_version()
+        self.post_id, _ = controllers.create_post("title", "content", self.user.id)
+        self.client = Client()
+        self.token = generate_jwt({"user_id": self.user.id, "nickname": self.user.nickname})
+
+    def get(self, url, **params):
+        return self.client.get(url, params, HTTP_AUTHORIZATION=self.token)
+
+    def test_post_list_cached(self):
+        """
+        第二次请求命中缓存，不查询帖子；发帖后版本号递增，缓存失效
+        """
+        url = reverse("post_list")
+        first = self.get(url).json()
+        hits = cache_hits.get(cache="post_list")
+        with CaptureQueriesContext(connection) as queries:
+            second = self.get(url).json()
+        self.assertEqual(first, second)
+        self.assertEqual(cache_hits.get(cache="post_list"), hits + 1)
+        self.assertFalse([q for q in queries if "post_post" in q["sql"]])
+
+        controllers.create_post("another", "content", self.user.id)
+        self.assertEqual(self.get(url).json()["total"], 2)
+
+    def test_post_detail_cached(self):
+        url = reverse("post_detail", args=[self.post_id])
+        self.assertEqual(self.get(url).json()["reply"], [])
+        with CaptureQueriesContext(connection) as queries:
+            self.get(url)
+        self.assertFalse([q for q in queries if "post_reply" in q["sql"]])
+
+        controllers.create_reply("reply", self.user.id, self.post_id)
+        self.assertEqual(len(self.get(url).json()["reply"]), 1)
+
+    def test_etag(self):
+        """
+        If-None-Match 匹配时返回 304，且不读取帖子与回复的内容
+        """
+        for url in (reverse("post_list"), reverse("post_detail", args=[self.post_id])):
+            etag = self.get(url)["ETag"]
+            self.assertTrue(etag)
+
+            get_response_cache().bump_version()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    url, HTTP_AUTHORIZATION=self.token, HTTP_IF_NONE_MATCH=etag
+                )
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+            self.assertFalse([q for q in queries if '"content"' in q["sql"]])
+
+            controllers.create_reply("reply", self.user.id, self.post_id)
+            response = self.client.get(url, HTTP_AUTHORIZATION=self.token, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+
+    @override_settings(METRICS={"ENABLED": True})
+    def test_metrics(self):
+        self.get(reverse("post_list"))
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'forum_response_cache_misses_total{cache="post_list"}', response.content.decode()
+        )
+
+    def test_metrics_access(self):
+        """
+        指标接口默认关闭，配置 TOKEN 后需要带对应的 Bearer token
+        """
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+        with override_settings(METRICS={"ENABLED": True, "TOKEN": "secret"}):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+            response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer wrong")
+            self.assertEqual(response.status_code, 401)
+            response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+            self.assertEqual(response.status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
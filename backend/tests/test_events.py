@@ -0,0 +1,168 @@
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.test import AsyncClient, Client, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from app import settings_asgi
+from post import controllers
+from post.events import ReplySource
+from user.models import User
+from utils.jwt import generate_jwt
+from utils.pubsub import CacheBackend, Hub
+
+EVENTS = {"HEARTBEAT": 0.01, "MAX_DURATION": 5, "BACKFILL_MAX": 3}
+
+
+def parse_events(text):
+    """
+    :return: [(id, event, data)]，忽略注释与 retry
+    """
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n") if ": " in line)
+        if "event" in fields:
+            events.append((int(fields["id"]), fields["event"], fields["data"]))
+    return events
+
+
+class EventsMixin:
+    def setUp(self):
+        self.user = User.objects.create(
+            username="eventer",
+            password="x",
+            nickname="eventer",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        self.post_id, _ = controllers.create_post("title", "content", self.user.id)
+        self.token = generate_jwt({"user_id": self.user.id, "nickname": self.user.nickname})
+        self.url = reverse("post_events", args=[self.post_id])
+
+    def reply(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            controllers.create_reply(content, self.user.id, self.post_id)
+
+
+@override_settings(EVENTS=EVENTS)
+class PostEventsTestCase(EventsMixin, TestCase):
+    def open(self, last_event_id=None):
+        headers = {"Authorization": self.token, "Accept": "text/event-stream"}
+        if last_event_id is not None:
+            headers["Last-Event-ID"] = str(last_event_id)
+        response = Client().get(self.url, headers=headers)
+        if response.streaming:
+            # 关闭流而不是 response，测试客户端会保留数据库连接
+            self.addCleanup(response._iterator.close)
+        return response
+
+    def test_live_reply(self):
+        response = self.open()
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = iter(response.streaming_content)
+        self.assertEqual(parse_events(next(stream).decode()), [])
+
+        self.reply("你好")
+        events = parse_events(next(stream).decode())
+        self.assertEqual(
+            [(event, '"content":"你好"' in data) for _, event, data in events], [("reply", True)]
+        )
+
+    def test_resume(self):
+        self.reply("first")
+        response = self.open()
+        self.assertEqual(parse_events(next(response.streaming_content).decode()), [])
+
+        self.reply("second")
+        self.reply("third")
+        replies = controllers.get_post_detail(self.post_id)[0]["reply"]
+        response = self.open(last_event_id=replies[0]["id"])
+        events = parse_events(next(iter(response.streaming_content)).decode())
+        self.assertEqual([event_id for event_id, _, _ in events], [r["id"] for r in replies[1:]])
+
+    def test_reset_when_too_far_behind(self):
+        for i in range(4):
+            self.reply(f"reply {i}")
+        response = self.open(last_event_id=0)
+        events = parse_events(next(iter(response.streaming_content)).decode())
+        self.assertEqual([event for _, event, _ in events], ["reset"])
+
+    def test_errors(self):
+        response = self.open(last_event_id="x")
+        self.assertEqual(response.status_code, 400)
+        self.url = reverse("post_events", args=[0])
+        self.assertEqual(self.open().status_code, 404)
+        self.assertEqual(Client().get(self.url).status_code, 401)
+
+    @override_settings(EVENTS={**EVENTS, "MAX_SYNC_STREAMS": 1})
+    def test_sync_stream_limit(self):
+        """
+        同步流的名额已满时返回 503，流关闭后归还名额
+        """
+        first = self.open()
+        self.assertEqual(first.status_code, 200)
+        second = self.open()
+        self.assertEqual(second.status_code, 503)
+        self.assertTrue(second["Retry-After"])
+        # 流没有开始发送，response.close() 时归还名额；close 会关闭测试的数据库连接，这里直接释放
+        first.release()
+        self.assertEqual(self.open().status_code, 200)
+
+    def test_feed(self):
+        response = Client().get(reverse("feed_events"), headers={"Authorization": self.token})
+        self.addCleanup(response._iterator.close)
+        stream = iter(response.streaming_content)
+        next(stream)
+        with self.captureOnCommitCallbacks(execute=True):
+            post_id, _ = controllers.create_post("new", "content", self.user.id)
+        self.assertEqual(parse_events(next(stream).decode())[0][:2], (post_id, "post"))
+
+    def test_feed_ids_follow_commit_order(self):
+        """
+        帖子在写入之前锁定帖子计数器，并发事务按 id 顺序提交，游标不会越过未提交的帖子
+        """
+        with CaptureQueriesContext(connection) as queries:
+            controllers.create_post("new", "content", self.user.id)
+        statements = [q["sql"] for q in queries]
+        lock = next(
+            i for i, sql in enumerate(statements) if sql.startswith('UPDATE "post_counter"')
+        )
+        insert = next(
+            i for i, sql in enumerate(statements) if sql.startswith('INSERT INTO "post_post"')
+        )
+        self.assertLess(lock, insert)
+
+    def test_cache_backend_delivers_other_workers_events(self):
+        """
+        其他 worker 发布的事件只递增缓存中的版本号，由轮询发现
+        """
+        options = {"ALIAS": "default", "POLL_INTERVAL": 1}
+        hub = Hub()
+        backend = CacheBackend(hub, options)
+        other_worker = CacheBackend(Hub(), options)
+        name = controllers.post_channel(self.post_id)
+        subscription = hub.subscribe(name, ReplySource(self.post_id))
+        backend.poll_once()
+
+        controllers.create_reply("elsewhere", self.user.id, self.post_id)
+        backend.poll_once()
+        self.assertEqual(subscription.get(0), [])
+        other_worker.publish(name)
+        backend.poll_once()
+        self.assertEqual([event for _, event, _ in subscription.get(0)], ["reply"])
+
+
+@override_settings(
+    EVENTS=EVENTS, ROOT_URLCONF=settings_asgi.ROOT_URLCONF, MIDDLEWARE=settings_asgi.MIDDLEWARE
+)
+class AsyncPostEventsTestCase(EventsMixin, TestCase):
+    async def test_async_stream(self):
+        response = await AsyncClient().get(self.url, headers={"Authorization": self.token})
+        stream = response.streaming_content
+        self.assertEqual(parse_events((await stream.__anext__()).decode()), [])
+
+        await sync_to_async(self.reply)("async")
+        events = parse_events((await stream.__anext__()).decode())
+        self.assertEqual([event for _, event, _ in events], ["reply"])
+        await response._iterator.aclose()
@@ -0,0 +1,29 @@
+import os
+import runpy
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+CONF = Path(settings.BASE_DIR) / "gunicorn.conf.py"
+
+
+class GunicornConfTestCase(SimpleTestCase):
+    def setUp(self):
+        # 配置模块会设置 PASSWORD_HASH_WORKERS 环境变量
+        with mock.patch.dict(os.environ):
+            self.conf = runpy.run_path(str(CONF))
+
+    def test_size_workers(self):
+        size_workers = self.conf["size_workers"]
+        self.assertEqual(size_workers(4, "read"), (4, 8, 1))
+        self.assertEqual(size_workers(4, "cpu"), (4, 2, 1))
+        # 指定的 worker 数少于核数时，每个 worker 的哈希进程更多，合计仍约等于核数
+        self.assertEqual(size_workers(8, "mixed", workers=2), (2, 4, 4))
+        self.assertEqual(size_workers(0), (1, 4, 1))
+
+    def test_settings(self):
+        self.assertTrue(self.conf["preload_app"])
+        self.assertIn(self.conf["worker_class"], ("gthread", "uvicorn.workers.UvicornWorker"))
+        self.assertGreaterEqual(self.conf["workers"], 1)
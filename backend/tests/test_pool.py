@@ -0,0 +1,144 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import SimpleTestCase
+
+from utils import pool
+from utils.pool import ConnectionPool, PoolTimeout, connections_opened, pool_timeouts
+from utils.sqlite.base import DatabaseWrapper
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    def setUp(self):
+        self.opened = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+    def test_reuse(self):
+        pool = ConnectionPool("pool_test", max_size=2, timeout=1, idle_timeout=60)
+        first = pool.acquire(self.connect)
+        pool.release(first)
+        self.assertIs(pool.acquire(self.connect), first)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_max_size(self):
+        pool = ConnectionPool("pool_test", max_size=1, timeout=0.05, idle_timeout=60)
+        pool.acquire(self.connect)
+        timeouts = pool_timeouts.get(alias="pool_test")
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(self.connect)
+        self.assertEqual(pool_timeouts.get(alias="pool_test"), timeouts + 1)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_wait_for_release(self):
+        pool = ConnectionPool("pool_test", max_size=1, timeout=5, idle_timeout=60)
+        first = pool.acquire(self.connect)
+        timer = threading.Timer(0.05, pool.release, [first])
+        timer.start()
+        self.assertIs(pool.acquire(self.connect), first)
+        timer.join()
+
+    def test_idle_timeout(self):
+        pool = ConnectionPool("pool_test", max_size=2, timeout=1, idle_timeout=0.01)
+        first = pool.acquire(self.connect)
+        pool.release(first)
+        time.sleep(0.02)
+        self.assertIsNot(pool.acquire(self.connect), first)
+        self.assertTrue(first.closed)
+
+    def test_health_check(self):
+        """
+        不可用的空闲连接被关闭，并建立新连接
+        """
+        pool = ConnectionPool("pool_test", max_size=1, timeout=1, idle_timeout=60)
+        first = pool.acquire(self.connect)
+        pool.release(first)
+        second = pool.acquire(self.connect, check=lambda connection: False)
+        self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+
+    def test_failed_connect_frees_slot(self):
+        pool = ConnectionPool("pool_test", max_size=1, timeout=0.05, idle_timeout=60)
+
+        def fail():
+            raise OSError
+
+        with self.assertRaises(OSError):
+            pool.acquire(fail)
+        self.assertIsInstance(pool.acquire(self.connect), FakeConnection)
+
+
+class PooledWrapperTestCase(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = connections.configure_settings(
+            {
+                DEFAULT_DB_ALIAS: {
+                    "ENGINE": "utils.sqlite",
+                    "NAME": os.path.join(directory.name, "db.sqlite3"),
+                    "CONN_HEALTH_CHECKS": True,
+                    "OPTIONS": settings.DATABASES[DEFAULT_DB_ALIAS]["OPTIONS"],
+                }
+            }
+        )[DEFAULT_DB_ALIAS]
+        self.wrapper = DatabaseWrapper(settings_dict, "pool_test")
+        self.addCleanup(self.wrapper.pool.close)
+
+    def test_close_returns_connection(self):
+        opened = connections_opened.get(alias="pool_test")
+        self.wrapper.ensure_connection()
+        raw = self.wrapper.connection
+        self.wrapper.close()
+        self.wrapper.ensure_connection()
+        self.assertIs(self.wrapper.connection, raw)
+        self.assertEqual(connections_opened.get(alias="pool_test"), opened + 1)
+        self.wrapper.close()
+
+    def test_pool_rebound_after_fork(self):
+        """
+        fork 之后子进程丢弃父进程的连接池，已有的 DatabaseWrapper 使用子进程的连接池
+        """
+        parent = self.wrapper.pool
+        with (
+            mock.patch.object(pool, "_pools", {}),
+            mock.patch.object(pool.os, "getpid", return_value=-1),
+        ):
+            child = self.wrapper.pool
+            self.assertIsNot(child, parent)
+            self.addCleanup(child.close)
+            self.wrapper.ensure_connection()
+            self.wrapper.close()
+            self.assertEqual(len(child._idle), 1)
+            self.assertIs(self.wrapper.pool, child)
+        self.assertEqual(len(parent._idle), 0)
+
+    def test_closed_connection_replaced(self):
+        """
+        连接在空闲时被断开，健康检查发现后建立新连接
+        """
+        self.wrapper.ensure_connection()
+        raw = self.wrapper.connection
+        self.wrapper.close()
+        raw.close()
+        self.wrapper.ensure_connection()
+        self.assertIsNot(self.wrapper.connection, raw)
+        with self.wrapper.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        self.wrapper.close()
@@ -0,0 +1,338 @@
+import io
+import json
+import unittest
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from post import controllers
+from post.models import Counter, Post, Reply
+from user.models import User
+from utils.jwt import generate_jwt
+from utils.response_cache import get_response_cache
+
+
+class PostListTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="poster",
+            password="x",
+            nickname="poster",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        for i in range(7):
+            controllers.create_post(f"title {i}", f"content {i}", self.user.id)
+        self.client = Client()
+        self.token = generate_jwt({"user_id": self.user.id, "nickname": self.user.nickname})
+
+    def get_list(self, **params):
+        return self.client.get(reverse("post_list"), params, HTTP_AUTHORIZATION=self.token)
+
+    def test_page_size(self):
+        """
+        旧的 page/size 分页保持不变
+        """
+        response = self.get_list(page=2, size=3)
+        json_data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json_data["total"], 7)
+        self.assertEqual(json_data["page"], 2)
+        self.assertEqual(
+            [p["title"] for p in json_data["posts"]], ["title 3", "title 2", "title 1"]
+        )
+
+    def test_cursor(self):
+        """
+        游标分页按页遍历得到与 page/size 相同的顺序
+        """
+        for order_by_reply in ("", "1"):
+            titles = []
+            cursor = ""
+            while cursor is not None:
+                params = {"cursor": cursor, "size": 3}
+                if order_by_reply:
+                    params["orderByReply"] = order_by_reply
+                response = self.get_list(**params)
+                json_data = response.json()
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(len(json_data["posts"]), 3)
+                titles += [p["title"] for p in json_data["posts"]]
+                cursor = json_data["nextCursor"]
+            self.assertEqual(titles, [f"title {i}" for i in range(6, -1, -1)])
+
+    def test_counters(self):
+        """
+        帖子总数与回复数由计数器维护，可以通过 recount_posts 修复
+        """
+        post_id = Post.objects.order_by("id").first().id
+        controllers.create_reply("reply", self.user.id, post_id)
+        self.assertEqual(controllers.get_post_count(), 7)
+        self.assertEqual(controllers.get_post_count(self.user.id), 7)
+        self.assertEqual(Post.objects.get(id=post_id).reply_count, 1)
+
+        response = self.get_list(includeTotal="false")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("total", response.json())
+
+        Counter.objects.update(value=0)
+        Post.objects.update(reply_count=0)
+        call_command("recount_posts", stdout=io.StringIO())
+        self.assertEqual(self.get_list().json()["total"], 7)
+        self.assertEqual(controllers.get_post_count(self.user.id), 7)
+        self.assertEqual(Post.objects.get(id=post_id).reply_count, 1)
+
+    def test_denormalized_nickname(self):
+        """
+        列表与详情不连接 User 表，昵称修改后冗余字段同步更新
+        """
+        post_id = Post.objects.order_by("id").first().id
+        controllers.create_reply("reply", self.user.id, post_id)
+        self.user.nickname = "renamed"
+        self.user.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_list(size=10)
+        self.assertFalse([q for q in queries if "JOIN" in q["sql"]])
+        post = [p for p in response.json()["posts"] if p["id"] == post_id][0]
+        self.assertEqual(post["nickname"], "renamed")
+        self.assertEqual(post["lastRepliedNickname"], "renamed")
+
+        detail, _ = controllers.get_post_detail(post_id)
+        self.assertEqual(detail["reply"][0]["nickname"], "renamed")
+
+        Post.objects.update(nickname="stale")
+        with self.assertRaises(CommandError):
+            call_command("sync_nicknames", "--check", stdout=io.StringIO())
+        call_command("sync_nicknames", stdout=io.StringIO())
+        call_command("sync_nicknames", "--check", stdout=io.StringIO())
+        self.assertEqual(Post.objects.get(id=post_id).nickname, "renamed")
+
+    def test_nickname_unchanged(self):
+        """
+        昵称没有修改时保存用户不同步昵称，也不使响应缓存失效
+        """
+        backend = get_response_cache().backend
+        version = backend.get_version()
+        for user in [self.user, User.objects.get(id=self.user.id)]:
+            user.password = "changed"
+            with CaptureQueriesContext(connection) as queries:
+                user.save()
+            self.assertFalse([q for q in queries if "forum_post" in q["sql"]])
+            self.assertEqual(backend.get_version(), version)
+
+        user = User.objects.only("id").get(id=self.user.id)
+        user.nickname = "renamed"
+        user.save()
+        self.assertEqual(Post.objects.filter(user=self.user).first().nickname, "renamed")
+
+    def test_invalid_cursor(self):
+        response = self.get_list(cursor="not-a-cursor")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["message"], "invalid cursor")
+
+
+class PostDetailTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="replier",
+            password="x",
+            nickname="replier",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        self.post_id, _ = controllers.create_post("title", "content", self.user.id)
+        for i in range(5):
+            controllers.create_reply(f"reply {i}", self.user.id, self.post_id)
+        self.client = Client()
+        self.token = generate_jwt({"user_id": self.user.id, "nickname": self.user.nickname})
+        self.url = reverse("post_detail", args=[self.post_id])
+
+    def get_detail(self, **params):
+        return self.client.get(self.url, params, HTTP_AUTHORIZATION=self.token)
+
+    def test_reply_pages(self):
+        full = self.get_detail().json()
+        self.assertEqual([r["replyId"] for r in full["reply"]], [0] * 5)
+        self.assertNotIn("nextReplyCursor", full)
+
+        replies = []
+        cursor = ""
+        while cursor is not None:
+            json_data = self.get_detail(replyCursor=cursor, replySize=2).json()
+            self.assertLessEqual(len(json_data["reply"]), 2)
+            replies += json_data["reply"]
+            cursor = json_data["nextReplyCursor"]
+        self.assertEqual(replies, full["reply"])
+
+    def test_reply_tree(self):
+        """
+        回帖树按先序排列，子树只包含该回帖及其后代
+        """
+        first, second = Reply.objects.filter(post_id=self.post_id).order_by("id")[:2]
+        controllers.create_reply("child", self.user.id, self.post_id, first.id)
+        child = Reply.objects.get(content="child")
+        controllers.create_reply("grandchild", self.user.id, self.post_id, child.id)
+        controllers.create_reply("second child", self.user.id, self.post_id, second.id)
+
+        response = self.client.get(
+            reverse("reply_tree", args=[self.post_id]), HTTP_AUTHORIZATION=self.token
+        )
+        tree = [(r["content"], r["depth"]) for r in response.json()["replies"]]
+        self.assertEqual(
+            tree,
+            [
+                ("reply 0", 0),
+                ("child", 1),
+                ("grandchild", 2),
+                ("reply 1", 0),
+                ("second child", 1),
+                ("reply 2", 0),
+                ("reply 3", 0),
+                ("reply 4", 0),
+            ],
+        )
+
+        response = self.client.get(
+            reverse("reply_subtree", args=[self.post_id, first.id]), HTTP_AUTHORIZATION=self.token
+        )
+        subtree = [r["content"] for r in response.json()["replies"]]
+        self.assertEqual(subtree, ["reply 0", "child", "grandchild"])
+
+        response = self.client.get(
+            reverse("reply_subtree", args=[self.post_id, 10**6]), HTTP_AUTHORIZATION=self.token
+        )
+        self.assertEqual(response.status_code, 404)
+
+        Reply.objects.update(path="", depth=0)
+        call_command("backfill_reply_paths", stdout=io.StringIO())
+        self.assertEqual(
+            [r["content"] for r in controllers.get_reply_tree(self.post_id)[0]],
+            [content for content, _ in tree],
+        )
+
+    def test_reply_stream(self):
+        full = self.get_detail().json()
+        response = self.get_detail(stream="true")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        streamed = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(streamed, full)
+
+
+class PostMutationTestCase(TestCase):
+    """
+    修改与回复接口的语句数：一条带条件的 UPDATE 的影响行数决定 404，全部写入在一个事务中
+    TestCase 中的事务表现为 SAVEPOINT 与 RELEASE SAVEPOINT，计入语句数
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username="author",
+            password="x",
+            nickname="author",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        self.other = User.objects.create(
+            username="other",
+            password="x",
+            nickname="other",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        self.post_id, _ = controllers.create_post("title", "content", self.user.id)
+        self.other_post_id, _ = controllers.create_post("other", "content", self.other.id)
+        self.reply_id, _ = controllers.create_reply("reply", self.user.id, self.post_id)
+        self.client = Client()
+        self.token = generate_jwt({"user_id": self.user.id, "nickname": self.user.nickname})
+        # 登录校验在第一次请求后使用缓存，不计入接口的语句数
+        self.put(
+            reverse("post_detail", args=[self.post_id]), {"title": "title", "content": "content"}
+        )
+
+    def put(self, url, data):
+        return self.client.put(
+            url, data, content_type="application/json", HTTP_AUTHORIZATION=self.token
+        )
+
+    def reply(self, post_id, **data):
+        return self.client.post(
+            reverse("reply_post", args=[post_id]),
+            {"content": "new reply", **data},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=self.token,
+        )
+
+    def test_update_post(self):
+        url = reverse("post_detail", args=[self.post_id])
+        # UPDATE 帖子，更新搜索索引（DELETE 与 INSERT）
+        with self.assertNumQueries(5):
+            response = self.put(url, {"title": "new", "content": "new content"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Post.objects.get(id=self.post_id).title, "new")
+
+        # 其他用户的帖子与不存在的帖子只有一条 UPDATE
+        for post_id in (self.other_post_id, self.other_post_id + 1000):
+            with self.assertNumQueries(3):
+                response = self.put(
+                    reverse("post_detail", args=[post_id]), {"title": "x", "content": "x"}
+                )
+            self.assertEqual(response.status_code, 404)
+        self.assertEqual(Post.objects.get(id=self.other_post_id).title, "other")
+
+    def test_reply_post(self):
+        # UPDATE 帖子，INSERT 回帖，UPDATE 回帖路径，更新搜索索引
+        with self.assertNumQueries(7):
+            response = self.reply(self.post_id)
+        self.assertEqual(response.status_code, 200)
+        # 回复回帖多一条查询被回复回帖路径的 SELECT
+        with self.assertNumQueries(8):
+            response = self.reply(self.post_id, replyId=self.reply_id)
+        self.assertEqual(response.status_code, 200)
+        child = Reply.objects.get(reply_id=self.reply_id)
+        self.assertEqual(child.depth, 1)
+        self.assertEqual(Post.objects.get(id=self.post_id).reply_count, 3)
+
+    def test_reply_not_found(self):
+        with self.assertNumQueries(3):
+            response = self.reply(self.post_id + 1000)
+        self.assertEqual(response.status_code, 404)
+
+        # 被回复的回帖属于其他帖子时，只有查询被回复回帖的 SELECT
+        with self.assertNumQueries(3):
+            response = self.reply(self.other_post_id, replyId=self.reply_id)
+        self.assertEqual(response.status_code, 404)
+        post = Post.objects.get(id=self.other_post_id)
+        self.assertEqual(post.reply_count, 0)
+        self.assertEqual(post.last_replied_user_id, self.other.id)
+
+        self.assertEqual(self.reply(self.post_id, replyId="x").status_code, 400)
+
+    def test_modify_reply(self):
+        url = reverse("modify_reply", args=[self.post_id, self.reply_id])
+        # UPDATE 回帖，更新搜索索引，UPDATE 帖子的最新回复
+        with self.assertNumQueries(6):
+            response = self.put(url, {"content": "edited"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Reply.objects.get(id=self.reply_id).content, "edited")
+
+        # 回帖不属于该帖子
+        with self.assertNumQueries(3):
+            response = self.put(
+                reverse("modify_reply", args=[self.other_post_id, self.reply_id]),
+                {"content": "moved"},
+            )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Reply.objects.get(id=self.reply_id).content, "edited")
+
+
+if __name__ == "__main__":
+    unittest.main()
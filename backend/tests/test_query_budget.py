@@ -0,0 +1,238 @@
+import json
+import random
+import unittest
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from post import urls as post_urls
+from post.controllers import reply_path
+from post.models import Post, Reply
+from user import urls as user_urls
+from user.models import User
+from utils import password
+from utils.jwt import generate_jwt
+from utils.query_count import request_queries
+from utils.response_cache import get_response_cache
+from utils.sse import EventStreamResponse
+
+SEED_USERS = 50
+SEED_POSTS = 500
+# 详情页的帖子的回帖：三层，每层 REPLIES_PER_LEVEL 条
+REPLY_LEVELS = 3
+REPLIES_PER_LEVEL = 100
+PASSWORD = "Budget_123"
+
+# URL 名称 -> {请求方法: 查询数上限}，包括 TestCase 事务中的 SAVEPOINT 语句
+# 新接口需要在这里声明上限，见 test_all_endpoints_declared
+QUERY_BUDGETS = {
+    # 列表的 ETag 读取三个版本号，计数器不存在时初始化，第一次写索引时检查 FTS5
+    "post_list": {"GET": 6, "POST": 13},
+    "feed_events": {"GET": 1},
+    "post_detail": {"GET": 4, "PUT": 5},
+    "reply_post": {"POST": 8},
+    "modify_reply": {"PUT": 6},
+    "reply_tree": {"GET": 1},
+    "post_events": {"GET": 2},
+    "reply_subtree": {"GET": 2},
+    "get_user_info": {"GET": 0},
+    "get_user_info_by_id": {"GET": 1},
+    "get_users_info": {"GET": 1},
+    "login": {"PATCH": 1},
+    "logout": {"POST": 4},
+    "register": {"POST": 7},
+}
+
+
+class QueryBudgetMixin:
+    """
+    按 QUERY_BUDGETS 检查接口的查询数，查询数取自 QueryCountMiddleware 的 X-DB-Queries 响应头，
+    包括全部数据库别名与中间件中的查询
+    """
+
+    budgets = QUERY_BUDGETS
+
+    def assertWithinBudget(self, name, method, response):
+        self.assertLess(response.status_code, 400, f"{method} {name}: {response.status_code}")
+        queries = int(response["X-DB-Queries"])
+        budget = self.budgets[name][method]
+        self.assertLessEqual(
+            queries, budget, f"{method} {name} executed {queries} queries, budget is {budget}"
+        )
+
+    def assertBudgetsDeclared(self, urlpatterns):
+        for pattern in urlpatterns:
+            self.assertIn(pattern.name, self.budgets, f"no query budget for {pattern.name}")
+
+
+@override_settings(LOGIN_THROTTLE={"ENABLED": False}, PASSWORD_SCRYPT={"N": 1024, "R": 8, "P": 1})
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """
+    在真实规模的数据上请求每个接口，查询数超出上限时失败，用于发现 N+1 查询
+    每次请求前清空响应缓存，测量视图实际执行的查询；登录用户使用缓存，与线上的常态一致
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        users = User.objects.bulk_create(
+            User(
+                username=f"budget{i}",
+                password=password.make_password(PASSWORD) if i == 0 else "x",
+                nickname=f"budget {i}",
+                mobile="+86.123456789012",
+                magic_number=i,
+                url="https://baidu.com",
+            )
+            for i in range(SEED_USERS)
+        )
+        cls.user = users[0]
+        cls.user_ids = [u.id for u in users]
+
+        posts = []
+        for i in range(SEED_POSTS):
+            author, replier = rng.choice(users), rng.choice(users)
+            posts.append(
+                Post(
+                    user=author,
+                    nickname=author.nickname,
+                    title=f"title {i}",
+                    content=f"content {i} " * 10,
+                    last_replied_user=replier,
+                    last_replied_nickname=replier.nickname,
+                )
+            )
+        posts = Post.objects.bulk_create(posts)
+        cls.post = posts[-1]
+
+        # 逐层写入回帖，每条回帖回复上一层的随机一条
+        parents = [None]
+        for _ in range(REPLY_LEVELS):
+            level = []
+            for i in range(REPLIES_PER_LEVEL):
+                author, parent = rng.choice(users), rng.choice(parents)
+                level.append(
+                    Reply(
+                        user=author,
+                        nickname=author.nickname,
+                        post=cls.post,
+                        reply=parent,
+                        content=f"reply {i}",
+                    )
+                )
+            level = Reply.objects.bulk_create(level)
+            for reply in level:
+                parent = reply.reply and (reply.reply.path, reply.reply.depth)
+                reply.path, reply.depth = reply_path(reply.id, parent)
+            Reply.objects.bulk_update(level, ["path", "depth"])
+            parents = level
+        Post.objects.filter(id=cls.post.id).update(reply_count=REPLY_LEVELS * REPLIES_PER_LEVEL)
+        cls.reply = Reply.objects.filter(post=cls.post, user=cls.user).first()
+        cls.parent = parents[0].reply
+
+    def setUp(self):
+        self.client = Client()
+        self.token = generate_jwt({"user_id": self.user.id, "nickname": self.user.nickname})
+        # 登录用户进入缓存
+        self.client.get(reverse("get_user_info"), HTTP_AUTHORIZATION=self.token)
+
+    def endpoint_requests(self):
+        """
+        :return: [(URL 名称, 请求方法, URL, 请求体)]
+        """
+        post_id = self.post.id
+        return [
+            ("post_list", "GET", reverse("post_list") + "?size=10", None),
+            ("post_list", "POST", reverse("post_list"), {"title": "t", "content": "c"}),
+            ("feed_events", "GET", reverse("feed_events"), None),
+            ("post_detail", "GET", reverse("post_detail", args=[post_id]), None),
+            (
+                "post_detail",
+                "PUT",
+                reverse("post_detail", args=[self.user_post_id()]),
+                {"title": "t", "content": "c"},
+            ),
+            ("reply_post", "POST", reverse("reply_post", args=[post_id]), {"content": "c"}),
+            (
+                "modify_reply",
+                "PUT",
+                reverse("modify_reply", args=[post_id, self.reply.id]),
+                {"content": "c"},
+            ),
+            ("reply_tree", "GET", reverse("reply_tree", args=[post_id]), None),
+            ("post_events", "GET", reverse("post_events", args=[post_id]), None),
+            (
+                "reply_subtree",
+                "GET",
+                reverse("reply_subtree", args=[post_id, self.parent.id]),
+                None,
+            ),
+            ("get_user_info", "GET", reverse("get_user_info"), None),
+            (
+                "get_user_info_by_id",
+                "GET",
+                reverse("get_user_info_by_id", args=[self.user_ids[1]]),
+                None,
+            ),
+            (
+                "get_users_info",
+                "GET",
+                reverse("get_users_info") + "?ids=" + ",".join(map(str, self.user_ids[:20])),
+                None,
+            ),
+            (
+                "login",
+                "PATCH",
+                reverse("login"),
+                {"username": self.user.username, "password": PASSWORD},
+            ),
+            ("logout", "POST", reverse("logout"), None),
+            (
+                "register",
+                "POST",
+                reverse("register"),
+                {
+                    "username": "budget_9",
+                    "password": PASSWORD,
+                    "nickname": "budget",
+                    "url": "https://baidu.com",
+                    "mobile": "+86.123456789012",
+                    "magic_number": 0,
+                },
+            ),
+        ]
+
+    def user_post_id(self):
+        return Post.objects.filter(user=self.user).values_list("id", flat=True).first()
+
+    def test_all_endpoints_declared(self):
+        self.assertBudgetsDeclared(post_urls.urlpatterns + user_urls.urlpatterns)
+        requested = {(name, method) for name, method, _, _ in self.endpoint_requests()}
+        declared = {(name, method) for name, methods in self.budgets.items() for method in methods}
+        self.assertEqual(requested, declared)
+
+    def test_budgets(self):
+        for name, method, url, data in self.endpoint_requests():
+            with self.subTest(endpoint=name, method=method):
+                get_response_cache().bump_version()
+                response = self.client.generic(
+                    method,
+                    url,
+                    "" if data is None else json.dumps(data),
+                    content_type="application/json",
+                    HTTP_AUTHORIZATION=self.token,
+                )
+                if isinstance(response, EventStreamResponse):
+                    # 流没有开始发送，取消订阅并归还同步流的名额
+                    response.release()
+                self.assertWithinBudget(name, method, response)
+
+    def test_server_timing(self):
+        count = request_queries.get(endpoint="post_list", method="GET")[0]
+        response = self.client.get(reverse("post_list"))
+        self.assertRegex(response["Server-Timing"], r'^db;dur=[\d.]+;desc="\d+ queries"$')
+        self.assertEqual(request_queries.get(endpoint="post_list", method="GET")[0], count + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
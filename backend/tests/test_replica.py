@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from post import controllers
+from post.controllers import user_post_counter
+from post.models import Counter, Post
+from user import controllers as user_controllers
+from user.models import User
+from utils.db import (
+    KEY_PREFIX,
+    ReplicaRouter,
+    add_database,
+    is_pinned,
+    remove_database,
+    viewer,
+)
+from utils.jwt import generate_jwt
+
+REPLICA = "replica_test"
+
+
+class ReplicaTestCase(TestCase):
+    """
+    db.sqlite3 作为主库，副本是另一个文件：测试开始时主库已提交数据的快照
+    测试中的写入在 TestCase 的事务中，不会出现在副本上，相当于复制延迟
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "replica.sqlite3")
+        source = sqlite3.connect(settings.DATABASES[DEFAULT_DB_ALIAS]["NAME"])
+        target = sqlite3.connect(path)
+        source.backup(target)
+        source.close()
+        target.close()
+
+        add_database(REPLICA, "utils.sqlite", path, settings.DATABASES["read"]["OPTIONS"])
+        self.addCleanup(remove_database, REPLICA)
+        replicas = override_settings(DATABASE_REPLICAS={"ALIASES": [REPLICA], "STICKY_SECONDS": 60})
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+        caches["default"].clear()
+
+        self.author = User.objects.create(
+            username="author",
+            password="x",
+            nickname="author",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        self.reader = User.objects.create(
+            username="reader",
+            password="x",
+            nickname="reader",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        with viewer(self.author.id):
+            self.post_id, _ = controllers.create_post("title", "content", self.author.id)
+
+    def read_as(self, user_id, func, *args, **kwargs):
+        """
+        TestCase 的事务中的查询总是读主库，这里模拟事务之外的请求
+        :return: (结果, 副本上的查询数)
+        """
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], "in_atomic_block", False):
+            with viewer(user_id), CaptureQueriesContext(connections[REPLICA]) as queries:
+                result = func(*args, **kwargs)
+        return result, len(queries)
+
+    def test_reads_go_to_replica(self):
+        """
+        其他用户从副本读取，还看不到新帖子
+        """
+        (post, _), queries = self.read_as(self.reader.id, controllers.get_post, self.post_id)
+        self.assertIsNone(post)
+        self.assertEqual(queries, 1)
+
+        (posts, _, ok), queries = self.read_as(
+            self.reader.id, lambda: controllers.get_post_list(include_total=False)
+        )
+        self.assertTrue(ok)
+        self.assertNotIn(self.post_id, [p["id"] for p in posts])
+        self.assertEqual(queries, 1)
+
+    def test_author_reads_own_writes(self):
+        (post, _), queries = self.read_as(self.author.id, controllers.get_post, self.post_id)
+        self.assertEqual(post["id"], self.post_id)
+        self.assertEqual(queries, 0)
+
+    def test_sticky_window_expires(self):
+        caches["default"].delete(KEY_PREFIX + str(self.author.id))
+        (post, _), queries = self.read_as(self.author.id, controllers.get_post, self.post_id)
+        self.assertIsNone(post)
+        self.assertEqual(queries, 1)
+
+    def test_async_reads(self):
+        (post, _), _ = self.read_as(
+            self.reader.id, async_to_sync(controllers.aget_post_detail), self.post_id
+        )
+        self.assertIsNone(post)
+        (post, _), _ = self.read_as(
+            self.author.id, async_to_sync(controllers.aget_post_detail), self.post_id
+        )
+        self.assertEqual(post["id"], self.post_id)
+
+    def test_registration(self):
+        """
+        注册后新用户的请求读主库，能查到自己
+        """
+        user_controllers.create_user(
+            "newcomer", "x", "newcomer", "https://baidu.com", "+86.123456789012", 0
+        )
+        user_id = User.objects.get(username="newcomer").id
+        (user, found), _ = self.read_as(user_id, user_controllers.get_user, user_id)
+        self.assertTrue(found)
+        (user, found), _ = self.read_as(self.reader.id, user_controllers.get_user, user_id)
+        self.assertFalse(found)
+
+    def test_view_marks_writes(self):
+        """
+        通过接口发帖后，作者之后的请求读主库
+        """
+        caches["default"].delete(KEY_PREFIX + str(self.author.id))
+        client = Client()
+        token = generate_jwt({"user_id": self.author.id, "nickname": self.author.nickname})
+        response = client.post(
+            reverse("post_list"),
+            {"title": "second", "content": "content"},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=token,
+        )
+        self.assertEqual(response.status_code, 200)
+        post_id = response.json()["postId"]
+
+        # 视图自己以登录用户的身份执行
+        response, queries = self.read_as(
+            None, client.get, reverse("post_detail", args=[post_id]), HTTP_AUTHORIZATION=token
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 0)
+
+    def test_counter_init_not_sticky(self):
+        """
+        读请求中初始化计数器不使读取的用户进入粘滞窗口
+        """
+        Counter.objects.filter(key=user_post_counter(self.author.id)).delete()
+        with viewer(self.reader.id):
+            self.assertEqual(controllers.get_post_count(self.author.id), 1)
+            self.assertFalse(is_pinned())
+        self.assertTrue(Counter.objects.filter(key=user_post_counter(self.author.id)).exists())
+        self.assertIsNone(caches["default"].get(KEY_PREFIX + str(self.reader.id)))
+
+    def test_writes_go_to_primary(self):
+        router = ReplicaRouter()
+        post = Post()
+        post._state.db = REPLICA
+        self.assertEqual(router.db_for_write(Post, instance=post), DEFAULT_DB_ALIAS)
+        self.assertFalse(router.allow_migrate(REPLICA, "post"))
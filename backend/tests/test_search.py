@@ -0,0 +1,174 @@
+import unittest
+
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from post import controllers as post_controllers
+from post.models import Post, Reply
+from search import controllers
+from search.backends import BLOCK_SIZE, TITLE_WEIGHT, Fts5Backend, TableBackend, document_key
+from search.models import SearchDocument, SearchTermBlock
+from search.postings import decode_postings, decode_varints, encode_postings, encode_varints
+from search.tokenizer import tokenize, tokenize_query
+from user.models import User
+from utils.jwt import generate_jwt
+
+
+class TokenizerTestCase(TestCase):
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize("软件工程 Django作业"),
+            ["软件", "件工", "工程", "程", "django", "作业", "业"],
+        )
+        self.assertEqual(tokenize("好"), ["好"])
+        self.assertEqual(tokenize("软件工程", ngram=3), ["软件工", "件工程", "工程", "程"])
+        self.assertEqual(tokenize_query("软件工程 api"), [["软件", "件工", "工程"], ["api"]])
+        self.assertEqual(tokenize_query("猫 软件"), [["猫*"], ["软件"]])
+
+    def test_postings(self):
+        values = [0, 1, 5, 127, 128, 300, 100000]
+        self.assertEqual(decode_postings(encode_postings(values)), values)
+        self.assertEqual(len(encode_postings(range(1000))), 1000)
+        with self.assertRaises(ValueError):
+            encode_postings([2, 1])
+        self.assertEqual(decode_varints(encode_varints([3, 1, 300])), [3, 1, 300])
+
+
+class SearchTestCase(TestCase):
+    backend = Fts5Backend()
+
+    def setUp(self):
+        self._backend = controllers._backend
+        controllers._backend = self.backend
+        self.addCleanup(setattr, controllers, "_backend", self._backend)
+
+        self.user = User.objects.create(
+            username="searcher",
+            password="x",
+            nickname="searcher",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        self.post_id, _ = post_controllers.create_post(
+            "django tips", "how to write <b>django</b> views", self.user.id
+        )
+        post_controllers.create_post("python", "python and django", self.user.id)
+        post_controllers.create_post("unrelated", "nothing to see", self.user.id)
+        post_controllers.create_reply("django rocks", self.user.id, self.post_id)
+        self.client = Client()
+        self.token = generate_jwt({"user_id": self.user.id, "nickname": self.user.nickname})
+
+    def search(self, **params):
+        return self.client.get(reverse("search"), params, HTTP_AUTHORIZATION=self.token)
+
+    def test_search(self):
+        response = self.search(q="Django")
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 3)
+        # 标题命中的帖子排在最前
+        self.assertEqual((results[0]["type"], results[0]["id"]), ("post", self.post_id))
+        self.assertEqual(results[0]["title"], "<mark>django</mark> tips")
+        self.assertIn("&lt;b&gt;<mark>django</mark>&lt;/b&gt;", results[0]["content"])
+        self.assertIn("reply", [r["type"] for r in results])
+
+        self.assertEqual(
+            self.search(q="django python").json()["results"][0]["title"], "<mark>python</mark>"
+        )
+        self.assertEqual(self.search(q="missing").json()["results"], [])
+        self.assertEqual(self.search(q="").status_code, 400)
+
+    def test_cjk(self):
+        """
+        中文按二元组索引，查询的二元组需要位置相邻
+        """
+        post_id, _ = post_controllers.create_post("软件工程作业", "论坛的搜索功能", self.user.id)
+        post_controllers.create_post("工程软件", "作业论坛", self.user.id)
+        results = self.search(q="软件工程").json()["results"]
+        self.assertEqual([r["id"] for r in results], [post_id])
+        self.assertEqual(results[0]["title"], "<mark>软件工程</mark>作业")
+        self.assertEqual(len(self.search(q="作业").json()["results"]), 2)
+        self.assertEqual(self.search(q="搜索功能 软件").json()["results"][0]["id"], post_id)
+
+    def test_cjk_single_character(self):
+        """
+        单字查询按前缀匹配，字符位于片段开头、中间与末尾都能命中
+        """
+        ids = [
+            post_controllers.create_post(title, "", self.user.id)[0]
+            for title in ["猫咪日记", "我的黑猫", "养猫", "猫", "小狗"]
+        ]
+        results = self.search(q="猫").json()["results"]
+        self.assertEqual(sorted(r["id"] for r in results), ids[:4])
+        titles = {r["id"]: r["title"] for r in results}
+        self.assertEqual(titles[ids[0]], "<mark>猫</mark>咪日记")
+        self.assertEqual(titles[ids[1]], "我的黑<mark>猫</mark>")
+        self.assertEqual([r["id"] for r in self.search(q="猫 日记").json()["results"]], ids[:1])
+
+    def test_cursor(self):
+        full = self.search(q="django").json()["results"]
+        results = []
+        cursor = ""
+        while cursor is not None:
+            json_data = self.search(q="django", size=1, cursor=cursor).json()
+            results += json_data["results"]
+            cursor = json_data["nextCursor"]
+        self.assertEqual(results, full)
+
+    def test_update(self):
+        post_controllers.update_post("flask tips", "flask views", self.post_id, self.user.id)
+        ids = [(r["type"], r["id"]) for r in self.search(q="flask").json()["results"]]
+        self.assertEqual(ids, [("post", self.post_id)])
+        self.assertNotIn(
+            ("post", self.post_id),
+            [(r["type"], r["id"]) for r in self.search(q="django").json()["results"]],
+        )
+
+
+class TableSearchTestCase(SearchTestCase):
+    backend = TableBackend()
+
+    def test_term_postings(self):
+        """
+        每个词元每块一行，块内的文档 id 与词频编码存储；删除文档后从倒排表中移除，空块被删除
+        """
+        post_id, _ = post_controllers.create_post("独特标题", "django", self.user.id)
+        key = document_key("post", post_id)
+        document_id = SearchDocument.objects.get(key=key).id
+        block = document_id // BLOCK_SIZE
+        row = SearchTermBlock.objects.get(term="独特")
+        self.assertEqual((row.block, row.count), (block, 1))
+        self.assertEqual(decode_postings(row.documents), [document_id - block * BLOCK_SIZE])
+        self.assertEqual(decode_varints(row.frequencies), [TITLE_WEIGHT])
+        self.assertIn(document_id, self.backend._postings("django"))
+
+        self.backend.remove(key)
+        self.assertFalse(SearchTermBlock.objects.filter(term="独特").exists())
+        self.assertNotIn(document_id, self.backend._postings("django"))
+
+    def test_rarest_term_first(self):
+        """
+        从文档最少的词元开始求交集，常见词元只读取候选文档所在的块
+        """
+        self.backend.build((10**9 + i, ["common"], ["filler"]) for i in range(BLOCK_SIZE * 3))
+        self.backend.index(10**9 - 1, ["common"], ["rare"])
+        with CaptureQueriesContext(connection) as queries:
+            hits = self.backend.search([["common"], ["rare"]], 10)
+        self.assertEqual([key for key, _ in hits], [10**9 - 1])
+        common = [q["sql"] for q in queries if "'common'" in q["sql"] and '"documents"' in q["sql"]]
+        self.assertTrue(common)
+        for sql in common:
+            self.assertIn('"block" IN', sql)
+        self.assertEqual(len(self.backend.search([["common"]], 1000)), BLOCK_SIZE * 3 + 1)
+
+    def test_rebuild(self):
+        before = self.search(q="django").json()["results"]
+        self.assertEqual(controllers.rebuild_index(), Post.objects.count() + Reply.objects.count())
+        self.assertEqual(self.search(q="django").json()["results"], before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.test import SimpleTestCase
+
+from utils.sqlite.base import DatabaseWrapper
+
+
+class SqliteBackendTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "db.sqlite3")
+        self.wrappers = []
+
+    def tearDown(self):
+        for wrapper in self.wrappers:
+            wrapper.close()
+            wrapper.pool.close()
+            if hasattr(connections._connections, wrapper.alias):
+                del connections[wrapper.alias]
+        self.directory.cleanup()
+
+    def open(self, alias, options):
+        settings_dict = connections.configure_settings(
+            {DEFAULT_DB_ALIAS: {"ENGINE": "utils.sqlite", "NAME": self.path, "OPTIONS": options}}
+        )[DEFAULT_DB_ALIAS]
+        wrapper = DatabaseWrapper(settings_dict, alias)
+        self.wrappers.append(wrapper)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        wrapper = self.open("sqlite_test", settings.DATABASES[DEFAULT_DB_ALIAS]["OPTIONS"])
+        self.assertEqual(self.pragma(wrapper, "journal_mode"), "wal")
+        # NORMAL
+        self.assertEqual(self.pragma(wrapper, "synchronous"), 1)
+        self.assertEqual(
+            self.pragma(wrapper, "busy_timeout"), settings.SQLITE_PRAGMAS["busy_timeout"]
+        )
+        self.assertEqual(self.pragma(wrapper, "cache_size"), settings.SQLITE_PRAGMAS["cache_size"])
+
+    def test_begin_immediate(self):
+        """
+        事务开始时就持有写锁，其他连接不能开始写事务；提交后释放进程内的写锁
+        """
+        wrapper = self.open("sqlite_test", settings.DATABASES[DEFAULT_DB_ALIAS]["OPTIONS"])
+        connections["sqlite_test"] = wrapper
+        other = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        try:
+            with transaction.atomic(using="sqlite_test"):
+                self.assertTrue(wrapper.write_lock.locked())
+                with self.assertRaises(sqlite3.OperationalError):
+                    other.execute("BEGIN IMMEDIATE")
+            self.assertFalse(wrapper.write_lock.locked())
+            other.execute("BEGIN IMMEDIATE")
+            other.execute("ROLLBACK")
+        finally:
+            other.close()
+
+    def test_write_lock_released_on_rollback(self):
+        wrapper = self.open("sqlite_test", settings.DATABASES[DEFAULT_DB_ALIAS]["OPTIONS"])
+        connections["sqlite_test"] = wrapper
+        with self.assertRaises(ValueError):
+            with transaction.atomic(using="sqlite_test"):
+                raise ValueError
+        self.assertFalse(wrapper.write_lock.locked())
+
+    def test_read_connection_is_read_only(self):
+        self.pragma(
+            self.open("sqlite_test", settings.DATABASES[DEFAULT_DB_ALIAS]["OPTIONS"]),
+            "journal_mode",
+        )
+        wrapper = self.open("sqlite_test_read", settings.DATABASES["read"]["OPTIONS"])
+        self.assertEqual(self.pragma(wrapper, "journal_mode"), "wal")
+        with self.assertRaises(OperationalError):
+            with wrapper.cursor() as cursor:
+                cursor.execute("CREATE TABLE t (x)")
+
+    def test_invalid_transaction_mode(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.open("sqlite_test", {"transaction_mode": "LATER"})
@@ -0,0 +1,75 @@
+import unittest
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from utils import throttle
+from utils.password import hash_seconds
+
+RATES = {"login_ip": "3/m", "login_username": "2/m", "register_ip": "1/h"}
+
+
+class ThrottleBackendTestCase(TestCase):
+    def test_local(self):
+        backend = throttle.LocalBackend({})
+        self.assertEqual([backend.hit("k", 2, 60)[0] for _ in range(3)], [True, True, False])
+        allowed, retry_after = backend.hit("k", 2, 60)
+        self.assertFalse(allowed)
+        self.assertTrue(0 < retry_after <= 30)
+        self.assertTrue(backend.hit("other", 2, 60)[0])
+
+    def test_django(self):
+        backend = throttle.DjangoBackend({"ALIAS": "default"})
+        self.assertEqual([backend.hit("dk", 2, 60)[0] for _ in range(3)], [True, True, False])
+        self.assertTrue(backend.hit("dk2", 2, 60)[0])
+
+
+@override_settings(LOGIN_THROTTLE={"RATES": RATES})
+class LoginThrottleTestCase(TestCase):
+    def login(self, username, ip):
+        return self.client.patch(
+            reverse("login"),
+            {"username": username, "password": "wrong"},
+            "application/json",
+            REMOTE_ADDR=ip,
+        )
+
+    def test_username(self):
+        """
+        同一用户名超限后返回 429，且不再计算哈希
+        """
+        self.assertEqual(self.login("victim", "10.0.0.1").status_code, 401)
+        self.assertEqual(self.login("victim", "10.0.0.2").status_code, 401)
+        hashes = hash_seconds.get()[0]
+        response = self.login("victim", "10.0.0.3")
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response["Retry-After"]) >= 1)
+        self.assertEqual(hash_seconds.get()[0], hashes)
+        self.assertGreater(throttle.throttled_requests.get(scope="login_username"), 0)
+
+    def test_ip(self):
+        statuses = [self.login(f"user{i}", "10.0.1.1").status_code for i in range(4)]
+        self.assertEqual(statuses, [401, 401, 401, 429])
+        self.assertEqual(self.login("user9", "10.0.1.2").status_code, 401)
+
+    def test_register(self):
+        data = {
+            "username": "throttle1",
+            "password": "Password1*",
+            "nickname": "throttled",
+            "url": "https://baidu.com",
+            "mobile": "+86.123456789012",
+            "magic_number": 0,
+        }
+        client = Client(REMOTE_ADDR="10.0.2.1")
+        self.assertEqual(
+            client.post(reverse("register"), data, "application/json").status_code, 200
+        )
+        data["username"] = "throttle2"
+        self.assertEqual(
+            client.post(reverse("register"), data, "application/json").status_code, 429
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
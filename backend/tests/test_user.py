@@ -0,0 +1,298 @@
+import io
+import threading
+import time
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from user.models import RevokedToken, User
+from utils import password
+from utils.bloom import BloomFilter
+from utils.jwt import generate_jwt, token_cache_hits, verify_jwt
+from utils.revocation import revocation_checks
+from utils.user_cache import cache_hits
+
+
+class AuthUserCacheTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="cached",
+            password="x",
+            nickname="cached",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        self.client = Client()
+        self.token = generate_jwt({"user_id": self.user.id, "nickname": "cached"})
+
+    def get_user_info(self):
+        return self.client.get(reverse("get_user_info"), HTTP_AUTHORIZATION=self.token).json()
+
+    def test_cached(self):
+        """
+        第二次请求不再查询用户，用户保存后缓存失效
+        """
+        self.get_user_info()
+        hits = cache_hits.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_user_info()["nickname"], "cached")
+        self.assertEqual(cache_hits.get(), hits + 1)
+
+        self.user.nickname = "renamed"
+        self.user.save()
+        self.assertEqual(self.get_user_info()["nickname"], "renamed")
+
+        self.user.delete()
+        response = self.client.get(reverse("get_user_info"), HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, 401)
+
+
+class PasswordHashingTestCase(TestCase):
+    def test_format(self):
+        """
+        新格式带有算法、参数与每个用户不同的盐，哈希在进程池中计算
+        """
+        encoded = password.make_password("secret")
+        self.assertTrue(encoded.startswith("$scrypt$n=32768,r=8,p=1$"))
+        self.assertNotEqual(encoded, password.make_password("secret"))
+        self.assertEqual(password.check_password("secret", encoded), (True, False))
+        self.assertFalse(password.check_password("wrong", encoded)[0])
+        self.assertEqual(password.hash_queue_depth.get(), 0)
+
+    @override_settings(PASSWORD_SCRYPT={"N": 1024, "R": 8, "P": 1})
+    def test_rehash(self):
+        """
+        旧格式与参数过时的哈希在登录成功后升级
+        """
+        user = User.objects.create(
+            username="legacy",
+            password=password.scrypt_hash("secret", settings.SALT),
+            nickname="legacy",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+
+        def login(pw):
+            return self.client.patch(
+                reverse("login"), {"username": "legacy", "password": pw}, "application/json"
+            ).status_code
+
+        self.assertEqual(login("wrong"), 401)
+        user.refresh_from_db()
+        self.assertFalse(user.password.startswith("$scrypt$"))
+
+        self.assertEqual(login("secret"), 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("$scrypt$n=1024,"))
+
+        with override_settings(PASSWORD_SCRYPT={"N": 2048, "R": 8, "P": 1}):
+            self.assertEqual(login("secret"), 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("$scrypt$n=2048,"))
+        self.assertEqual(login("secret"), 200)
+        self.assertEqual(login("nobody"), 401)
+
+    def test_busy(self):
+        """
+        队列已满时登录与注册直接返回 503
+        """
+        pool, slots = password.get_pool()
+        self.addCleanup(setattr, password, "_slots", slots)
+        password._slots = threading.BoundedSemaphore(1)
+        password._slots.acquire()
+
+        response = self.client.patch(
+            reverse("login"),
+            {"username": "test_thss", "password": "test_thss"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+    @override_settings(
+        PASSWORD_HASHING={**settings.PASSWORD_HASHING, "TIMEOUT": 0.001},
+        LOGIN_THROTTLE={"ENABLED": False},
+    )
+    def test_timeout(self):
+        """
+        等待哈希超时时登录与注册返回 503，而不是 401 或 400
+        """
+        if password.get_pool()[0] is None:
+            self.skipTest("PASSWORD_HASHING WORKERS is 0")
+        response = self.client.patch(
+            reverse("login"),
+            {"username": "test_thss", "password": "test_thss"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 503)
+        response = self.client.post(
+            reverse("register"),
+            {
+                "username": "timeout_1",
+                "password": "Timeout_123",
+                "nickname": "timeout",
+                "url": "https://baidu.com",
+                "mobile": "+86.123456789012",
+                "magic_number": 0,
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(password.hash_queue_depth.get(), 0)
+
+    def test_broken_pool(self):
+        """
+        进程池损坏时抛出 PasswordHashingUnavailable，并换成新的进程池
+        """
+        pool, _ = password.get_pool()
+        if pool is None:
+            self.skipTest("PASSWORD_HASHING WORKERS is 0")
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool
+        self.addCleanup(setattr, password, "_pool", pool)
+        password._pool = broken
+        with self.assertRaises(password.PasswordHashingUnavailable):
+            password.make_password("secret")
+        self.assertIsNot(password._pool, broken)
+        self.addCleanup(password._pool.shutdown)
+        broken.shutdown.assert_called_once_with(wait=False)
+
+
+class TokenCacheTestCase(TestCase):
+    def test_cached(self):
+        token = generate_jwt({"user_id": 1, "nickname": "cached"})
+        self.assertEqual(verify_jwt(token)["user_id"], 1)
+        hits = token_cache_hits.get()
+        payload = verify_jwt(token)
+        self.assertEqual(payload["nickname"], "cached")
+        self.assertEqual(token_cache_hits.get(), hits + 1)
+        # 返回副本，修改不会影响缓存
+        payload["user_id"] = 2
+        self.assertEqual(verify_jwt(token)["user_id"], 1)
+        self.assertIsNone(verify_jwt(token + "x"))
+
+    def test_expiry(self):
+        """
+        缓存条目不晚于 exp 过期
+        """
+        token = generate_jwt({"user_id": 1}, expiry=int(time.time()) + 1)
+        self.assertIsNotNone(verify_jwt(token))
+        time.sleep(1.1)
+        self.assertIsNone(verify_jwt(token))
+
+
+class UsersInfoTestCase(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create(
+                username=f"bulk{i}",
+                password="x",
+                nickname=f"bulk {i}",
+                mobile="+86.123456789012",
+                magic_number=0,
+                url="https://baidu.com",
+            )
+            for i in range(3)
+        ]
+        self.client = Client()
+        self.token = generate_jwt({"user_id": self.users[0].id, "nickname": "bulk 0"})
+
+    def get(self, url, **params):
+        return self.client.get(url, params, HTTP_AUTHORIZATION=self.token)
+
+    def test_users(self):
+        """
+        一次查询返回全部用户，字段与单个用户接口一致
+        """
+        ids = ",".join(str(u.id) for u in self.users) + ",0"
+        # 只读接口信任 jwt 中的身份，只有一次 in_bulk 查询
+        with self.assertNumQueries(1):
+            response = self.get(reverse("get_users_info"), ids=ids)
+        self.assertEqual(response.status_code, 200)
+        users = response.json()["users"]
+        self.assertIsNone(users["0"])
+        single = self.get(reverse("get_user_info_by_id", args=[self.users[1].id])).json()
+        self.assertEqual(users[str(self.users[1].id)], single)
+
+    def test_invalid(self):
+        url = reverse("get_users_info")
+        self.assertEqual(self.get(url).status_code, 400)
+        self.assertEqual(self.get(url, ids="1,a").status_code, 400)
+        self.assertEqual(self.get(url, ids=",".join(map(str, range(101)))).status_code, 400)
+        self.assertEqual(self.client.get(url, {"ids": "1"}).status_code, 401)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class RevocationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            username="revoker",
+            password="x",
+            nickname="revoker",
+            mobile="+86.123456789012",
+            magic_number=0,
+            url="https://baidu.com",
+        )
+        self.token = generate_jwt({"user_id": self.user.id, "nickname": "revoker"})
+
+    def get_user_info(self, token):
+        return self.client.get(reverse("get_user_info"), HTTP_AUTHORIZATION=token)
+
+    def test_logout(self):
+        """
+        登出后 jwt 失效，其他 jwt 不受影响
+        """
+        other = generate_jwt({"user_id": self.user.id, "nickname": "revoker"})
+        self.assertEqual(self.get_user_info(self.token).status_code, 200)
+        response = self.client.post(reverse("logout"), HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_user_info(self.token).status_code, 401)
+        self.assertEqual(self.get_user_info(other).status_code, 200)
+
+    def test_bloom_fast_path(self):
+        """
+        未注销的 jwt 由布隆过滤器判断，不查询注销表
+        """
+        self.get_user_info(self.token)
+        checks = revocation_checks.get(path="filter")
+        with CaptureQueriesContext(connection) as queries:
+            self.get_user_info(self.token)
+        self.assertEqual(revocation_checks.get(path="filter"), checks + 1)
+        self.assertFalse([q for q in queries if "user_revokedtoken" in q["sql"]])
+
+    @override_settings(TOKEN_REVOCATION={"SYNC_INTERVAL": 0})
+    def test_sync(self):
+        """
+        其他 worker 写入的注销记录同步后生效
+        """
+        jti = verify_jwt(self.token)["jti"]
+        RevokedToken.objects.create(jti=jti, expires=timezone.now() + timedelta(hours=1))
+        self.assertEqual(self.get_user_info(self.token).status_code, 401)
+
+    def test_prune(self):
+        RevokedToken.objects.create(jti="expired", expires=timezone.now() - timedelta(hours=1))
+        RevokedToken.objects.create(jti="valid", expires=timezone.now() + timedelta(hours=1))
+        call_command("prune_revoked_tokens", stdout=io.StringIO())
+        self.assertEqual(list(RevokedToken.objects.values_list("jti", flat=True)), ["valid"])
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f"in{i}")
+        self.assertTrue(all(f"in{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"out{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
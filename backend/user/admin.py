@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import User
+from .models import RevokedToken, User
 
 # Register your models here.
 admin.site.register(User)
+admin.site.register(RevokedToken)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+用户信息的异步视图，在 ASGI 部署（app.urls_asgi）中替代同步视图，响应内容与 user.views 一致
+"""
+
+from rest_framework import status
+
+from utils.async_views import json_response, sync_fallback
+from utils.jwt import async_login_required
+
+from . import views
+from .controllers import aget_user, user_public_info
+
+
+@sync_fallback(views.get_user_info)
+@async_login_required
+async def get_user_info(request):
+    """
+    获取当前登录用户信息
+    """
+    user = request.user
+    return json_response(
+        {
+            "id": user.id,
+            "username": user.username,
+            "nickname": user.nickname,
+            "created": user.created,
+            "url": user.url,
+            "mobile": user.mobile,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+@sync_fallback(views.get_user_info_by_id)
+@async_login_required(trust_claims=True)
+async def get_user_info_by_id(request, userId):
+    """
+    获取指定用户信息
+    """
+    user, result = await aget_user(userId)
+    if result:
+        return json_response(user_public_info(user), status=status.HTTP_200_OK)
+    else:
+        return json_response({"message": user}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
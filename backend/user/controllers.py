@@ -1,9 +1,16 @@
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
 
+from utils.db import mark_written, read_connection
+from utils.password import PasswordHashingBusy, check_password, make_password
+
 from .models import User
 
+# 公开的用户信息字段，单个用户与批量查询共用
+PUBLIC_USER_FIELDS = ("id", "nickname", "created")
+
 
+@read_connection
 def get_user(user_id):
     try:
         u = User.objects.get(id=user_id)
@@ -15,6 +22,40 @@ def get_user(user_id):
         return "errors", False
 
 
+@read_connection
+async def aget_user(user_id):
+    try:
+        u = await User.objects.aget(id=user_id)
+        return u, True
+    except ObjectDoesNotExist:
+        return "not found", False
+    except Exception as e:
+        print(e)
+        return "errors", False
+
+
+def user_public_info(user):
+    """
+    用户的公开信息
+    """
+    return {field: getattr(user, field) for field in PUBLIC_USER_FIELDS}
+
+
+@read_connection
+def get_users_public_info(user_ids):
+    """
+    一次查询获取多个用户的公开信息
+    :param user_ids: 用户id列表
+    :return: ({用户id: 公开信息}, 是否成功)，不存在的用户不在结果中
+    """
+    try:
+        users = User.objects.only(*PUBLIC_USER_FIELDS).in_bulk(user_ids)
+        return {user_id: user_public_info(user) for user_id, user in users.items()}, True
+    except Exception as e:
+        print(e)
+        return {}, False
+
+
 def create_user(username, password, nickname, url, mobile, magic_number):
     try:
         now = timezone.now()
@@ -29,6 +70,8 @@ def create_user(username, password, nickname, url, mobile, magic_number):
             updated=now,
         )
         u.save()
+        # 注册后立即登录，登录与之后的请求需要读到新用户
+        mark_written(u.id)
         return True
     except Exception as e:
         print(e)
@@ -36,13 +79,25 @@ def create_user(username, password, nickname, url, mobile, magic_number):
 
 
 def get_user_with_pass(username, password):
+    """
+    校验用户名与明文密码，旧格式或参数已过时的哈希在校验成功后升级
+    :raise PasswordHashingBusy: 排队的哈希请求已满
+    """
     try:
         u = User.objects.get(username=username)
-        if not u.password == password:
+        matched, needs_rehash = check_password(password, u.password)
+        if not matched:
             return "not found", False
+        if needs_rehash:
+            u.password = make_password(password)
+            u.save(update_fields=["password"])
         return u, True
     except ObjectDoesNotExist:
+        # 用户不存在时同样计算一次哈希，响应时间不暴露用户名是否存在
+        check_password(password, "")
         return "not found", False
+    except PasswordHashingBusy:
+        raise
     except Exception as e:
         print(e)
         return "errors", False
@@ -16,4 +16,15 @@ class User(models.Model):
     url = models.CharField(max_length=255, verbose_name="个人地址")
 
     created = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
-    updated = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+    # 带索引，作为帖子 ETag 中昵称的行版本
+    updated = models.DateTimeField(auto_now=True, db_index=True, verbose_name="更新时间")
+
+
+class RevokedToken(models.Model):
+    """
+    已注销的 jwt，按 jti 记录，过期后可以删除
+    """
+
+    jti = models.CharField(max_length=64, unique=True, verbose_name="jwt id")
+    expires = models.DateTimeField(db_index=True, verbose_name="jwt 过期时间")
+    created = models.DateTimeField(auto_now_add=True, verbose_name="注销时间")
@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from utils.user_cache import invalidate_user
+
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """
+    用户信息保存或删除后，使已登录用户的缓存失效
+    """
+    invalidate_user(instance.id)
@@ -5,6 +5,7 @@ from . import views
 urlpatterns = [
     path("api/v1/user", views.get_user_info, name="get_user_info"),
     path("api/v1/user/<int:userId>", views.get_user_info_by_id, name="get_user_info_by_id"),
+    path("api/v1/users", views.get_users_info, name="get_users_info"),
     path("api/v1/login", views.LoginView.as_view(), name="login"),
     path("api/v1/logout", views.logout, name="logout"),
     path("api/v1/register", views.register_user, name="register"),
@@ -8,11 +8,36 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from utils.jwt import encrypt_password, generate_jwt, login_required
+from utils.password import PasswordHashingBusy
 from utils.register_params_check import register_params_check
+from utils.revocation import revoke_token
+from utils.throttle import get_client_ip, throttle
 
-from .controllers import create_user, get_user, get_user_with_pass
+from .controllers import (
+    create_user,
+    get_user,
+    get_user_with_pass,
+    get_users_public_info,
+    user_public_info,
+)
 from .models import User
 
+# 批量查询用户的数量上限
+USERS_BATCH_MAX = 100
+
+PUBLIC_USER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "integer", "description": "用户ID"},
+        "nickname": {"type": "string", "description": "用户昵称"},
+        "created": {
+            "type": "string",
+            "format": "date-time",
+            "description": "用户创建时间",
+        },
+    },
+}
+
 
 @extend_schema(
     responses={
@@ -76,21 +101,7 @@ def get_user_info(request):
         }
     },
     responses={
-        200: OpenApiResponse(
-            description="获取用户信息成功",
-            response={
-                "type": "object",
-                "properties": {
-                    "id": {"type": "integer", "description": "用户ID"},
-                    "nickname": {"type": "string", "description": "用户昵称"},
-                    "created": {
-                        "type": "string",
-                        "format": "date-time",
-                        "description": "用户创建时间",
-                    },
-                },
-            },
-        ),
+        200: OpenApiResponse(description="获取用户信息成功", response=PUBLIC_USER_SCHEMA),
         401: OpenApiResponse(description="未登录"),
         404: OpenApiResponse(description="用户不存在"),
         500: OpenApiResponse(description="服务器内部错误"),
@@ -99,7 +110,7 @@ def get_user_info(request):
     summary="获取用户昵称",
 )
 @api_view(["GET"])
-@login_required
+@login_required(trust_claims=True)
 def get_user_info_by_id(request, userId):
     """
     获取指定用户信息
@@ -107,20 +118,88 @@ def get_user_info_by_id(request, userId):
     try:
         user, result = get_user(userId)
         if result:
-            return Response(
-                {
-                    "id": user.id,
-                    "nickname": user.nickname,
-                    "created": user.created,
-                },
-                status=status.HTTP_200_OK,
-            )
+            return Response(user_public_info(user), status=status.HTTP_200_OK)
         else:
             return Response({"message": user}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     except User.DoesNotExist:
         return Response({"message": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            name="ids",
+            type=str,
+            location=OpenApiParameter.QUERY,
+            description=f"以逗号分隔的用户ID，最多 {USERS_BATCH_MAX} 个",
+            required=True,
+        )
+    ],
+    responses={
+        200: OpenApiResponse(
+            description="获取用户信息成功，不存在的用户对应的值为 null",
+            response={
+                "type": "object",
+                "properties": {
+                    "users": {
+                        "type": "object",
+                        "description": "以用户ID为键的用户信息",
+                        "additionalProperties": PUBLIC_USER_SCHEMA,
+                    }
+                },
+            },
+        ),
+        400: OpenApiResponse(description="无效的参数"),
+        401: OpenApiResponse(description="未登录"),
+        500: OpenApiResponse(description="服务器内部错误"),
+    },
+    description="批量获取用户昵称，一次查询返回全部用户",
+    summary="批量获取用户昵称",
+)
+@api_view(["GET"])
+@login_required(trust_claims=True)
+def get_users_info(request):
+    """
+    批量获取用户信息
+    """
+    try:
+        user_ids = list(dict.fromkeys(int(i) for i in request.GET.get("ids", "").split(",")))
+    except ValueError:
+        return Response({"message": "invalid arguments: ids"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(user_ids) > USERS_BATCH_MAX:
+        return Response({"message": "too many ids"}, status=status.HTTP_400_BAD_REQUEST)
+
+    users, result = get_users_public_info(user_ids)
+    if not result:
+        return Response({"message": "errors"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(
+        {"users": {user_id: users.get(user_id) for user_id in user_ids}},
+        status=status.HTTP_200_OK,
+    )
+
+
+def busy_response():
+    """
+    密码哈希队列已满
+    """
+    return Response(
+        {"message": "Server busy, please retry later"},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
+
+
+def throttled_response(retry_after):
+    """
+    登录或注册过于频繁
+    """
+    return Response(
+        {"message": "Too many requests"},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
 class LoginView(APIView):
     """
     用户登录视图类
@@ -155,6 +234,8 @@ class LoginView(APIView):
             401: OpenApiResponse(description="无效的凭证"),
             405: OpenApiResponse(description="方法不允许"),
             400: OpenApiResponse(description="无效的参数"),
+            429: OpenApiResponse(description="请求过于频繁"),
+            503: OpenApiResponse(description="服务器繁忙"),
         },
         description="用户登录接口",
         summary="用户登录",
@@ -171,9 +252,14 @@ class LoginView(APIView):
             # print("username: ", username)
             # print("password: ", password)
 
-            user, result = get_user_with_pass(
-                username=username, password=encrypt_password(password)
+            # 在计算哈希之前限流
+            allowed, retry_after = throttle(
+                login_ip=get_client_ip(request), login_username=username
             )
+            if not allowed:
+                return throttled_response(retry_after)
+
+            user, result = get_user_with_pass(username=username, password=password)
 
             # print("user: ", user)
             # print("result: ", result)
@@ -194,6 +280,8 @@ class LoginView(APIView):
                     {"message": "Invalid credentials"},
                     status=status.HTTP_401_UNAUTHORIZED,
                 )
+        except PasswordHashingBusy:
+            return busy_response()
         except json.JSONDecodeError:
             return Response({"message": "Bad arguments"}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
@@ -226,9 +314,11 @@ class LoginView(APIView):
 @login_required
 def logout(request):
     """
-    登出
-    本次作业中简化，不做任何操作
+    登出，注销当前的 jwt
     """
+    payload = getattr(request, "jwt_payload", None)
+    if payload and payload.get("jti"):
+        revoke_token(payload["jti"], payload.get("exp"))
     return Response({"message": "ok"}, status=status.HTTP_200_OK)
 
 
@@ -251,7 +341,9 @@ def logout(request):
         200: OpenApiResponse(description="用户注册成功"),
         400: OpenApiResponse(description="无效的参数"),
         405: OpenApiResponse(description="方法不允许"),
+        429: OpenApiResponse(description="请求过于频繁"),
         500: OpenApiResponse(description="服务器内部错误"),
+        503: OpenApiResponse(description="服务器繁忙"),
     },
     description="用户注册接口，用于创建新用户",
     summary="用户注册",
@@ -276,6 +368,10 @@ def register_user(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        allowed, retry_after = throttle(register_ip=get_client_ip(request))
+        if not allowed:
+            return throttled_response(retry_after)
+
         username = content.get("username")
         password = content.get("password")
         nickname = content.get("nickname")
@@ -295,6 +391,8 @@ def register_user(request):
             return Response({"message": "ok"}, status=status.HTTP_200_OK)
         else:
             return Response({"message": "Error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except PasswordHashingBusy:
+        return busy_response()
     except json.JSONDecodeError:
         return Response({"message": "Bad arguments"}, status=status.HTTP_400_BAD_REQUEST)
     except:
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+异步视图的公共工具
+
+异步视图不经过 DRF，直接返回 Django 的 HttpResponse，响应内容与 DRF 的 JSONRenderer 一致：
+同样的编码器（datetime 序列化为 ISO 8601），不转义非 ASCII 字符，紧凑分隔符。
+"""
+
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def json_response(data=None, status=200, headers=None):
+    """
+    data 为 None 时返回空响应体，与 DRF 的 Response(status=...) 一致
+    """
+    content = b""
+    if data is not None:
+        content = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":"))
+    return HttpResponse(content, status=status, headers=headers, content_type="application/json")
+
+
+def sync_fallback(sync_view, methods=("GET",)):
+    """
+    异步视图只处理 methods 中的请求方法，其余方法交给原来的同步视图，在线程中执行
+    """
+    sync_view = sync_to_async(sync_view)
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return await sync_view(request, *args, **kwargs)
+            return await func(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
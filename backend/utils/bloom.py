@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    布隆过滤器，不在过滤器中的元素一定没有加入过，在过滤器中的元素有一定的误判率
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        """
+        :param capacity: 预计的元素数量，超过后误判率上升
+        :param error_rate: 元素数量为 capacity 时的误判率
+        """
+        self.capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _indexes(self, item):
+        # 双重哈希：h1 + i * h2
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for index in self._indexes(item):
+            self.bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(item))
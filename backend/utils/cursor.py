@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import base64
+import datetime
+import json
+
+
+def encode_cursor(*values):
+    """
+    将排序键编码为不透明的游标字符串
+    :param values: 排序键，datetime 会被转换为 ISO 格式
+    :return: str 游标
+    """
+    items = [v.isoformat() if isinstance(v, datetime.datetime) else v for v in values]
+    raw = json.dumps(items, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, *types):
+    """
+    解析游标字符串
+    :param cursor: str 游标
+    :param types: 每个排序键的类型（datetime.datetime / int / float / str）
+    :return: tuple 排序键，游标非法时返回 None
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        items = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(items, list) or len(items) != len(types):
+            return None
+        values = []
+        for item, t in zip(items, types):
+            if t is datetime.datetime:
+                values.append(datetime.datetime.fromisoformat(item))
+            else:
+                values.append(t(item))
+        return tuple(values)
+    except (ValueError, TypeError, UnicodeError):
+        return None
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+读写分离
+
+用 read_connection 装饰的函数中，只读查询使用 DATABASE_REPLICAS["ALIASES"] 中的一个只读副本，
+写操作与事务中的查询仍使用 default（主库）。没有配置副本时全部查询使用 default。
+本地 SQLite 部署的副本 read 与 default 是同一个数据库文件，MySQL 部署的副本见 settings_prod.py。
+
+副本的数据有复制延迟。为了让用户总能读到自己刚写入的数据，请求在 viewer(user_id) 中执行：
+用户在 STICKY_SECONDS 内写入过时，其读查询仍使用主库。写入记录在 CACHE_ALIAS 对应的缓存中，
+只有该缓存是多 worker 共享的缓存时，才对其他 worker 上的后续请求生效；
+默认的 LocMemCache 是进程内缓存，粘滞只在写入的 worker 内生效。
+读路径上初始化计数器等派生数据的写入在 derived_writes() 中执行，不开始粘滞窗口。
+"""
+
+import asyncio
+import functools
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+KEY_PREFIX = "forum:db:written:"
+
+# 当前 read_connection 调用选定的副本，None 表示不在只读函数中或没有可用的副本
+# 异步视图的查询在 sync_to_async 的线程中执行，contextvars 会被复制到线程中
+_replica = ContextVar("replica", default=None)
+# 当前请求的用户，见 viewer
+_viewer = ContextVar("viewer", default=None)
+# 为 False 时写入不记录到粘滞窗口，见 derived_writes
+_sticky_writes = ContextVar("sticky_writes", default=True)
+
+
+def get_replica_settings():
+    options = {
+        "ALIASES": [],
+        "STICKY_SECONDS": 5,
+        "CACHE_ALIAS": "default",
+    }
+    options.update(getattr(settings, "DATABASE_REPLICAS", {}))
+    return options
+
+
+def get_replicas():
+    return [alias for alias in get_replica_settings()["ALIASES"] if alias in connections.settings]
+
+
+def read_connection(func):
+    """
+    装饰同步或异步函数，函数中的只读查询使用只读副本，嵌套调用沿用外层选定的副本
+    """
+
+    def enter():
+        return _replica.set(_replica.get() or random.choice(get_replicas() or [None]))
+
+    if asyncio.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            token = enter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _replica.reset(token)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = enter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _replica.reset(token)
+
+    return wrapper
+
+
+class Viewer:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        # None 表示尚未查询缓存，只在第一次读副本时查询
+        self.pinned = None
+        self.written = False
+
+
+def _written_key(user_id):
+    return KEY_PREFIX + str(user_id)
+
+
+@contextmanager
+def viewer(user_id):
+    """
+    以 user_id 的身份执行块内的查询：用户最近写入过时读主库，块内的写入开始新的粘滞窗口
+    """
+    token = _viewer.set(Viewer(user_id))
+    try:
+        yield
+    finally:
+        _viewer.reset(token)
+
+
+@contextmanager
+def derived_writes():
+    """
+    块内的写入不开始粘滞窗口，用于读请求中初始化与主库数据一致的派生数据（例如计数器）
+    """
+    token = _sticky_writes.set(False)
+    try:
+        yield
+    finally:
+        _sticky_writes.reset(token)
+
+
+def mark_written(user_id=None):
+    """
+    记录用户的写入，STICKY_SECONDS 内该用户的读查询使用主库
+    :param user_id: 默认为当前请求的用户
+    """
+    if not _sticky_writes.get():
+        return
+    state = _viewer.get()
+    if user_id is None:
+        if state is None or state.written:
+            return
+        user_id = state.user_id
+    if user_id is None:
+        return
+    if state is not None and state.user_id == user_id:
+        # 先设置标记，缓存本身写数据库时（DatabaseCache）不会再次进入这里
+        state.pinned = state.written = True
+    options = get_replica_settings()
+    caches[options["CACHE_ALIAS"]].set(_written_key(user_id), 1, options["STICKY_SECONDS"])
+
+
+def is_pinned():
+    """
+    当前请求的用户是否在写入后的粘滞窗口内
+    """
+    state = _viewer.get()
+    if state is None or state.user_id is None:
+        return False
+    if state.pinned is None:
+        cache = caches[get_replica_settings()["CACHE_ALIAS"]]
+        state.pinned = cache.get(_written_key(state.user_id)) is not None
+    return state.pinned
+
+
+class ReplicaRouter:
+    """
+    数据库路由，在查询执行时（异步视图中为执行查询的线程）决定使用的连接
+    """
+
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        if replica is None or replica not in connections.settings:
+            return None
+        # 事务中的查询需要读到本事务未提交的写入
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if is_pinned():
+            return None
+        return replica
+
+    def db_for_write(self, model, **hints):
+        aliases = get_replica_settings()["ALIASES"]
+        if aliases:
+            mark_written()
+        # 从副本读出的对象写回主库
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db in aliases:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *get_replica_settings()["ALIASES"]}
+        if {obj1._state.db, obj2._state.db} <= aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # 副本的表结构由主库复制
+        if db in get_replica_settings()["ALIASES"]:
+            return False
+        return None
+
+
+def add_database(alias, engine, name, options, **extra):
+    """
+    运行时添加数据库连接配置，用于基准测试与测试，每个线程访问 connections[alias] 时建立自己的连接
+    :param extra: 其他配置，例如 CONN_MAX_AGE
+    """
+    # configure_settings 要求字典中包含 default
+    settings_dict = connections.configure_settings(
+        {DEFAULT_DB_ALIAS: {"ENGINE": engine, "NAME": name, "OPTIONS": dict(options), **extra}}
+    )[DEFAULT_DB_ALIAS]
+    connections.settings[alias] = settings_dict
+
+
+def remove_database(alias):
+    connection = connections[alias]
+    connection.close()
+    # 连接池中的连接
+    if getattr(connection, "pool", None) is not None:
+        connection.pool.close()
+    del connections[alias]
+    del connections.settings[alias]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+import hashlib
+
+
+def make_etag(*parts):
+    """
+    由行版本等信息生成强 ETag
+    """
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(request, etag):
+    """
+    判断请求的 If-None-Match 是否与 etag 匹配
+    """
+    header = request.headers.get("If-None-Match")
+    if not header or etag is None:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
@@ -1,15 +1,51 @@
 # -*- coding: utf-8 -*-
-import base64
 import datetime
+import hashlib
+import threading
+import time
+import uuid
+from functools import wraps
 
 import jwt
-import scrypt
 from django.conf import settings
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from user.controllers import get_user
+from user.models import User
+from utils import metrics
+from utils.async_views import json_response
+from utils.cache import LRUCache
+from utils.db import viewer
+from utils.password import make_password
+from utils.revocation import ais_revoked, is_revoked
+from utils.user_cache import aget_authenticated_user, get_authenticated_user
+
+token_cache_hits = metrics.counter("forum_jwt_cache_hits_total", "Verified token cache hits")
+token_cache_misses = metrics.counter("forum_jwt_cache_misses_total", "Verified token cache misses")
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    """
+    已校验 jwt 的载荷缓存，进程内 LRU，线程安全
+    """
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                options = getattr(settings, "JWT_CACHE", {})
+                _token_cache = LRUCache(options.get("MAX_ENTRIES", 10000), options.get("TTL", 300))
+    return _token_cache
+
+
+def token_digest(token):
+    """
+    缓存键，包含密钥，更换密钥后旧的缓存条目不再命中
+    """
+    return hashlib.sha256(f"{settings.JWT_SECRET}\0{token}".encode()).digest()
 
 
 def generate_jwt(payload, expiry=None):
@@ -26,7 +62,8 @@ def generate_jwt(payload, expiry=None):
         print("now:", now)
         print("expiry:", expiry)
 
-    _payload = {"exp": expiry}
+    # jti 用于注销
+    _payload = {"exp": expiry, "jti": uuid.uuid4().hex}
     _payload.update(payload)
 
     secret = settings.JWT_SECRET
@@ -39,9 +76,18 @@ def generate_jwt(payload, expiry=None):
 def verify_jwt(token):
     """
     校验jwt
+    校验通过的载荷会被缓存，缓存条目不晚于 jwt 的 exp 过期；校验失败的 jwt 不缓存
     :param token: jwt
     :return: dict: payload
     """
+    token_cache = get_token_cache()
+    key = token_digest(token)
+    payload = token_cache.get(key)
+    if payload is not None:
+        token_cache_hits.inc()
+        return dict(payload)
+    token_cache_misses.inc()
+
     secret = settings.JWT_SECRET
 
     try:
@@ -49,36 +95,82 @@ def verify_jwt(token):
     except jwt.PyJWTError:
         payload = None
 
+    if payload is not None:
+        ttl = token_cache.ttl
+        if "exp" in payload:
+            ttl = min(ttl, payload["exp"] - time.time())
+        if ttl > 0:
+            token_cache.set(key, dict(payload), ttl=ttl)
+
     return payload
 
 
 def encrypt_password(password):
-    salt = settings.SALT
-    key = scrypt.hash(password, salt, 32768, 8, 1, 32)
-    return base64.b64encode(key).decode("ascii")
+    """
+    在密码哈希进程池中计算，格式见 utils.password
+    :raise PasswordHashingBusy: 排队的哈希请求已满
+    """
+    return make_password(password)
 
 
-def jwt_authentication(request):
+def jwt_authentication(request, trust_claims=False):
     """
     根据jwt验证用户身份
+    批量请求的子请求带有 authenticated_user，直接沿用批量请求已验证的用户
+    :param trust_claims: 直接使用 jwt 中的 user_id 与 nickname 构造用户，不查询数据库
     """
+    authenticated_user = getattr(request, "authenticated_user", None)
+    if authenticated_user is not None:
+        request.user = authenticated_user
+        return
+
     request.user = None
+    request.jwt_payload = None
     token = request.headers.get("Authorization")
     # print("token: ", token)
     if token:
         payload = verify_jwt(token)
-        if payload:
+        if payload and not is_revoked(payload.get("jti")):
+            request.jwt_payload = payload
+            user_id = payload.get("user_id")
+            if trust_claims and user_id is not None and "nickname" in payload:
+                # 未保存的 User 对象，只有 id 与 nickname
+                request.user = User(id=user_id, nickname=payload["nickname"])
+            else:
+                # 刚注册的用户在副本上可能还不存在
+                with viewer(user_id):
+                    request.user = get_authenticated_user(user_id)
+
+
+async def ajwt_authentication(request, trust_claims=False):
+    """
+    jwt_authentication 的异步版本，jwt 校验结果缓存在进程内，只有查询用户与注销记录时访问数据库
+    """
+    request.user = None
+    request.jwt_payload = None
+    token = request.headers.get("Authorization")
+    if token:
+        payload = verify_jwt(token)
+        if payload and not await ais_revoked(payload.get("jti")):
+            request.jwt_payload = payload
             user_id = payload.get("user_id")
-            user, result = get_user(user_id)
-            if result:
-                request.user = user
+            if trust_claims and user_id is not None and "nickname" in payload:
+                request.user = User(id=user_id, nickname=payload["nickname"])
+            else:
+                with viewer(user_id):
+                    request.user = await aget_authenticated_user(user_id)
 
 
-def login_required(func):
+def login_required(func=None, trust_claims=False):
     """
     用户必须登录装饰器
     使用方法：放在 method_decorators 中
+    只读且不使用用户其他字段的接口可以使用 @login_required(trust_claims=True)，
+    身份只由 jwt 签名保证，用户被删除后 jwt 过期前仍可访问
+    视图以登录用户的身份执行，用户刚写入过时读主库，见 utils/db.py
     """
+    if func is None:
+        return lambda f: login_required(f, trust_claims=trust_claims)
 
     # @wraps(func)
     def wrapper(*args, **kwargs):
@@ -89,12 +181,33 @@ def login_required(func):
 
         # print("request: ", request)
 
-        jwt_authentication(request)
+        jwt_authentication(request, trust_claims)
         if not request.user:
             return Response(
                 {"message": "User must be authorized."}, status=status.HTTP_401_UNAUTHORIZED
             )
         else:
-            return func(*args, **kwargs)
+            with viewer(request.user.id):
+                return func(*args, **kwargs)
+
+    return wrapper
+
+
+def async_login_required(func=None, trust_claims=False):
+    """
+    异步视图的用户必须登录装饰器，参数与 login_required 相同
+    """
+    if func is None:
+        return lambda f: async_login_required(f, trust_claims=trust_claims)
+
+    @wraps(func)
+    async def wrapper(request, *args, **kwargs):
+        await ajwt_authentication(request, trust_claims)
+        if not request.user:
+            return json_response(
+                {"message": "User must be authorized."}, status=status.HTTP_401_UNAUTHORIZED
+            )
+        with viewer(request.user.id):
+            return await func(request, *args, **kwargs)
 
     return wrapper
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+进程内指标，以 Prometheus 文本格式通过 /api/v1/metrics 暴露
+每个 worker 进程各自计数，多进程部署时由抓取端按实例汇总
+接口默认关闭，见 settings.METRICS
+"""
+
+import threading
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_registry = {}
+
+
+def get_metrics_settings():
+    options = {"ENABLED": False, "TOKEN": ""}
+    options.update(getattr(settings, "METRICS", {}))
+    return options
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in key) + "}"
+
+
+class Counter:
+    """
+    单调递增计数器
+    """
+
+    type = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """
+    可增可减的瞬时值
+    """
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with _lock:
+            self._values[_label_key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Summary:
+    """
+    观测值的次数、总和与最大值，例如耗时
+    """
+
+    type = "summary"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            count, total, maximum = self._values.get(key, (0, 0.0, 0.0))
+            self._values[key] = (count + 1, total + value, max(maximum, value))
+
+    def get(self, **labels):
+        return self._values.get(_label_key(labels), (0, 0.0, 0.0))
+
+    def samples(self):
+        result = []
+        for key, (count, total, maximum) in self._values.items():
+            result.append((self.name + "_count", key, count))
+            result.append((self.name + "_sum", key, total))
+            result.append((self.name + "_max", key, maximum))
+        return result
+
+
+def _register(cls, name, help):
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, help)
+        return metric
+
+
+def counter(name, help=""):
+    return _register(Counter, name, help)
+
+
+def gauge(name, help=""):
+    return _register(Gauge, name, help)
+
+
+def summary(name, help=""):
+    return _register(Summary, name, help)
+
+
+def render():
+    """
+    以 Prometheus 文本格式输出全部指标
+    """
+    lines = []
+    with _lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI 部署使用的中间件
+
+MiddlewareMixin 在异步请求中把 process_request 与 process_response 放到线程中执行，
+每个中间件每个请求切换两次线程，所有切换都排队在同一个线程上，比视图本身还慢。
+下面的中间件与 Django 自带的行为相同，只做 CPU 计算的步骤直接在事件循环中执行，
+可能访问数据库的步骤仍然切换到线程。
+"""
+
+from asgiref.sync import sync_to_async
+from corsheaders import middleware as cors
+from django.conf import settings
+from django.contrib.auth import middleware as auth
+from django.contrib.messages import middleware as messages
+from django.contrib.sessions import middleware as sessions
+from django.middleware import clickjacking, common, security
+
+
+class InlineMiddlewareMixin:
+    async def __acall__(self, request):
+        response = None
+        if hasattr(self, "process_request"):
+            response = self.process_request(request)
+        response = response or await self.get_response(request)
+        if hasattr(self, "process_response"):
+            if self.response_needs_thread(request, response):
+                response = await sync_to_async(self.process_response)(request, response)
+            else:
+                response = self.process_response(request, response)
+        return response
+
+    def response_needs_thread(self, request, response):
+        return False
+
+
+class SecurityMiddleware(InlineMiddlewareMixin, security.SecurityMiddleware):
+    pass
+
+
+class SessionMiddleware(InlineMiddlewareMixin, sessions.SessionMiddleware):
+    """
+    会话在视图中是惰性加载的，只有需要保存时 process_response 才访问数据库
+    """
+
+    def response_needs_thread(self, request, response):
+        return request.session.modified or settings.SESSION_SAVE_EVERY_REQUEST
+
+
+class CorsMiddleware(InlineMiddlewareMixin, cors.CorsMiddleware):
+    pass
+
+
+class CommonMiddleware(InlineMiddlewareMixin, common.CommonMiddleware):
+    pass
+
+
+class AuthenticationMiddleware(InlineMiddlewareMixin, auth.AuthenticationMiddleware):
+    """
+    request.user 是惰性对象，同步视图在线程中访问时才查询数据库
+    """
+
+
+class MessageMiddleware(InlineMiddlewareMixin, messages.MessageMiddleware):
+    """
+    消息写入 cookie 或会话，会话由 SessionMiddleware 保存
+    """
+
+
+class XFrameOptionsMiddleware(InlineMiddlewareMixin, clickjacking.XFrameOptionsMiddleware):
+    pass
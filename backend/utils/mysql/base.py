@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""
+MySQL 数据库后端，在 Django 自带后端的基础上支持 OPTIONS["pool"] 连接池，见 utils/pool.py
+"""
+
+from django.db.backends.mysql import base
+
+from utils.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def is_pooled_connection_usable(self, connection):
+        try:
+            connection.ping()
+            return True
+        except base.Database.Error:
+            return False
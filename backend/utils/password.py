@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+密码哈希
+
+scrypt 每次计算约需 100ms CPU 与 32MB 内存，放在独立的进程池中执行，不占用请求 worker。
+进程池前有一个有界队列，排队（含正在计算）的数量达到上限时直接抛出 PasswordHashingBusy，
+由视图返回 503，避免登录高峰拖慢其他接口。等待超过 TIMEOUT 秒或进程池损坏（子进程被杀死）时
+抛出其子类 PasswordHashingUnavailable，同样返回 503，而不是被当作密码错误；损坏的进程池被替换。
+
+哈希格式：$scrypt$n=32768,r=8,p=1$<盐>$<哈希>，盐与哈希为 base64，每个用户的盐随机生成。
+早期的哈希是全局盐 settings.SALT、固定参数下的裸 base64，仍可校验，登录成功后升级为新格式。
+"""
+
+import base64
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import scrypt
+from django.conf import settings
+
+from utils import metrics
+
+hash_queue_depth = metrics.gauge(
+    "forum_password_hash_queue_depth", "Password hashes queued or running in the pool"
+)
+hash_seconds = metrics.summary(
+    "forum_password_hash_seconds", "Password hash latency including queueing"
+)
+hash_rejected = metrics.counter(
+    "forum_password_hash_rejected_total", "Password hashes rejected because the queue was full"
+)
+hash_failures = metrics.counter(
+    "forum_password_hash_failures_total", "Password hashes that timed out or hit a broken pool"
+)
+
+
+class PasswordHashingBusy(Exception):
+    """
+    哈希队列已满
+    """
+
+
+class PasswordHashingUnavailable(PasswordHashingBusy):
+    """
+    等待哈希超时或进程池损坏
+    """
+
+
+def scrypt_hash(password, salt, n=32768, r=8, p=1, length=32):
+    """
+    在进程池的子进程中执行
+    """
+    key = scrypt.hash(password, salt, n, r, p, length)
+    return base64.b64encode(key).decode("ascii")
+
+
+def get_hashing_settings():
+    options = {"WORKERS": 2, "QUEUE_SIZE": 16, "TIMEOUT": 10, "START_METHOD": "forkserver"}
+    options.update(getattr(settings, "PASSWORD_HASHING", {}))
+    return options
+
+
+_pool = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _new_pool(options):
+    # 请求线程运行时直接 fork 并不安全，默认由 forkserver 创建子进程
+    return ProcessPoolExecutor(
+        max_workers=options["WORKERS"],
+        mp_context=multiprocessing.get_context(options["START_METHOD"]),
+    )
+
+
+def _replace_broken_pool(pool):
+    """
+    子进程异常退出后进程池不再接受任务，换成新的进程池，其他线程同时发现时只替换一次
+    """
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = _new_pool(get_hashing_settings())
+    pool.shutdown(wait=False)
+
+
+def get_pool():
+    """
+    :return: (进程池, 队列名额)，WORKERS 为 0 时进程池为 None，在当前线程中计算
+    """
+    global _pool, _slots
+    if _slots is None:
+        with _lock:
+            if _slots is None:
+                options = get_hashing_settings()
+                if options["WORKERS"] > 0:
+                    _pool = _new_pool(options)
+                _slots = threading.BoundedSemaphore(options["WORKERS"] + options["QUEUE_SIZE"])
+    return _pool, _slots
+
+
+def run_hash(func, *args):
+    """
+    在进程池中执行哈希函数
+    :raise PasswordHashingBusy: 队列已满
+    :raise PasswordHashingUnavailable: 等待超时或进程池损坏
+    """
+    pool, slots = get_pool()
+    if not slots.acquire(blocking=False):
+        hash_rejected.inc()
+        raise PasswordHashingBusy()
+
+    hash_queue_depth.inc()
+    start = time.perf_counter()
+    try:
+        if pool is None:
+            return func(*args)
+        try:
+            future = pool.submit(func, *args)
+            return future.result(timeout=get_hashing_settings()["TIMEOUT"])
+        except FutureTimeoutError:
+            # 还在排队时取消，已经开始计算的任务无法取消
+            future.cancel()
+            hash_failures.inc(reason="timeout")
+            raise PasswordHashingUnavailable("password hashing timed out")
+        except BrokenProcessPool:
+            hash_failures.inc(reason="broken")
+            _replace_broken_pool(pool)
+            raise PasswordHashingUnavailable("password hashing pool is broken")
+    finally:
+        hash_seconds.observe(time.perf_counter() - start)
+        hash_queue_depth.dec()
+        slots.release()
+
+
+ALGORITHM = "scrypt"
+SALT_BYTES = 16
+
+
+def get_scrypt_params():
+    """
+    :return: (n, r, p) 当前的哈希参数，可用 calibrate_password_hash 命令测算
+    """
+    options = {"N": 32768, "R": 8, "P": 1}
+    options.update(getattr(settings, "PASSWORD_SCRYPT", {}))
+    return options["N"], options["R"], options["P"]
+
+
+def make_password(password):
+    """
+    以当前参数与随机盐计算哈希
+    :raise PasswordHashingBusy: 排队的哈希请求已满
+    """
+    n, r, p = get_scrypt_params()
+    salt = base64.b64encode(os.urandom(SALT_BYTES)).decode("ascii")
+    key = run_hash(scrypt_hash, password, salt, n, r, p)
+    return f"${ALGORITHM}$n={n},r={r},p={p}${salt}${key}"
+
+
+def parse_password(encoded):
+    """
+    :return: ((n, r, p), 盐, 哈希)，不是新格式时返回 None
+    """
+    parts = encoded.split("$")
+    if len(parts) != 5 or parts[0] or parts[1] != ALGORITHM:
+        return None
+    try:
+        params = dict(item.split("=", 1) for item in parts[2].split(","))
+        return (int(params["n"]), int(params["r"]), int(params["p"])), parts[3], parts[4]
+    except (KeyError, ValueError):
+        return None
+
+
+def check_password(password, encoded):
+    """
+    校验密码
+    :return: (是否正确, 是否需要以当前参数重新哈希)
+    :raise PasswordHashingBusy: 排队的哈希请求已满
+    """
+    parsed = parse_password(encoded)
+    if parsed is None:
+        # 旧格式：全局盐，固定参数
+        key = run_hash(scrypt_hash, password, settings.SALT)
+        return hmac.compare_digest(key, encoded), True
+
+    params, salt, expected = parsed
+    key = run_hash(scrypt_hash, password, salt, *params)
+    return hmac.compare_digest(key, expected), params != get_scrypt_params()
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+数据库连接池
+
+Django 默认每个请求结束时关闭连接（CONN_MAX_AGE = 0），下一个请求重新建立连接；
+CONN_MAX_AGE > 0 时每个线程保持一个持久连接，连接数随线程数增长，线程空闲时也不释放。
+连接池在每个 worker 进程中按数据库别名保存空闲连接：请求结束时 close() 把连接归还连接池，
+下一个请求（任意线程）直接取用。
+
+在 DATABASES 的 OPTIONS 中配置 "pool" 启用，后端需要继承 PooledDatabaseWrapperMixin：
+MAX_SIZE: 连接总数（在用与空闲）上限，全部在用时等待其他请求归还
+TIMEOUT: 等待连接的秒数，超时抛出 PoolTimeout
+IDLE_TIMEOUT: 空闲超过该秒数的连接在下次取用或归还时关闭
+CONN_HEALTH_CHECKS 为 True 时，取出空闲连接前先检查是否可用，数据库重启或服务端断开
+空闲连接后，失效的连接不会交给请求。
+"""
+
+import functools
+import os
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+
+from utils import metrics
+
+POOL_DEFAULTS = {
+    "MAX_SIZE": 10,
+    "TIMEOUT": 10,
+    "IDLE_TIMEOUT": 300,
+}
+
+pool_in_use = metrics.gauge("forum_db_pool_in_use", "Pooled database connections in use")
+pool_idle = metrics.gauge("forum_db_pool_idle", "Idle pooled database connections")
+pool_wait_seconds = metrics.summary(
+    "forum_db_pool_wait_seconds", "Time spent waiting for a pooled database connection"
+)
+pool_timeouts = metrics.counter(
+    "forum_db_pool_timeouts_total", "Requests that timed out waiting for a pooled connection"
+)
+connections_opened = metrics.counter(
+    "forum_db_connections_opened_total", "New database connections opened"
+)
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception as e:
+        print(e)
+
+
+class ConnectionPool:
+    def __init__(self, alias, max_size, timeout, idle_timeout):
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        # (连接, 归还时间)，最近归还的在右端，优先复用，左端的连接空闲最久
+        self._idle = deque()
+        # 已建立的连接数，包括在用与空闲
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def _prune(self, now):
+        """
+        取出空闲过久的连接，需要持有锁，调用者在锁外关闭
+        """
+        expired = []
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+        return expired
+
+    def _update_gauges(self):
+        pool_idle.set(len(self._idle), alias=self.alias)
+        pool_in_use.set(self._size - len(self._idle), alias=self.alias)
+
+    def _reserve(self):
+        """
+        :return: 空闲连接，或者 None 表示可以建立新连接
+        :raise PoolTimeout: 等待超时
+        """
+        start = time.monotonic()
+        expired = []
+        try:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    expired += self._prune(now)
+                    if self._idle:
+                        connection = self._idle.pop()[0]
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        connection = None
+                        break
+                    remaining = start + self.timeout - now
+                    if remaining <= 0:
+                        pool_timeouts.inc(alias=self.alias)
+                        raise PoolTimeout(
+                            f"No connection available in pool {self.alias!r} "
+                            f"after {self.timeout}s ({self.max_size} in use)"
+                        )
+                    self._cond.wait(remaining)
+                self._update_gauges()
+        finally:
+            for expired_connection in expired:
+                _close_quietly(expired_connection)
+        pool_wait_seconds.observe(time.monotonic() - start, alias=self.alias)
+        return connection
+
+    def _forget(self):
+        """
+        一个连接被关闭或建立失败，空出的名额交给等待的请求
+        """
+        with self._cond:
+            self._size -= 1
+            self._update_gauges()
+            self._cond.notify()
+
+    def acquire(self, connect, check=None):
+        """
+        :param connect: 建立新连接的函数
+        :param check: 检查空闲连接是否可用的函数，None 表示不检查
+        """
+        while True:
+            connection = self._reserve()
+            if connection is None:
+                try:
+                    return connect()
+                except BaseException:
+                    self._forget()
+                    raise
+            if check is None or check(connection):
+                return connection
+            _close_quietly(connection)
+            self._forget()
+
+    def release(self, connection, reusable=True):
+        if not reusable:
+            _close_quietly(connection)
+            self._forget()
+            return
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            expired = self._prune(time.monotonic())
+            self._update_gauges()
+            self._cond.notify()
+        for expired_connection in expired:
+            _close_quietly(expired_connection)
+
+    def close(self):
+        """
+        关闭全部空闲连接，在用的连接归还时照常放回
+        """
+        with self._cond:
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._update_gauges()
+            self._cond.notify_all()
+        for connection in idle:
+            _close_quietly(connection)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, name, options):
+    """
+    :param name: 数据库名称，同一个别名指向不同的数据库（例如测试中）时使用不同的连接池
+    """
+    key = (alias, str(name))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                options = {**POOL_DEFAULTS, **options}
+                pool = _pools[key] = ConnectionPool(
+                    alias, options["MAX_SIZE"], options["TIMEOUT"], options["IDLE_TIMEOUT"]
+                )
+    return pool
+
+
+def close_pools():
+    """
+    关闭全部空闲连接，gunicorn master 在 fork 之前调用
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+
+def _reset_after_fork():
+    # 子进程不能使用父进程的连接，也不能关闭它们（MySQL 会断开父进程的连接），只丢弃引用
+    global _pools, _pools_lock
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    数据库后端的连接池支持，OPTIONS 中没有 "pool" 时与原后端相同
+    子类在 new_connection 中初始化新建立的连接，复用的连接不会再次初始化
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool_options = self.settings_dict["OPTIONS"].get("pool")
+        self._pool = None
+        self._pool_pid = None
+
+    @property
+    def pool(self):
+        """
+        当前进程的连接池。fork 之前创建的 DatabaseWrapper（例如 gunicorn worker 的主线程）
+        在子进程中第一次使用时重新取得连接池，连接不会归还到父进程的连接池
+        """
+        if self._pool_options is None:
+            return None
+        pid = os.getpid()
+        if self._pool_pid != pid:
+            self._pool = get_pool(self.alias, self.settings_dict["NAME"], self._pool_options)
+            self._pool_pid = pid
+        return self._pool
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("pool", None)
+        return params
+
+    def new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        connections_opened.inc(alias=self.alias)
+        return connection
+
+    def get_new_connection(self, conn_params):
+        connect = functools.partial(self.new_connection, conn_params)
+        if self.pool is None:
+            return connect()
+        check = (
+            self.is_pooled_connection_usable if self.settings_dict["CONN_HEALTH_CHECKS"] else None
+        )
+        return self.pool.acquire(connect, check)
+
+    def is_pooled_connection_usable(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _close(self):
+        if self.pool is None or self.connection is None:
+            return super()._close()
+        # 事务中关闭时直接断开，回滚由数据库完成；出过错的连接检查后再放回
+        reusable = not self.in_atomic_block
+        if reusable and self.errors_occurred:
+            reusable = self.is_pooled_connection_usable(self.connection)
+        self.pool.release(self.connection, reusable)
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+进程内的发布订阅中心，用于 SSE 推送
+
+事件本身保存在数据库中（例如回帖），事件 id 即行 id，单调递增。自增 id 在 INSERT 时分配，
+并发事务可能不按 id 顺序提交（MySQL），游标越过未提交的较小 id 后该事件再也不会投递；
+因此同一频道的事件行需要在写入之前锁定同一行（回帖锁定帖子行，帖子锁定帖子计数器），
+使 id 顺序与提交顺序一致。发布者只通知频道有新事件，
+中心以频道上次投递的 id 为游标查询一次新事件，再分发给本进程内该频道的全部订阅者，
+查询次数与订阅者数量无关。断线重连时按 Last-Event-ID 从数据库补发错过的事件。
+
+local：只通知本进程的订阅者，适用于单 worker
+cache：另外递增共享缓存中频道的版本号，每个进程的轮询线程发现版本变化后查询新事件，
+       其他 worker 发布的事件最多延迟 POLL_INTERVAL 秒送达
+
+事件源（source）需要提供 load(after_id, limit) -> [(id, 事件类型, 数据)] 与 latest() -> id。
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from utils import metrics
+
+KEY_PREFIX = "forum:events:"
+
+subscribers = metrics.gauge("forum_event_subscribers", "Open event stream subscriptions")
+events_delivered = metrics.counter(
+    "forum_events_delivered_total", "Events delivered to subscriptions"
+)
+
+
+def get_events_settings():
+    options = {
+        "BACKEND": "local",
+        "ALIAS": "default",
+        "POLL_INTERVAL": 1,
+        "HEARTBEAT": 15,
+        "MAX_DURATION": 300,
+        "BACKFILL_MAX": 500,
+        "MAX_PENDING": 1000,
+        "RETRY_MS": 3000,
+        "MAX_SYNC_STREAMS": 2,
+    }
+    options.update(getattr(settings, "EVENTS", {}))
+    return options
+
+
+class Subscription:
+    """
+    订阅者的事件队列，同步视图用 get，异步视图用 aget
+    cursor 为已交给订阅者的最大事件 id，之前的事件不会重复交付
+    """
+
+    def __init__(self, name, cursor, max_pending):
+        self.name = name
+        self.cursor = cursor
+        self.max_pending = max_pending
+        # 订阅者消费过慢、积压超过上限时丢弃积压，由 SSE 流通知客户端重新加载
+        self.overflowed = False
+        # 已取消订阅，重复取消时不再计数
+        self.closed = False
+        self._events = deque()
+        self._cond = threading.Condition()
+        self._loop = None
+        self._ready = None
+
+    def put(self, events):
+        with self._cond:
+            self._events.extend(events)
+            if len(self._events) > self.max_pending:
+                self._events.clear()
+                self.overflowed = True
+            self._cond.notify_all()
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._ready.set)
+
+    def _take(self):
+        events = [event for event in self._events if event[0] > self.cursor]
+        self._events.clear()
+        if events:
+            self.cursor = events[-1][0]
+        return events
+
+    def get(self, timeout):
+        """
+        :return: 新事件列表，超时返回空列表
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._events or self.overflowed, timeout)
+            return self._take()
+
+    async def aget(self, timeout):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._ready = asyncio.Event()
+        with self._cond:
+            if self._events or self.overflowed:
+                return self._take()
+            self._ready.clear()
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        with self._cond:
+            return self._take()
+
+
+class Channel:
+    def __init__(self, source, last_id):
+        self.source = source
+        self.last_id = last_id
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+
+class Hub:
+    def __init__(self):
+        self.channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, name, source, cursor=None):
+        """
+        订阅频道，频道在本进程内首次订阅时查询一次最新的事件 id
+        :param cursor: 订阅者已收到的最大事件 id，None 表示从最新的事件之后开始
+        """
+        with self._lock:
+            channel = self.channels.get(name)
+            if channel is None:
+                channel = self.channels[name] = Channel(source, source.latest())
+            if cursor is None:
+                cursor = channel.last_id
+            subscription = Subscription(name, cursor, get_events_settings()["MAX_PENDING"])
+            channel.subscriptions.add(subscription)
+        subscribers.inc()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription.closed:
+                return
+            subscription.closed = True
+            channel = self.channels.get(subscription.name)
+            if channel is not None:
+                channel.subscriptions.discard(subscription)
+                if not channel.subscriptions:
+                    del self.channels[subscription.name]
+        subscribers.dec()
+
+    def deliver(self, name):
+        """
+        查询频道的新事件并分发给订阅者，重复调用没有副作用
+        """
+        channel = self.channels.get(name)
+        if channel is None:
+            return
+        with channel.lock:
+            limit = get_events_settings()["BACKFILL_MAX"]
+            while True:
+                events = channel.source.load(channel.last_id, limit)
+                if not events:
+                    return
+                channel.last_id = events[-1][0]
+                for subscription in list(channel.subscriptions):
+                    subscription.put(events)
+                events_delivered.inc(len(events) * len(channel.subscriptions))
+                if len(events) < limit:
+                    return
+
+
+class LocalBackend:
+    def __init__(self, hub, options):
+        self.hub = hub
+
+    def publish(self, name):
+        self.hub.deliver(name)
+
+    def start(self):
+        pass
+
+
+class CacheBackend:
+    def __init__(self, hub, options):
+        self.hub = hub
+        self.cache = caches[options["ALIAS"]]
+        self.interval = options["POLL_INTERVAL"]
+        self.versions = {}
+        self._poller = None
+        self._lock = threading.Lock()
+
+    def publish(self, name):
+        key = KEY_PREFIX + name
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, 1, timeout=None)
+        self.hub.deliver(name)
+
+    def start(self):
+        if self._poller is None:
+            with self._lock:
+                if self._poller is None:
+                    self._poller = threading.Thread(
+                        target=self.poll, name="events-poller", daemon=True
+                    )
+                    self._poller.start()
+
+    def poll(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(e)
+            finally:
+                close_old_connections()
+
+    def poll_once(self):
+        names = list(self.hub.channels)
+        versions = self.cache.get_many([KEY_PREFIX + name for name in names])
+        for name in names:
+            version = versions.get(KEY_PREFIX + name)
+            if version is not None and version != self.versions.get(name):
+                self.versions[name] = version
+                self.hub.deliver(name)
+        for name in set(self.versions) - set(names):
+            del self.versions[name]
+
+
+BACKENDS = {
+    "local": LocalBackend,
+    "cache": CacheBackend,
+}
+
+_hub = None
+_backend = None
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    """
+    :return: (订阅中心, 后端)
+    """
+    global _hub, _backend
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                options = get_events_settings()
+                hub = Hub()
+                _backend = BACKENDS[options["BACKEND"]](hub, options)
+                _hub = hub
+    return _hub, _backend
+
+
+def subscribe(name, source, cursor=None):
+    hub, backend = get_hub()
+    backend.start()
+    return hub.subscribe(name, source, cursor)
+
+
+def unsubscribe(subscription):
+    get_hub()[0].unsubscribe(subscription)
+
+
+def publish(name):
+    """
+    通知频道有新事件，应在事件写入的事务提交之后调用
+    """
+    get_hub()[1].publish(name)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+按请求统计数据库查询
+
+QueryCountMiddleware 统计每个请求在全部数据库别名上执行的查询数与耗时：
+写入响应头 X-DB-Queries 与 Server-Timing（浏览器开发者工具的 Timing 面板中可见），
+并按接口（URL 名称与请求方法）累计到 /api/v1/metrics。
+
+每个连接建立时安装 execute_wrapper，请求的统计保存在 contextvars 中，
+异步视图在 sync_to_async 的线程中执行的查询同样计入。
+流式响应在返回响应头之后执行的查询、批量接口在线程池中执行的子请求不计入。
+"""
+
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from utils import metrics
+
+request_queries = metrics.summary(
+    "forum_request_db_queries", "Database queries executed per request"
+)
+request_db_seconds = metrics.summary(
+    "forum_request_db_seconds", "Time spent in database queries per request"
+)
+
+_stats = ContextVar("query_stats", default=None)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+def count_queries(execute, sql, params, many, context):
+    stats = _stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.duration += time.perf_counter() - start
+
+
+def install(connection):
+    """
+    为连接安装计数的 execute_wrapper，连接池与持久连接重新连接时不重复安装
+    """
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    install(connection)
+
+
+connection_created.connect(_on_connection_created, dispatch_uid="utils.query_count")
+
+
+class QueryCountMiddleware:
+    """
+    放在 MIDDLEWARE 的第一位，其他中间件（会话、认证）的查询也计入
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # 加载中间件之前已经建立的连接
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        token = _stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _stats.reset(token)
+        return self.report(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = _stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _stats.reset(token)
+        return self.report(request, response, stats)
+
+    def report(self, request, response, stats):
+        timing = f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+        if response.has_header("Server-Timing"):
+            timing = response["Server-Timing"] + ", " + timing
+        response["Server-Timing"] = timing
+        response["X-DB-Queries"] = str(stats.count)
+
+        # 未匹配的路径归为一类，标签的取值数量有限
+        match = request.resolver_match
+        labels = {
+            "endpoint": match.view_name if match else "unmatched",
+            "method": request.method,
+        }
+        request_queries.observe(stats.count, **labels)
+        request_db_seconds.observe(stats.duration, **labels)
+        return response
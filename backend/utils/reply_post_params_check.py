@@ -2,4 +2,10 @@
 
 
 def reply_post_params_check(content):
+    # replyId 可以是数字字符串，直接用作查询条件前需要能转换为整数
+    if "replyId" in content:
+        try:
+            int(content["replyId"])
+        except (TypeError, ValueError):
+            return "replyId", False
     return "ok", True
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+帖子列表与帖子详情的响应缓存
+
+缓存键由查询参数与内容版本号组成，任何写操作都会递增版本号，旧版本的条目随之失效，
+之后由 LRU 淘汰或 TTL 过期清除。后端可选进程内（local）或 Django 缓存框架（django）。
+"""
+
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from utils import metrics
+from utils.cache import LRUCache
+
+VERSION_KEY = "forum:content-version"
+
+cache_hits = metrics.counter("forum_response_cache_hits_total", "Response cache hits")
+cache_misses = metrics.counter("forum_response_cache_misses_total", "Response cache misses")
+
+
+class LocalBackend:
+    """
+    进程内后端，版本号只在本进程内有效，其他 worker 的写入依靠 TTL 过期
+    """
+
+    def __init__(self, options):
+        self.cache = LRUCache(options.get("MAX_ENTRIES", 1024), options.get("TTL", 30))
+        self.version = 1
+        self._lock = threading.Lock()
+
+    def get_version(self):
+        return self.version
+
+    def bump_version(self):
+        with self._lock:
+            self.version += 1
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value)
+
+    # 进程内缓存不涉及 IO，异步接口直接调用同步实现
+    async def aget_version(self):
+        return self.get_version()
+
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+
+class DjangoBackend:
+    """
+    Django 缓存框架后端，版本号保存在共享缓存中，多个 worker 之间一致
+    条目上限与淘汰策略由对应的 CACHES 配置决定
+    """
+
+    def __init__(self, options):
+        self.cache = caches[options.get("ALIAS", "default")]
+        self.ttl = options.get("TTL", 30)
+
+    def get_version(self):
+        version = self.cache.get(VERSION_KEY)
+        if version is None:
+            self.cache.add(VERSION_KEY, 1, timeout=None)
+            version = self.cache.get(VERSION_KEY, 1)
+        return version
+
+    def bump_version(self):
+        try:
+            self.cache.incr(VERSION_KEY)
+        except ValueError:
+            self.cache.add(VERSION_KEY, 2, timeout=None)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, timeout=self.ttl)
+
+    async def aget_version(self):
+        version = await self.cache.aget(VERSION_KEY)
+        if version is None:
+            await self.cache.aadd(VERSION_KEY, 1, timeout=None)
+            version = await self.cache.aget(VERSION_KEY, 1)
+        return version
+
+    async def aget(self, key):
+        return await self.cache.aget(key)
+
+    async def aset(self, key, value):
+        await self.cache.aset(key, value, timeout=self.ttl)
+
+
+BACKENDS = {
+    "local": LocalBackend,
+    "django": DjangoBackend,
+}
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def make_key(version, name, params):
+        return f"forum:response:{version}:{name}:" + ":".join(str(p) for p in params)
+
+    @staticmethod
+    def record(key, value):
+        name = key.split(":")[3]
+        if value is None:
+            cache_misses.inc(cache=name)
+        else:
+            cache_hits.inc(cache=name)
+        return value
+
+    def key(self, name, *params):
+        """
+        生成缓存键，需要在查询数据库之前生成，保证写入的数据不会比键中的版本号更旧
+        """
+        return self.make_key(self.backend.get_version(), name, params)
+
+    def get(self, key):
+        """
+        :return: 缓存的响应数据，未命中时返回 None
+        """
+        return self.record(key, self.backend.get(key))
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+
+    async def akey(self, name, *params):
+        return self.make_key(await self.backend.aget_version(), name, params)
+
+    async def aget(self, key):
+        return self.record(key, await self.backend.aget(key))
+
+    async def aset(self, key, value):
+        await self.backend.aset(key, value)
+
+    def bump_version(self):
+        self.backend.bump_version()
+
+
+_response_cache = None
+_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        with _lock:
+            if _response_cache is None:
+                options = getattr(settings, "RESPONSE_CACHE", {})
+                backend = BACKENDS[options.get("BACKEND", "local")](options)
+                _response_cache = ResponseCache(backend)
+    return _response_cache
+
+
+def bump_content_version():
+    """
+    内容发生变化后递增版本号
+    若处于事务中，提交后会再递增一次，避免事务提交前读到旧数据的请求把旧数据缓存到新版本下；
+    事务回滚时不会再递增，在事务中读取并缓存的调用方（批量接口的 atomic 模式）需要在回滚后递增
+    """
+    response_cache = get_response_cache()
+    response_cache.bump_version()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(response_cache.bump_version)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+jwt 注销
+
+注销的 jti 持久化在 RevokedToken 表中，每个进程维护一个布隆过滤器：
+不在过滤器中的 jti 一定没有注销，无需查询数据库；命中过滤器时再查询数据库确认。
+过滤器定期增量同步其他 worker 的注销记录（其他 worker 的注销最多延迟 SYNC_INTERVAL 秒生效），
+并定期删除过期记录后重建。fork 之后首次使用时也会重建。
+"""
+
+import datetime
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from user.models import RevokedToken
+from utils import metrics
+from utils.bloom import BloomFilter
+
+revocation_checks = metrics.counter(
+    "forum_token_revocation_checks_total", "Token revocation checks by the path that answered"
+)
+
+
+def get_revocation_settings():
+    options = {
+        "BLOOM_CAPACITY": 100000,
+        "ERROR_RATE": 0.001,
+        "SYNC_INTERVAL": 5,
+        "REBUILD_INTERVAL": 3600,
+    }
+    options.update(getattr(settings, "TOKEN_REVOCATION", {}))
+    return options
+
+
+def prune_revoked_tokens():
+    """
+    删除已过期的注销记录，过期的 jwt 本身已无法通过校验
+    :return: 删除的记录数量
+    """
+    return RevokedToken.objects.filter(expires__lt=timezone.now()).delete()[0]
+
+
+class RevocationList:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._pid = None
+        self._synced_at = None
+        self._synced = 0.0
+        self._rebuilt = 0.0
+
+    def rebuild(self, prune=True):
+        """
+        删除过期记录，并从数据库重建布隆过滤器，在 worker 启动时调用
+        """
+        with self._lock:
+            self._rebuild(prune)
+
+    def _rebuild(self, prune):
+        options = get_revocation_settings()
+        if prune:
+            prune_revoked_tokens()
+        synced_at = timezone.now()
+        jtis = list(RevokedToken.objects.values_list("jti", flat=True))
+        bloom = BloomFilter(max(options["BLOOM_CAPACITY"], len(jtis) * 2), options["ERROR_RATE"])
+        for jti in jtis:
+            bloom.add(jti)
+        self._filter = bloom
+        self._pid = os.getpid()
+        self._synced_at = synced_at
+        self._synced = self._rebuilt = time.monotonic()
+
+    def _sync(self):
+        """
+        增量加入上次同步之后的注销记录，时间窗口向前多取一个同步间隔，覆盖提交较晚的事务
+        """
+        options = get_revocation_settings()
+        synced_at = timezone.now()
+        since = self._synced_at - datetime.timedelta(seconds=options["SYNC_INTERVAL"])
+        for jti in RevokedToken.objects.filter(created__gte=since).values_list("jti", flat=True):
+            self._filter.add(jti)
+        self._synced_at = synced_at
+        self._synced = time.monotonic()
+
+    def _stale(self):
+        """
+        是否需要重建或同步，异步检查时只有需要访问数据库才切换到线程中执行 _refresh
+        """
+        if self._filter is None or self._pid != os.getpid():
+            return True
+        return time.monotonic() - self._synced >= get_revocation_settings()["SYNC_INTERVAL"]
+
+    def _refresh(self):
+        options = get_revocation_settings()
+        now = time.monotonic()
+        if self._filter is None or self._pid != os.getpid():
+            with self._lock:
+                if self._filter is None or self._pid != os.getpid():
+                    self._rebuild(prune=False)
+            return
+        if now - self._synced < options["SYNC_INTERVAL"]:
+            return
+        # 其他线程正在同步时直接使用当前的过滤器
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if now - self._rebuilt >= options["REBUILD_INTERVAL"] or (
+                self._filter.count > self._filter.capacity
+            ):
+                self._rebuild(prune=True)
+            else:
+                self._sync()
+        finally:
+            self._lock.release()
+
+    def is_revoked(self, jti):
+        if not jti:
+            return False
+        self._refresh()
+        if jti not in self._filter:
+            revocation_checks.inc(path="filter")
+            return False
+        revocation_checks.inc(path="database")
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    async def ais_revoked(self, jti):
+        if not jti:
+            return False
+        if self._stale():
+            await sync_to_async(self._refresh)()
+        if jti not in self._filter:
+            revocation_checks.inc(path="filter")
+            return False
+        revocation_checks.inc(path="database")
+        return await RevokedToken.objects.filter(jti=jti).aexists()
+
+    def revoke(self, jti, exp=None):
+        """
+        :param exp: jwt 的过期时间戳，缺省时按 JWT_EXPIRE_HOURS 计算
+        """
+        if exp is None:
+            expires = timezone.now() + datetime.timedelta(hours=int(settings.JWT_EXPIRE_HOURS))
+        else:
+            expires = datetime.datetime.fromtimestamp(exp, tz=datetime.timezone.utc)
+        RevokedToken.objects.get_or_create(jti=jti, defaults={"expires": expires})
+        self._refresh()
+        self._filter.add(jti)
+
+
+revocation_list = RevocationList()
+
+
+def is_revoked(jti):
+    return revocation_list.is_revoked(jti)
+
+
+async def ais_revoked(jti):
+    return await revocation_list.ais_revoked(jti)
+
+
+def revoke_token(jti, exp=None):
+    revocation_list.revoke(jti, exp)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite 数据库后端，在 Django 自带后端的基础上：
+
+连接建立时依次执行 OPTIONS["pragmas"] 中的 PRAGMA，例如开启 WAL、调整页缓存与 mmap
+事务使用 OPTIONS["transaction_mode"] 开始，IMMEDIATE 在事务开始时就获取写锁：
+默认的 DEFERRED 事务先读后写时才升级为写锁，两个这样的事务并发时 SQLite 无法等待，
+其中一个立即失败并报 database is locked，busy_timeout 对此不起作用
+
+IMMEDIATE 与 EXCLUSIVE 事务开始前先获取进程内的写锁，同一进程的写事务按顺序排队。
+SQLite 等待锁时睡眠一段递增的时间后重试，不保证先来先得，并发写入时个别事务会等待数秒。
+
+OPTIONS["pool"] 启用连接池，见 utils/pool.py，PRAGMA 只在建立连接时执行一次
+"""
+
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+from utils.pool import PooledDatabaseWrapperMixin
+
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+# 数据库文件 -> 进程内的写锁
+_write_locks = {}
+_write_locks_lock = threading.Lock()
+
+
+def get_write_lock(name):
+    with _write_locks_lock:
+        return _write_locks.setdefault(str(name), threading.Lock())
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = self.settings_dict["OPTIONS"]
+        self.pragmas = options.get("pragmas", {})
+        self.transaction_mode = options.get("transaction_mode")
+        if self.transaction_mode not in (None, *TRANSACTION_MODES):
+            raise ImproperlyConfigured(
+                "settings.DATABASES transaction_mode must be one of "
+                f"{', '.join(TRANSACTION_MODES)}, not {self.transaction_mode!r}"
+            )
+        self.write_lock = None
+        if self.transaction_mode in ("IMMEDIATE", "EXCLUSIVE"):
+            self.write_lock = get_write_lock(self.settings_dict["NAME"])
+        self.holds_write_lock = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("pragmas", None)
+        params.pop("transaction_mode", None)
+        return params
+
+    def new_connection(self, conn_params):
+        conn = super().new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+            return
+        if self.write_lock is not None:
+            # 超时后不再等待进程内的锁，由 SQLite 的 busy_timeout 继续等待或报错
+            timeout = self.pragmas.get("busy_timeout", 5000) / 1000
+            self.holds_write_lock = self.write_lock.acquire(timeout=timeout)
+        try:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
+        except Exception:
+            self.release_write_lock()
+            raise
+
+    def release_write_lock(self):
+        if self.holds_write_lock:
+            self.holds_write_lock = False
+            self.write_lock.release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self.release_write_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self.release_write_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self.release_write_lock()
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Server-Sent Events 响应
+
+流在 MAX_DURATION 秒后结束，释放同步 worker，客户端（EventSource）按 retry 自动重连，
+重连时带上 Last-Event-ID，从数据库补发错过的事件。空闲时每 HEARTBEAT 秒发送一行注释，
+保持代理连接并及时发现断开的客户端。
+
+同步（WSGI）视图的流在整个持续时间内占用一个请求线程，每个 worker 同时最多打开
+MAX_SYNC_STREAMS 个，超过时视图返回 503，其余线程留给普通请求；ASGI 部署的异步流不受限制。
+"""
+
+import json
+import threading
+import time
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from utils import metrics
+from utils.pubsub import get_events_settings, subscribe, unsubscribe
+
+sync_streams = metrics.gauge(
+    "forum_event_sync_streams", "Event streams holding a sync worker thread"
+)
+rejected_streams = metrics.counter(
+    "forum_event_streams_rejected_total", "Event streams rejected at MAX_SYNC_STREAMS"
+)
+
+# 占用同步流名额的订阅，以及已预留、尚未订阅的名额数
+_sync_subscriptions = set()
+_sync_reserved = 0
+_sync_lock = threading.Lock()
+
+# 积压过多或补发的事件超过上限时发送，客户端应重新获取完整数据
+RESET_EVENT = "reset"
+
+
+def format_event(event_id, event_type, data):
+    data = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+
+
+def last_event_id(request):
+    """
+    客户端已收到的最大事件 id，EventSource 重连时通过 Last-Event-ID 请求头发送，
+    不能设置请求头的客户端可以使用 lastEventId 查询参数
+    :return: int，首次连接时返回 None
+    :raise ValueError: 参数不合法
+    """
+    value = request.headers.get("Last-Event-ID") or request.GET.get("lastEventId")
+    if not value:
+        return None
+    value = int(value)
+    if value < 0:
+        raise ValueError(value)
+    return value
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    EventSource 的请求头为 Accept: text/event-stream，事件流本身不经过渲染器，
+    只有错误响应（例如 401）由它渲染为 JSON 文本
+    """
+
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data, cls=JSONEncoder, ensure_ascii=False).encode()
+
+
+def backfill(source, subscription, cursor):
+    """
+    补发 cursor 之后错过的事件，超过 BACKFILL_MAX 时只发送一个 reset 事件
+    需要在订阅之后调用，补发与订阅之间发布的事件由 Subscription 按 id 去重
+    :return: SSE 文本列表
+    """
+    if cursor is None:
+        return []
+    limit = get_events_settings()["BACKFILL_MAX"]
+    events = source.load(cursor, limit + 1)
+    if len(events) > limit:
+        subscription.cursor = source.latest()
+        return [format_event(subscription.cursor, RESET_EVENT, {})]
+    if events:
+        subscription.cursor = max(subscription.cursor, events[-1][0])
+    return [format_event(*event) for event in events]
+
+
+class TooManyStreams(Exception):
+    pass
+
+
+def _reserve_sync_stream():
+    global _sync_reserved
+    limit = get_events_settings()["MAX_SYNC_STREAMS"]
+    with _sync_lock:
+        if len(_sync_subscriptions) + _sync_reserved >= limit:
+            rejected_streams.inc()
+            raise TooManyStreams(limit)
+        _sync_reserved += 1
+
+
+def _claim_sync_stream(subscription):
+    """
+    预留的名额交给订阅，subscription 为 None 表示订阅失败，归还名额
+    """
+    global _sync_reserved
+    with _sync_lock:
+        _sync_reserved -= 1
+        if subscription is not None:
+            _sync_subscriptions.add(subscription)
+        sync_streams.set(len(_sync_subscriptions))
+
+
+def open_subscription(name, source, cursor, sync=False):
+    """
+    订阅频道并补发错过的事件
+    :param sync: 流由同步视图发送，占用一个 MAX_SYNC_STREAMS 名额，close_subscription 时归还
+    :return: (订阅, 补发的 SSE 文本列表)
+    :raise TooManyStreams: 同步流的名额已满
+    """
+    if sync:
+        _reserve_sync_stream()
+    try:
+        subscription = subscribe(name, source, cursor)
+    except Exception:
+        if sync:
+            _claim_sync_stream(None)
+        raise
+    if sync:
+        _claim_sync_stream(subscription)
+    try:
+        return subscription, backfill(source, subscription, cursor)
+    except Exception:
+        close_subscription(subscription)
+        raise
+
+
+def close_subscription(subscription):
+    """
+    取消订阅并归还同步流的名额，可以重复调用
+    """
+    unsubscribe(subscription)
+    with _sync_lock:
+        if subscription in _sync_subscriptions:
+            _sync_subscriptions.discard(subscription)
+            sync_streams.set(len(_sync_subscriptions))
+
+
+def _chunks(subscription, events):
+    if subscription.overflowed:
+        subscription.overflowed = False
+        return format_event(subscription.cursor, RESET_EVENT, {})
+    if not events:
+        return ": ping\n\n"
+    return "".join(format_event(*event) for event in events)
+
+
+def event_stream(subscription, initial):
+    options = get_events_settings()
+    deadline = time.monotonic() + options["MAX_DURATION"]
+    try:
+        yield f"retry: {options['RETRY_MS']}\n\n" + "".join(initial)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events = subscription.get(min(options["HEARTBEAT"], remaining))
+            yield _chunks(subscription, events)
+    finally:
+        close_subscription(subscription)
+
+
+async def aevent_stream(subscription, initial):
+    options = get_events_settings()
+    deadline = time.monotonic() + options["MAX_DURATION"]
+    try:
+        yield f"retry: {options['RETRY_MS']}\n\n" + "".join(initial)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events = await subscription.aget(min(options["HEARTBEAT"], remaining))
+            yield _chunks(subscription, events)
+    finally:
+        close_subscription(subscription)
+
+
+class EventStreamResponse(StreamingHttpResponse):
+    """
+    响应关闭时取消订阅：流没有开始就被丢弃（客户端已断开、批量接口拒绝流式响应）时，
+    生成器的 finally 不会执行
+    """
+
+    def __init__(self, stream, subscription):
+        super().__init__(stream, content_type="text/event-stream")
+        self.subscription = subscription
+        self["Cache-Control"] = "no-cache"
+        # 关闭 nginx 的响应缓冲
+        self["X-Accel-Buffering"] = "no"
+
+    def release(self):
+        """
+        取消订阅并归还同步流的名额，可以重复调用
+        """
+        close_subscription(self.subscription)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.release()
+
+
+def sse_response(stream, subscription):
+    return EventStreamResponse(stream, subscription)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+登录与注册的限流
+
+每次登录、注册都要计算 scrypt，撞库时大量请求会耗尽 CPU。限流按客户端 IP 与用户名计数，
+在计算哈希之前拒绝超限的请求。
+
+local：进程内令牌桶，容量为周期内的次数，按速率匀速补充
+django：Django 缓存框架上的滑动窗口计数（用相邻两个固定窗口近似），多个 worker 共享
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from utils import metrics
+from utils.cache import LRUCache
+
+KEY_PREFIX = "forum:throttle:"
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+throttled_requests = metrics.counter(
+    "forum_throttled_requests_total", "Requests rejected by the login throttle"
+)
+
+
+def parse_rate(rate):
+    """
+    :param rate: 形如 "10/m"，单位为 s、m、h、d
+    :return: (次数, 周期秒数)
+    """
+    count, period = rate.split("/")
+    return int(count), PERIODS[period[0]]
+
+
+class LocalBackend:
+    def __init__(self, options):
+        self.buckets = LRUCache(options.get("MAX_ENTRIES", 100000), ttl=3600)
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, period):
+        now = time.monotonic()
+        rate = limit / period
+        with self._lock:
+            tokens, updated = self.buckets.get(key, (limit, now))
+            tokens = min(limit, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            # 一个周期后桶已补满，与不存在等价
+            self.buckets.set(key, (tokens, now), ttl=period)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+class DjangoBackend:
+    def __init__(self, options):
+        self.cache = caches[options.get("ALIAS", "default")]
+
+    def hit(self, key, limit, period):
+        now = time.time()
+        window = int(now // period)
+        current_key = f"{key}:{window}"
+        self.cache.add(current_key, 0, timeout=period * 2)
+        try:
+            count = self.cache.incr(current_key)
+        except ValueError:
+            self.cache.set(current_key, 1, timeout=period * 2)
+            count = 1
+        previous = self.cache.get(f"{key}:{window - 1}", 0)
+
+        elapsed = now - window * period
+        estimated = previous * (period - elapsed) / period + count
+        allowed = estimated <= limit
+        return allowed, 0 if allowed else period - elapsed
+
+
+BACKENDS = {
+    "local": LocalBackend,
+    "django": DjangoBackend,
+}
+
+_backend = None
+_lock = threading.Lock()
+
+
+def get_throttle_settings():
+    options = {
+        "ENABLED": True,
+        "BACKEND": "local",
+        "RATES": {"login_ip": "30/m", "login_username": "10/m", "register_ip": "10/h"},
+    }
+    options.update(getattr(settings, "LOGIN_THROTTLE", {}))
+    return options
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                options = get_throttle_settings()
+                _backend = BACKENDS[options["BACKEND"]](options)
+    return _backend
+
+
+def get_client_ip(request):
+    """
+    客户端 IP，部署在反向代理后时取 X-Forwarded-For 中由代理追加的地址
+    """
+    num_proxies = getattr(settings, "NUM_PROXIES", 0)
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    if num_proxies and forwarded:
+        addresses = [address.strip() for address in forwarded.split(",")]
+        return addresses[-min(num_proxies, len(addresses))]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def throttle(**idents):
+    """
+    按各维度计数，任一维度超限即拒绝
+    :param idents: 维度名与取值，例如 login_ip="1.2.3.4"，维度的速率见 LOGIN_THROTTLE["RATES"]
+    :return: (是否允许, 建议的重试秒数)
+    """
+    options = get_throttle_settings()
+    if not options["ENABLED"]:
+        return True, 0
+
+    for scope, ident in idents.items():
+        if ident is None or scope not in options["RATES"]:
+            continue
+        limit, period = parse_rate(options["RATES"][scope])
+        key = KEY_PREFIX + hashlib.sha1(f"{scope}:{ident}".encode()).hexdigest()
+        allowed, retry_after = get_backend().hit(key, limit, period)
+        if not allowed:
+            throttled_requests.inc(scope=scope)
+            return False, max(1, math.ceil(retry_after))
+    return True, 0
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+已登录用户的缓存
+
+jwt_authentication 按用户 id 缓存 User 对象，省去每个请求一次的用户查询。
+用户保存或删除后由信号使缓存失效；后端可选进程内（local）或 Django 缓存框架（django），
+local 后端只能使本进程的缓存失效，其他 worker 依靠 TTL 过期。
+"""
+
+import copy
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from user.controllers import aget_user, get_user
+from utils import metrics
+from utils.cache import LRUCache
+
+KEY_PREFIX = "forum:auth-user:"
+
+cache_hits = metrics.counter("forum_auth_user_cache_hits_total", "Authenticated user cache hits")
+cache_misses = metrics.counter(
+    "forum_auth_user_cache_misses_total", "Authenticated user cache misses"
+)
+
+
+class LocalBackend:
+    def __init__(self, options):
+        self.cache = LRUCache(options.get("MAX_ENTRIES", 4096), options.get("TTL", 60))
+
+    def get(self, key):
+        # 返回副本，视图修改 request.user 不会影响其他请求
+        return copy.copy(self.cache.get(key))
+
+    def set(self, key, value):
+        self.cache.set(key, value)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    # 进程内缓存不涉及 IO，异步接口直接调用同步实现
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+
+class DjangoBackend:
+    def __init__(self, options):
+        self.cache = caches[options.get("ALIAS", "default")]
+        self.ttl = options.get("TTL", 60)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, timeout=self.ttl)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    async def aget(self, key):
+        return await self.cache.aget(key)
+
+    async def aset(self, key, value):
+        await self.cache.aset(key, value, timeout=self.ttl)
+
+
+BACKENDS = {
+    "local": LocalBackend,
+    "django": DjangoBackend,
+}
+
+_backend = None
+_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                options = getattr(settings, "AUTH_USER_CACHE", {})
+                _backend = BACKENDS[options.get("BACKEND", "local")](options)
+    return _backend
+
+
+def get_authenticated_user(user_id):
+    """
+    获取已登录的用户，优先读取缓存
+    :return: User，用户不存在时返回 None
+    """
+    key = KEY_PREFIX + str(user_id)
+    user = get_backend().get(key)
+    if user is not None:
+        cache_hits.inc()
+        return user
+
+    cache_misses.inc()
+    user, result = get_user(user_id)
+    if not result:
+        return None
+    get_backend().set(key, user)
+    return user
+
+
+async def aget_authenticated_user(user_id):
+    """
+    get_authenticated_user 的异步版本
+    """
+    key = KEY_PREFIX + str(user_id)
+    user = await get_backend().aget(key)
+    if user is not None:
+        cache_hits.inc()
+        return user
+
+    cache_misses.inc()
+    user, result = await aget_user(user_id)
+    if not result:
+        return None
+    await get_backend().aset(key, user)
+    return user
+
+
+def invalidate_user(user_id):
+    """
+    用户信息变化后删除缓存
+    若处于事务中，提交后会再删除一次，避免提交前读到旧数据的请求把旧数据写回缓存
+    """
+    key = KEY_PREFIX + str(user_id)
+    get_backend().delete(key)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: get_backend().delete(key))